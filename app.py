@@ -5,6 +5,9 @@ import streamlit as st
 import matplotlib.pyplot as plt
 import sys
 import os
+import time
+import threading
+from collections import OrderedDict
 
 # Add the 'python' subdirectory to the system path
 # This allows the app to import your backend modules
@@ -12,7 +15,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'python'))
 
 # Now we can import the modified main.py
 try:
-    from main import run_analysis
+    from main import run_analysis, analysis_cache_key
+    from booking_controls import CONTROL_POLICIES
 except ImportError as e:
     st.error(f"Error importing backend: {e}\n"
              "Make sure app.py is in the 'OR' folder, "
@@ -29,6 +33,71 @@ st.set_page_config(
 st.title("🚂 ORBIT")
 st.markdown("Monte Carlo Simulation & Optimization Engine")
 
+# --- Result Cache ---
+# Shared by every session of this server: a scenario (configuration +
+# seed + run settings) that anyone has already run is shown instantly.
+RESULT_CACHE_SIZE = 32
+CHART_REFRESH_SECONDS = 0.5 # Minimum time between live chart redraws
+
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide {cache key: results} store (least recently used evicted)."""
+    return {'results': OrderedDict(), 'lock': threading.Lock()}
+
+
+def cache_lookup(key):
+    cache = get_result_cache()
+    with cache['lock']:
+        if key in cache['results']:
+            cache['results'].move_to_end(key)
+            return cache['results'][key]
+    return None
+
+
+def cache_store(key, results):
+    cache = get_result_cache()
+    with cache['lock']:
+        cache['results'][key] = results
+        while len(cache['results']) > RESULT_CACHE_SIZE:
+            cache['results'].popitem(last=False)
+
+
+def plot_histogram(histogram, n_sims, baseline_revenue=None, mean_revenue=None):
+    """Revenue histogram figure from pre-aggregated bins."""
+    fig, ax = plt.subplots(figsize=(8, 4.8)) 
+    # Plot the pre-binned histogram (no per-run revenue list is kept)
+    ax.hist(histogram['edges'][:-1], bins=histogram['edges'], weights=histogram['counts'],
+            edgecolor='black', alpha=0.7)
+    
+    if baseline_revenue is not None:
+        ax.axvline(baseline_revenue, color='red', linestyle='--', linewidth=2, 
+                   label=f'Baseline (₹{baseline_revenue:,.0f})')
+    if mean_revenue is not None:
+        ax.axvline(mean_revenue, color='green', linestyle='-', linewidth=2, 
+                   label=f'Mean (₹{mean_revenue:,.0f})')
+    
+    ax.set_title(f'Distribution of Revenue over {n_sims} Simulations')
+    ax.set_xlabel('Total Revenue (₹)')
+    ax.set_ylabel('Frequency')
+    if baseline_revenue is not None or mean_revenue is not None:
+        ax.legend()
+    return fig
+
+
+# --- Run Settings ---
+with st.sidebar:
+    st.header("Run Settings")
+    n_simulations = st.number_input("Monte Carlo runs", min_value=2, max_value=100_000, value=100, step=100)
+    seed = st.number_input("Random seed", min_value=0, value=42, step=1,
+                           help="Same seed and settings give identical results, served from the cache.")
+    control_policy = st.selectbox("Booking control", CONTROL_POLICIES)
+    n_workers = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1, value=1,
+                                help="Does not change the results, only how fast they arrive.")
+
+run_args = {'n_simulations': int(n_simulations), 'seed': int(seed), 'control_policy': control_policy}
+cache_key = analysis_cache_key(**run_args)
+
 # --- Initialize Session State ---
 if 'results' not in st.session_state:
     st.session_state.results = None
@@ -39,31 +108,57 @@ if 'running' not in st.session_state:
 if st.button("🚀 Run Full Monte Carlo Simulation", 
              disabled=st.session_state.running):
     
-    st.session_state.running = True
     st.session_state.results = None
+    final_results = cache_lookup(cache_key)
     
-    status_text = st.empty()
-    progress_bar = st.progress(0)
-    
-    final_results = None
-    
-    with st.spinner("Initializing Simulation... This may take a minute."):
+    if final_results is not None:
+        st.success("✅ Loaded cached results for this scenario.")
+    else:
+        st.session_state.running = True
+        status_text = st.empty()
+        progress_bar = st.progress(0)
+        live_metrics = st.empty()
+        live_chart = st.empty()
+        last_draw = 0.0
         
-        n_sims = 1 
-        for i, status in enumerate(run_analysis()):
-            
-            if isinstance(status, dict):
-                final_results = status
-                n_sims = final_results.get('n_simulations', 100)
-                break
+        # Reset even on error or a Streamlit rerun, or the button stays disabled
+        try:
+            with st.spinner("Initializing Simulation... This may take a minute."):
             
-            status_text.text(status)
-            progress = (i + 1) / (3 + (100 // 10)) 
-            progress_bar.progress(min(1.0, progress))
+                for status in run_analysis(n_workers=int(n_workers), **run_args):
+                
+                    if isinstance(status, dict):
+                        final_results = status
+                        break
+                
+                    status_text.text(status)
+                    completed = getattr(status, 'completed', None)
+                    if completed is None:
+                        continue
+                    progress_bar.progress(min(1.0, completed / status.total))
+                
+                    # --- Live partial results (throttled; the last batch always draws) ---
+                    now = time.perf_counter()
+                    if now - last_draw < CHART_REFRESH_SECONDS and completed < status.total:
+                        continue
+                    last_draw = now
+                    with live_metrics.container():
+                        m1, m2, m3 = st.columns(3)
+                        m1.metric("Runs completed", f"{completed:,} / {status.total:,}")
+                        m2.metric("Mean Revenue (so far)", f"₹{status.mean:,.0f}")
+                        m3.metric("95% CI Half-Width", f"±₹{status.ci_half_width:,.0f}")
+                    fig = plot_histogram(status.stats.histogram(), completed, mean_revenue=status.mean)
+                    live_chart.pyplot(fig)
+                    plt.close(fig)
+        finally:
+            st.session_state.running = False
 
-    st.session_state.running = False
-    progress_bar.progress(1.0)
-    status_text.success("✅ Analysis Complete!")
+        progress_bar.progress(1.0)
+        live_metrics.empty()
+        live_chart.empty()
+        status_text.success("✅ Analysis Complete!")
+        cache_store(cache_key, final_results)
+    
     st.session_state.results = final_results
 
 # --- Display Results ---
@@ -106,24 +201,22 @@ if st.session_state.results:
             st.metric("Max Revenue (Best Case)", 
                       f"₹{results['max_revenue']:,.2f}")
 
+        with st.container(border=True):
+            st.metric("P5 / P50 / P95 Revenue",
+                      f"₹{results['p5_revenue']:,.0f} / ₹{results['p50_revenue']:,.0f} / ₹{results['p95_revenue']:,.0f}")
+
+            st.metric("CVaR 5%",
+                      f"₹{results['cvar_5_revenue']:,.2f}",
+                      help="Average revenue of the worst 5% of runs.")
+
     with col2:
         # --- 2. Revenue Distribution Chart (In the right column) ---
         st.subheader("Revenue Distribution (Histogram)")
         
-        fig, ax = plt.subplots(figsize=(8, 4.8)) 
-        ax.hist(results['all_revenues'], bins=30, edgecolor='black', alpha=0.7)
-        
-        ax.axvline(results['baseline_revenue'], color='red', linestyle='--', linewidth=2, 
-                    label=f'Baseline (₹{results["baseline_revenue"]:,.0f})')
-        ax.axvline(results['mean_revenue'], color='green', linestyle='-', linewidth=2, 
-                    label=f'Mean (₹{results["mean_revenue"]:,.0f})')
-        
-        ax.set_title(f'Distribution of Revenue over {n_sims} Simulations')
-        ax.set_xlabel('Total Revenue (₹)')
-        ax.set_ylabel('Frequency')
-        ax.legend()
-        
+        fig = plot_histogram(results['histogram'], n_sims,
+                             results['baseline_revenue'], results['mean_revenue'])
         st.pyplot(fig)
+        plt.close(fig)
     
     st.markdown("---")
     
@@ -2,23 +2,218 @@
 # This module solves the "Master" LP (between quotas)
 # and the "Inner" LP (between buckets).
 
-import pulp # Function to solve the LLP problems
+import numpy as np
+import event_log
+import instrumentation
+# PuLP (used to solve the LP problems with CBC) is imported lazily in the
+# CBC paths below, so the default 'fast' solver never pays for it.
+
+# --- Solver Selection ---
+# 'fast'       : Exact in-process solver (greedy fractional knapsack). Default.
+# 'cbc'        : Build the PuLP model and solve it with CBC (subprocess).
+# 'crosscheck' : Run both and assert that they give the same allocation.
+# 'persistent' : Reuse one warm-started model per structure (allocation_model).
+# The fast path falls back to CBC for constraint sets it cannot handle.
+ALLOCATION_SOLVER = 'fast'
+
+# --- Policy Constraints ---
+# Minimum seats per quota, per travel class, that the Master LP must
+# protect even if it is not revenue-optimal.
+POLICY_MINIMUMS = {
+    '3AC': {'LD': 2},
+}
+
+
+# ===================================================================
+# --- FAST IN-PROCESS SOLVER ---
+@instrumentation.timed('lp.solve', counter='lp_solves')
+def _solve_fractional_knapsack(rates: list,
+                               upper_bounds: list,
+                               capacity: float,
+                               minimums: list = None):
+    """
+    Exactly solves  max sum(r_i * x_i)
+                    s.t. sum(x_i) <= capacity,  min_i <= x_i <= ub_i
+
+    Both the Master and the Inner LP have this shape, so the optimum is
+    found by honouring the minimums first and then filling the remaining
+    capacity in order of revenue per seat.
+
+    Returns:
+        A list of allocations, or None if the fast path cannot handle
+        this constraint set (negative bounds, infeasible minimums).
+        The caller then falls back to CBC.
+    """
+    n = len(rates)
+    if minimums is None:
+        minimums = [0] * n
+
+    if capacity < 0 or any(ub < 0 for ub in upper_bounds):
+        return None
+    if any(m > ub for m, ub in zip(minimums, upper_bounds)) or sum(minimums) > capacity:
+        return None
+
+    allocation = list(minimums)
+    remaining = capacity - sum(minimums)
+
+    # Highest revenue per seat first (stable on ties, like the LP order)
+    order = sorted(range(n), key=lambda i: -rates[i])
+    for i in order:
+        if remaining <= 0 or rates[i] <= 0:
+            break
+        take = min(upper_bounds[i] - allocation[i], remaining)
+        allocation[i] += take
+        remaining -= take
+
+    return allocation
+
+
+def solve_knapsack_batch(rates: np.ndarray,
+                         upper_bounds: np.ndarray,
+                         capacity,
+                         minimums: np.ndarray = None) -> np.ndarray:
+    """
+    Vectorized _solve_fractional_knapsack() for many independent
+    problems at once (one row per scenario).
+
+    Args:
+        rates: (n_problems, n_vars) revenue per seat.
+        upper_bounds: (n_problems, n_vars) demand bounds.
+        capacity: Scalar or (n_problems,) capacity per problem.
+        minimums: (n_vars,) or (n_problems, n_vars) policy minimums.
+
+    Unlike the LP, a minimum larger than the demand bound is clipped to
+    the demand instead of making the problem infeasible, so that one
+    unlucky scenario cannot abort a whole batch.
+
+    Returns:
+        (n_problems, n_vars) allocations.
+    """
+    rates = np.asarray(rates, dtype=float)
+    upper_bounds = np.maximum(np.asarray(upper_bounds, dtype=float), 0.0)
+    n_problems, n_vars = upper_bounds.shape
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=float), (n_problems,))
+
+    if minimums is None:
+        minimums = np.zeros((n_problems, n_vars))
+    minimums = np.minimum(np.broadcast_to(np.asarray(minimums, dtype=float), (n_problems, n_vars)),
+                          upper_bounds)
+
+    remaining = np.maximum(capacity - minimums.sum(axis=1), 0.0)
+    headroom = np.where(rates > 0, upper_bounds - minimums, 0.0)
+
+    # Fill in order of revenue per seat: each variable gets whatever
+    # capacity is left after all better-paying variables are full.
+    order = np.argsort(-rates, axis=1, kind='stable')
+    sorted_headroom = np.take_along_axis(headroom, order, axis=1)
+    filled_before = np.cumsum(sorted_headroom, axis=1) - sorted_headroom
+    sorted_take = np.clip(remaining[:, None] - filled_before, 0.0, sorted_headroom)
+
+    take = np.zeros_like(headroom)
+    np.put_along_axis(take, order, sorted_take, axis=1)
+    return minimums + take
+
+
+def _assert_same_allocation(fast_result: dict, cbc_result: dict, rates: dict, label: str):
+    """
+    (Cross-check mode) Checks that the fast path and CBC agree. Raises
+    RuntimeError rather than asserting, so the check survives python -O.
+
+    If two variables share the same revenue per seat the LP has
+    alternative optima, so only the objective value is compared.
+    """
+    fast_obj = sum(rates[k] * v for k, v in fast_result.items())
+    cbc_obj = sum(rates[k] * cbc_result.get(k, 0) for k in fast_result)
+    if abs(fast_obj - cbc_obj) > 1e-6 * max(1.0, abs(cbc_obj)):
+        raise RuntimeError(f"{label}: fast objective {fast_obj} != CBC objective {cbc_obj}")
+
+    has_ties = len(set(rates.values())) < len(rates)
+    if not has_ties and fast_result != cbc_result:
+        raise RuntimeError(f"{label}: fast allocation {fast_result} != CBC allocation {cbc_result}")
+
+# ===================================================================
 
 # ===================================================================
 # --- MASTER ALLOCATION LP BETWEEN QUOTAS ---
+@instrumentation.timed('lp.master')
 def partition_capacity_by_quota(quota_forecasts: dict, 
                                 total_capacity: int,
                                 tc: str,
-                                quiet_mode: bool = False) -> dict: # <-- (NEW) Added quiet_mode
+                                quiet_mode: bool = False, # <-- (NEW) Added quiet_mode
+                                solver: str = None,
+                                policy_minimums: dict = None) -> dict:
     """
     Solves the "Master Allocation" problem.
     
     Decides how many seats to protect for each quota based on
     its total demand and average revenue per seat.
+
+    Args:
+        solver: 'fast', 'cbc', 'crosscheck' or 'persistent'.
+                Defaults to ALLOCATION_SOLVER.
+        policy_minimums: {quota: min_seats} for this class.
+                         Defaults to POLICY_MINIMUMS[tc].
     """
+    solver = solver or ALLOCATION_SOLVER
+    if policy_minimums is None:
+        policy_minimums = POLICY_MINIMUMS.get(tc, {})
+
     if not quiet_mode: 
-        print(f"--- Solving Master LP for {tc} to partition {total_capacity} seats ---")
+        event_log.info('lp', "--- Solving Master LP for {} to partition {} seats ---", tc, total_capacity, tc=tc)
+
+    q_codes = list(quota_forecasts.keys())
+    # Only apply minimums for quotas that are actually in this problem
+    policy_minimums = {q: m for q, m in policy_minimums.items() if q in q_codes}
+    if policy_minimums and not quiet_mode:
+        for q, min_seats in policy_minimums.items():
+            event_log.info('lp', "... Applying '{}' Policy Constraint for {} (min {} seats)", q, tc, min_seats,
+                           tc=tc, quota=q)
+
+    result = None
+    if solver == 'persistent':
+        from allocation_model import get_master_model
+        model = get_master_model(tc, q_codes, policy_minimums)
+        instrumentation.count('lp_solves')
+        with instrumentation.stage('lp.solve'):
+            result = model.solve_master(quota_forecasts, total_capacity)
+        if not quiet_mode:
+            event_log.info('lp', "Master Allocation complete. Result: {}", result, tc=tc)
+        return result
+
+    if solver in ('fast', 'crosscheck'):
+        allocation = _solve_fractional_knapsack(
+            [quota_forecasts[q]['avg_revenue_per_seat'] for q in q_codes],
+            [quota_forecasts[q]['total_demand'] for q in q_codes],
+            total_capacity,
+            [policy_minimums.get(q, 0) for q in q_codes]
+        )
+        if allocation is not None:
+            result = {f"{q}_Allocation": int(allocation[i]) for i, q in enumerate(q_codes)}
+        elif not quiet_mode:
+            event_log.info('lp', "... Fast path cannot handle Master LP for {}, falling back to CBC", tc, tc=tc)
+
+    if result is None or solver == 'crosscheck':
+        cbc_result = _solve_master_lp_cbc(
+            quota_forecasts, total_capacity, tc, policy_minimums, quiet_mode
+        )
+        if result is not None:
+            rates = {f"{q}_Allocation": quota_forecasts[q]['avg_revenue_per_seat'] for q in q_codes}
+            _assert_same_allocation(result, cbc_result, rates, f"Master LP {tc}")
+        result = cbc_result
     
+    if not quiet_mode: 
+        event_log.info('lp', "Master Allocation complete. Result: {}", result, tc=tc)
+    return result
+
+
+@instrumentation.timed('lp.cbc')
+def _solve_master_lp_cbc(quota_forecasts: dict,
+                         total_capacity: int,
+                         tc: str,
+                         policy_minimums: dict,
+                         quiet_mode: bool = False) -> dict:
+    """(Internal) Builds the Master LP with PuLP and solves it with CBC."""
+    import pulp
     prob = pulp.LpProblem(f"Master_Quota_Allocation_{tc}", pulp.LpMaximize)
     
     q_codes = list(quota_forecasts.keys())
@@ -56,21 +251,22 @@ def partition_capacity_by_quota(quota_forecasts: dict,
     # --- 3b. POLICY CONSTRAINT ---
     # Enforce a minimum allocation for social/policy quotas,
     # even if it's not revenue-optimal.
-    if 'LD' in q_codes and tc == '3AC':
-        if not quiet_mode: 
-            print("... Applying 'LD' Policy Constraint for 3AC (min 2 seats)")
-        prob += x_vars['LD'] >= 2, "Policy_Constraint_LD_3AC_Min"
+    for q, min_seats in policy_minimums.items():
+        prob += x_vars[q] >= min_seats, f"Policy_Constraint_{q}_{tc}_Min"
 
 
 
     # --- 4. Solve the LP ---
     # Suppress solver console output
-    prob.solve(pulp.PULP_CBC_CMD(msg=False))
+    instrumentation.count('lp_solves')
+    with instrumentation.stage('lp.cbc_solve'):
+        prob.solve(pulp.PULP_CBC_CMD(msg=False))
 
     if pulp.LpStatus[prob.status] != 'Optimal':
         # Don't raise an exception, just warn, as it might be an "empty problem"
         if not quiet_mode: 
-            print(f"WARNING: Master Allocation for {tc} LP status: {pulp.LpStatus[prob.status]}")
+            event_log.warning('lp', "WARNING: Master Allocation for {} LP status: {}",
+                              tc, pulp.LpStatus[prob.status], tc=tc)
         if pulp.LpStatus[prob.status] == 'Infeasible':
              raise Exception(f"Master Allocation LP for {tc} is INFEASIBLE.")
 
@@ -79,38 +275,91 @@ def partition_capacity_by_quota(quota_forecasts: dict,
     result = {}
     for q in q_codes:
         result[f"{q}_Allocation"] = int(x_vars[q].varValue)
-    
-    if not quiet_mode: 
-        print(f"Master Allocation complete. Result: {result}")
     return result
 
 # ===================================================================
 
 # ===================================================================
 # --- INNER ALLOCATION LP BETWEEN BUCKETS OF A QUOTA ---
+@instrumentation.timed('lp.inner')
 def partition_quota_into_buckets(independent_demands: list,
                                  prices: list,
                                  quota_allocation: int,
                                  q_code: str,
-                                 quiet_mode: bool = False) -> dict: # <-- (NEW) Added quiet_mode
+                                 quiet_mode: bool = False, # <-- (NEW) Added quiet_mode
+                                 solver: str = None) -> dict:
     """
     Solves the "Inner Allocation" problem for a single FLEXI quota.
     
     Takes the total seats allocated to a quota (e.g., 84 for GN) and
     partitions them optimally among its own price buckets.
+
+    Args:
+        solver: 'fast', 'cbc', 'crosscheck' or 'persistent'.
+                Defaults to ALLOCATION_SOLVER.
     """
+    solver = solver or ALLOCATION_SOLVER
+
     # (Benign) If total demand is <= allocation, no LP is needed.
     if sum(independent_demands) <= quota_allocation:
         if not quiet_mode: 
-            print(f"--- Skipping Inner LP for {q_code} (Demand <= Allocation) ---")
+            event_log.info('lp', "--- Skipping Inner LP for {} (Demand <= Allocation) ---", q_code, quota=q_code)
         result = {}
         for i in range(len(independent_demands)):
              result[f"{q_code}_Bucket_{i}_Allocation"] = independent_demands[i]
         return result
 
     if not quiet_mode: 
-        print(f"--- Solving Inner LP for {q_code} to partition {quota_allocation} seats ---")
-    
+        event_log.info('lp', "--- Solving Inner LP for {} to partition {} seats ---", q_code, quota_allocation,
+                       quota=q_code)
+
+    result = None
+    if solver == 'persistent':
+        from allocation_model import get_inner_model
+        model = get_inner_model(q_code, prices)
+        instrumentation.count('lp_solves')
+        with instrumentation.stage('lp.solve'):
+            result = model.solve_inner(independent_demands, quota_allocation)
+        if result and not quiet_mode:
+            event_log.info('lp', "Inner Allocation complete. Result: {}", result, quota=q_code)
+        return result
+
+    if solver in ('fast', 'crosscheck'):
+        allocation = _solve_fractional_knapsack(prices, independent_demands, quota_allocation)
+        if allocation is not None:
+            result = {
+                f"{q_code}_Bucket_{i}_Allocation": int(allocation[i])
+                for i in range(len(independent_demands))
+            }
+        elif not quiet_mode:
+            event_log.info('lp', "... Fast path cannot handle Inner LP for {}, falling back to CBC", q_code,
+                           quota=q_code)
+
+    if result is None or solver == 'crosscheck':
+        cbc_result = _solve_inner_lp_cbc(
+            independent_demands, prices, quota_allocation, q_code, quiet_mode
+        )
+        if result is not None:
+            rates = {
+                f"{q_code}_Bucket_{i}_Allocation": prices[i]
+                for i in range(len(independent_demands))
+            }
+            _assert_same_allocation(result, cbc_result, rates, f"Inner LP {q_code}")
+        result = cbc_result
+
+    if result and not quiet_mode: 
+        event_log.info('lp', "Inner Allocation complete. Result: {}", result, quota=q_code)
+    return result
+
+
+@instrumentation.timed('lp.cbc')
+def _solve_inner_lp_cbc(independent_demands: list,
+                        prices: list,
+                        quota_allocation: int,
+                        q_code: str,
+                        quiet_mode: bool = False) -> dict:
+    """(Internal) Builds the Inner LP with PuLP and solves it with CBC."""
+    import pulp
     num_buckets = len(independent_demands)
     prob = pulp.LpProblem(f"Inner_Allocation_{q_code}", pulp.LpMaximize)
     
@@ -142,10 +391,12 @@ def partition_quota_into_buckets(independent_demands: list,
         )
     
     # --- 4. Solve the LP ---
-    prob.solve(pulp.PULP_CBC_CMD(msg=False)) # Suppress solver console output
+    instrumentation.count('lp_solves')
+    with instrumentation.stage('lp.cbc_solve'):
+        prob.solve(pulp.PULP_CBC_CMD(msg=False)) # Suppress solver console output
     if pulp.LpStatus[prob.status] != 'Optimal':
         if not quiet_mode: 
-            print(f"WARNING: Inner LP for {q_code} failed. Allocating 0 seats.")
+            event_log.warning('lp', "WARNING: Inner LP for {} failed. Allocating 0 seats.", q_code, quota=q_code)
         return {}
 
 
@@ -154,9 +405,6 @@ def partition_quota_into_buckets(independent_demands: list,
     result = {}
     for i in range(num_buckets):
         result[f"{q_code}_Bucket_{i}_Allocation"] = int(x_vars[i].varValue)
-
-    if not quiet_mode: 
-        print(f"Inner Allocation complete. Result: {result}")
     return result
 
-# ===================================================================
\ No newline at end of file
+# ===================================================================
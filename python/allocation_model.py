@@ -0,0 +1,251 @@
+# FILE 12: allocation_model.py (Persistent, Warm-Started LP Models)
+# A reusable allocation LP that is built once per structure (class,
+# quotas, buckets, legs) and then only has its right-hand sides, bounds
+# and costs updated between Monte Carlo scenarios.
+#
+# With the optional `highspy` package the model lives inside one HiGHS
+# instance, so every re-solve starts from the previous optimal basis.
+# Without it, each solve falls back to a cold in-process scipy/HiGHS solve.
+
+import time
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import highspy
+except ImportError: # Optional dependency
+    highspy = None
+
+
+class AllocationModel:
+    """
+    max  c.x
+    s.t. A x <= b,  lb <= x <= ub
+
+    Only b, lb, ub and c may change after construction; the sparsity
+    pattern of A is fixed. Tracks build and solve time separately.
+    """
+
+    def __init__(self, A, c, b, ub, lb=None, name: str = "Allocation"):
+        start = time.perf_counter()
+        self.name = name
+        self.A = sp.csr_matrix(A, dtype=float)
+        self.n_rows, self.n_cols = self.A.shape
+        self.c = np.asarray(c, dtype=float).copy()
+        self.b = np.asarray(b, dtype=float).copy()
+        self.ub = np.asarray(ub, dtype=float).copy()
+        self.lb = np.zeros(self.n_cols) if lb is None else np.asarray(lb, dtype=float).copy()
+
+        self.backend = 'highspy' if highspy is not None else 'linprog'
+        self._highs = self._build_highs() if self.backend == 'highspy' else None
+
+        self.build_time = time.perf_counter() - start
+        self.solve_time = 0.0
+        self.n_solves = 0
+        self.last_iterations = 0
+
+    # --- Construction ---
+    def _build_highs(self):
+        """(Internal) Loads the model into a HiGHS instance, once."""
+        h = highspy.Highs()
+        h.setOptionValue('output_flag', False)
+        h.addCols(self.n_cols, self.c, self.lb, self.ub,
+                  0, np.zeros(self.n_cols, dtype=np.int32),
+                  np.array([], dtype=np.int32), np.array([], dtype=float))
+        h.addRows(self.n_rows, np.full(self.n_rows, -highspy.kHighsInf), self.b,
+                  self.A.nnz, self.A.indptr[:-1].astype(np.int32),
+                  self.A.indices.astype(np.int32), self.A.data)
+        h.changeObjectiveSense(highspy.ObjSense.kMaximize)
+        return h
+
+    @classmethod
+    def for_master(cls, q_codes: list, policy_minimums: dict = None, tc: str = ''):
+        """Master LP: one capacity row, one variable per quota."""
+        policy_minimums = policy_minimums or {}
+        n = len(q_codes)
+        lb = [policy_minimums.get(q, 0) for q in q_codes]
+        model = cls(np.ones((1, n)), np.zeros(n), [0.0], np.zeros(n), lb=lb,
+                    name=f"Master_Quota_Allocation_{tc}")
+        model.q_codes = list(q_codes)
+        return model
+
+    @classmethod
+    def for_inner(cls, prices: list, q_code: str = ''):
+        """Inner LP: one quota-capacity row, one variable per bucket."""
+        n = len(prices)
+        model = cls(np.ones((1, n)), prices, [0.0], np.zeros(n),
+                    name=f"Inner_Allocation_{q_code}")
+        model.q_code = q_code
+        return model
+
+    # --- Per-scenario updates ---
+    def update(self, b=None, ub=None, c=None, lb=None):
+        """Changes RHS / bounds / costs in place, keeping the current basis."""
+        if b is not None:
+            self.b = np.asarray(b, dtype=float).copy()
+            if self._highs is not None:
+                self._highs.changeRowsBounds(
+                    self.n_rows, np.arange(self.n_rows, dtype=np.int32),
+                    np.full(self.n_rows, -highspy.kHighsInf), self.b
+                )
+        if ub is not None or lb is not None:
+            if ub is not None:
+                self.ub = np.asarray(ub, dtype=float).copy()
+            if lb is not None:
+                self.lb = np.asarray(lb, dtype=float).copy()
+            if self._highs is not None:
+                self._highs.changeColsBounds(
+                    self.n_cols, np.arange(self.n_cols, dtype=np.int32),
+                    self.lb, self.ub
+                )
+        if c is not None:
+            self.c = np.asarray(c, dtype=float).copy()
+            if self._highs is not None:
+                self._highs.changeColsCost(
+                    self.n_cols, np.arange(self.n_cols, dtype=np.int32), self.c
+                )
+
+    # --- Solve ---
+    def solve(self) -> dict:
+        """
+        Re-solves the model (warm-started with highspy).
+
+        Returns:
+            {'x': (n_cols,), 'objective': float, 'duals': (n_rows,),
+             'status': str, 'solve_time': float, 'iterations': int}
+        """
+        start = time.perf_counter()
+        if self._highs is not None:
+            self._highs.run()
+            status = self._highs.modelStatusToString(self._highs.getModelStatus())
+            solution = self._highs.getSolution()
+            info = self._highs.getInfo()
+            x = np.asarray(solution.col_value)
+            duals = np.asarray(solution.row_dual)
+            objective = info.objective_function_value
+            iterations = info.simplex_iteration_count
+        else:
+            from scipy.optimize import linprog
+            res = linprog(c=-self.c, A_ub=self.A, b_ub=self.b,
+                          bounds=np.column_stack([self.lb, self.ub]),
+                          method='highs')
+            status = 'Optimal' if res.status == 0 else res.message
+            x = res.x if res.status == 0 else np.zeros(self.n_cols)
+            duals = -res.ineqlin.marginals if res.status == 0 else np.zeros(self.n_rows)
+            objective = -res.fun if res.status == 0 else 0.0
+            iterations = getattr(res, 'nit', 0)
+
+        elapsed = time.perf_counter() - start
+        self.solve_time += elapsed
+        self.n_solves += 1
+        self.last_iterations = iterations
+        return {
+            'x': x,
+            'objective': objective,
+            'duals': duals,
+            'status': status,
+            'solve_time': elapsed,
+            'iterations': iterations
+        }
+
+    def timing_report(self) -> dict:
+        """Build vs solve time, to show what reuse saves."""
+        return {
+            'name': self.name,
+            'backend': self.backend,
+            'warm_start': self._highs is not None,
+            'build_time': self.build_time,
+            'n_solves': self.n_solves,
+            'total_solve_time': self.solve_time,
+            'mean_solve_time': self.solve_time / self.n_solves if self.n_solves else 0.0
+        }
+
+    # --- Convenience wrappers in the allocation_engine result format ---
+    def solve_master(self, quota_forecasts: dict, total_capacity: int) -> dict:
+        """Updates and solves a for_master() model; returns {'GN_Allocation': ...}."""
+        self.update(
+            b=[total_capacity],
+            c=[quota_forecasts[q]['avg_revenue_per_seat'] for q in self.q_codes],
+            ub=[quota_forecasts[q]['total_demand'] for q in self.q_codes]
+        )
+        solution = self.solve()
+        if solution['status'] != 'Optimal':
+            raise Exception(f"{self.name} LP is {solution['status'].upper()}.")
+        return {f"{q}_Allocation": int(solution['x'][i] + 1e-9) for i, q in enumerate(self.q_codes)}
+
+    def solve_inner(self, independent_demands: list, quota_allocation: int) -> dict:
+        """Updates and solves a for_inner() model; returns {'GN_Bucket_0_Allocation': ...}."""
+        self.update(b=[quota_allocation], ub=independent_demands)
+        solution = self.solve()
+        if solution['status'] != 'Optimal':
+            return {}
+        return {
+            f"{self.q_code}_Bucket_{i}_Allocation": int(solution['x'][i] + 1e-9)
+            for i in range(self.n_cols)
+        }
+
+
+# --- Model Registry ---
+# One persistent model per (kind, class, quota/bucket structure).
+_MODELS = {}
+
+
+def get_master_model(tc: str, q_codes: list, policy_minimums: dict = None) -> AllocationModel:
+    """Returns the persistent Master model for this class and quota set."""
+    key = ('master', tc, tuple(q_codes), tuple(sorted((policy_minimums or {}).items())))
+    if key not in _MODELS:
+        _MODELS[key] = AllocationModel.for_master(q_codes, policy_minimums, tc)
+    return _MODELS[key]
+
+
+def get_inner_model(q_code: str, prices: list) -> AllocationModel:
+    """Returns the persistent Inner model for this quota and price ladder."""
+    key = ('inner', q_code, tuple(prices))
+    if key not in _MODELS:
+        _MODELS[key] = AllocationModel.for_inner(prices, q_code)
+    return _MODELS[key]
+
+
+def model_timing_report() -> list:
+    """Build vs solve time for every persistent model created so far."""
+    return [model.timing_report() for model in _MODELS.values()]
+
+
+def clear_models():
+    """Drops all persistent models (e.g. after changing the quota structure)."""
+    _MODELS.clear()
+
+
+# This block benchmarks warm vs cold re-solves on the network LP
+if __name__ == "__main__":
+    from network_allocation import (
+        line_itinerary_legs, build_leg_product_matrix,
+        build_network_products, solve_network_allocation
+    )
+    import config
+
+    rng = np.random.default_rng(42)
+    n_stations, n_scenarios = 50, 20
+    pairs = np.array([(o, d) for o in range(n_stations) for d in range(o + 1, n_stations)])
+    pairs = pairs[rng.choice(len(pairs), size=1000, replace=False)]
+    od_mu = {q: np.trunc(rng.gamma(2.0, 3.0, size=len(pairs))) for q in config.QUOTA_CONFIG}
+    products = build_network_products(pairs[:, 0], pairs[:, 1], od_mu, '3AC', n_stations)
+    A = build_leg_product_matrix(line_itinerary_legs(pairs[:, 0], pairs[:, 1]),
+                                 products['product_itinerary'], n_stations - 1)
+    capacity = np.full(n_stations - 1, config.CAPACITY['3AC'])
+
+    model = AllocationModel(A, products['prices'], capacity, products['demands'], name="Network_3AC")
+    cold_time = 0.0
+    for _ in range(n_scenarios):
+        demands = np.trunc(products['demands'] * rng.lognormal(0.0, 0.15, size=len(products['demands'])))
+        model.update(ub=demands)
+        warm = model.solve()
+        cold = solve_network_allocation(capacity, A, products['prices'], demands)
+        cold_time += cold['solve_time']
+        assert abs(warm['objective'] - cold['revenue']) <= 1e-6 * max(1.0, cold['revenue'])
+
+    report = model.timing_report()
+    print(f"Backend: {report['backend']} (warm start: {report['warm_start']})")
+    print(f"Build time:            {report['build_time'] * 1000:.1f} ms (once)")
+    print(f"Mean re-solve time:    {report['mean_solve_time'] * 1000:.1f} ms")
+    print(f"Mean cold solve time:  {cold_time / n_scenarios * 1000:.1f} ms")
@@ -0,0 +1,145 @@
+# FILE 22: allocation_plan.py (Compiled, Integer-Indexed Allocation Plan)
+# The simulator's online state as flat arrays instead of string-keyed
+# nested dicts. Every (class, quota, bucket) product gets a fixed index;
+# products of one (class, quota) pair are contiguous, so a pair is a
+# slice [start[k], start[k + 1]) with k = class_index * n_quotas + quota_index.
+#
+#   limits[p]    booking limit of product p (seats, from the allocation LPs)
+#   sold[p]      seats sold so far
+#   prices[p]    fare
+#   rejected[k]  rejected requests per (class, quota) pair
+#
+# The arrays are array.array buffers: cheap to copy and pickle, and
+# np.frombuffer() views them without copying (as_numpy()). The
+# {'GN_Bucket_0_Allocation': ...} style dicts are only produced at the
+# edges (class_limits(), class_sold(), to_dicts()).
+
+import copy
+from array import array
+import numpy as np
+import config
+
+
+class AllocationPlan:
+    """Limits, sales and rejections of every product of a train."""
+
+    def __init__(self, classes: list = None, quota_config: dict = None):
+        self.classes = list(classes or config.TRAVEL_CLASSES)
+        quota_config = quota_config or config.QUOTA_CONFIG
+        self.quotas = list(quota_config)
+        self.n_quotas = len(self.quotas)
+
+        prices = []
+        self.start = [0]
+        for tc in self.classes:
+            for q_code in self.quotas:
+                q_config = quota_config[q_code]
+                price_config = q_config['price_config'][tc]
+                if q_config['type'] == 'FLEXI':
+                    prices.extend(bucket_info['price'] for bucket_info in price_config)
+                else:
+                    prices.append(price_config)
+                self.start.append(len(prices))
+
+        n_products = len(prices)
+        self.prices = array('q' if all(isinstance(p, int) for p in prices) else 'd', prices)
+        self.limits = array('q', bytes(8 * n_products))
+        self.sold = array('q', bytes(8 * n_products))
+        self.rejected = array('q', bytes(8 * len(self.classes) * self.n_quotas))
+        self._class_index = {tc: c for c, tc in enumerate(self.classes)}
+        self._quota_index = {q_code: q for q, q_code in enumerate(self.quotas)}
+
+    # --- Indexing ---
+    def pair(self, tc: str, q_code: str) -> int:
+        """Index k of a (class, quota) pair."""
+        return self._class_index[tc] * self.n_quotas + self._quota_index[q_code]
+
+    def product(self, tc: str, q_code: str, bucket: int) -> int:
+        """Index p of a (class, quota, bucket) product."""
+        return self.start[self.pair(tc, q_code)] + bucket
+
+    # --- Online updates (hot path) ---
+    def fill(self, k: int, n_requests: int) -> int:
+        """
+        Serves n_requests of pair k first come, first served: each request
+        takes the cheapest bucket that is still under its limit. Requests
+        that find every bucket full are rejected.
+
+        Returns:
+            The number of requests accepted.
+        """
+        limits, sold = self.limits, self.sold
+        left = n_requests
+        for p in range(self.start[k], self.start[k + 1]):
+            free = limits[p] - sold[p]
+            if free > 0:
+                take = free if free < left else left
+                sold[p] += take
+                left -= take
+                if left == 0:
+                    break
+        self.rejected[k] += left
+        return n_requests - left
+
+    def record_sale(self, k: int, bucket: int):
+        self.sold[self.start[k] + bucket] += 1
+
+    def record_rejection(self, k: int, n: int = 1):
+        self.rejected[k] += n
+
+    def revenue(self):
+        """Revenue of all seats sold so far."""
+        return sum(s * p for s, p in zip(self.sold, self.prices))
+
+    # --- Dict boundary ---
+    def set_limits(self, tc: str, bucket_allocations: dict):
+        """Loads one class's limits from {'GN_Bucket_0_Allocation': seats, ...} (missing = 0)."""
+        for q_code in self.quotas:
+            k = self.pair(tc, q_code)
+            for i, p in enumerate(range(self.start[k], self.start[k + 1])):
+                self.limits[p] = int(bucket_allocations.get(f"{q_code}_Bucket_{i}_Allocation", 0))
+
+    def _class_dict(self, values: array, tc: str, suffix: str) -> dict:
+        result = {}
+        for q_code in self.quotas:
+            k = self.pair(tc, q_code)
+            for i, p in enumerate(range(self.start[k], self.start[k + 1])):
+                result[f"{q_code}_Bucket_{i}{suffix}"] = values[p]
+        return result
+
+    def class_limits(self, tc: str) -> dict:
+        return self._class_dict(self.limits, tc, '_Allocation')
+
+    def class_sold(self, tc: str) -> dict:
+        """{'GN_Bucket_0': seats sold, ...} for one class."""
+        return self._class_dict(self.sold, tc, '')
+
+    def to_dicts(self) -> tuple:
+        """
+        The simulator's classic outputs: (seats_sold, bookings_accepted,
+        bookings_rejected), each {class: {key: count}}. Every accepted
+        request sells one seat, so the first two hold the same counts.
+        """
+        seats_sold = {tc: self.class_sold(tc) for tc in self.classes}
+        bookings_accepted = {
+            tc: {key: n for key, n in sold.items() if n > 0} for tc, sold in seats_sold.items()
+        }
+        bookings_rejected = {
+            tc: {q_code: self.rejected[self.pair(tc, q_code)] for q_code in self.quotas}
+            for tc in self.classes
+        }
+        return seats_sold, bookings_accepted, bookings_rejected
+
+    # --- Copying / sharing ---
+    def copy(self) -> "AllocationPlan":
+        return copy.deepcopy(self)
+
+    def as_numpy(self) -> dict:
+        """Zero-copy NumPy views of the state arrays."""
+        return {
+            'limits': np.frombuffer(self.limits, dtype=np.int64),
+            'sold': np.frombuffer(self.sold, dtype=np.int64),
+            'prices': np.frombuffer(self.prices, dtype=np.int64 if self.prices.typecode == 'q' else np.float64),
+            'rejected': np.frombuffer(self.rejected, dtype=np.int64),
+            'start': np.asarray(self.start)
+        }
@@ -0,0 +1,276 @@
+# FILE 9: batch_simulation.py (Vectorized Monte Carlo Engine)
+# Simulates N scenarios of the full pipeline at once as NumPy arrays.
+# Statistically equivalent to calling simulation.run_dynamic_simulation()
+# N times, but with no per-scenario or per-arrival Python loop.
+
+import numpy as np
+import config
+from engine import get_market_forecast, forecast_cache_key
+from forecasting import forecast_demand_by_price_point_batch
+from allocation_engine import solve_knapsack_batch, POLICY_MINIMUMS
+from booking_curve_model import get_daily_arrival_fractions
+
+
+def sample_quota_forecasts_batch(n_scenarios: int,
+                                 stochastic_mode: bool = True,
+                                 rng: np.random.Generator = None) -> dict:
+    """
+    Batch version of engine.get_quota_forecasts().
+
+    Returns:
+        {tc: {q_code: {...}}} with the same keys as the scalar version,
+        but 'total_demand' and 'avg_revenue_per_seat' are (N,) arrays and
+        'independent_bucket_demands' is an (N, n_buckets) array.
+    """
+    market_mu = sample_market_mu_batch(n_scenarios, stochastic_mode=stochastic_mode, rng=rng)
+    return {
+        tc: {q_code: build_quota_forecast_batch(mu, tc, q_code) for q_code, mu in class_mu.items()}
+        for tc, class_mu in market_mu.items()
+    }
+
+
+def sample_market_mu_batch(n_scenarios: int,
+                           stochastic_mode: bool = True,
+                           rng: np.random.Generator = None) -> dict:
+    """
+    Samples the total-market size of every class and quota.
+
+    Returns:
+        {tc: {q_code: (N,) market size}}
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    market_mu = {}
+    cache_key = forecast_cache_key()
+
+    for tc in config.TRAVEL_CLASSES:
+        market_mu[tc] = {}
+
+        for q_code in config.QUOTA_CONFIG:
+            total_market_mu, total_market_sigma = get_market_forecast(
+                tc, q_code, quiet=True, cache_key=cache_key
+            )
+
+            if stochastic_mode:
+                sampled_mu = rng.normal(total_market_mu, total_market_sigma, n_scenarios)
+                market_mu[tc][q_code] = np.maximum(np.trunc(sampled_mu), 0)
+            else:
+                market_mu[tc][q_code] = np.full(n_scenarios, float(total_market_mu))
+
+    return market_mu
+
+
+def build_quota_forecast_batch(market_mu: np.ndarray, tc: str, q_code: str,
+                               price_buckets: list = None) -> dict:
+    """
+    Turns (N,) total-market sizes for one class and quota into the
+    forecast dict used by the allocators (price-elastic buckets for
+    FLEXI quotas, a single bucket for FLAT quotas).
+
+    Args:
+        price_buckets: Overrides the FLEXI fare ladder from config.
+    """
+    q_config = config.QUOTA_CONFIG[q_code]
+    n_scenarios = market_mu.shape[0]
+
+    if q_config['type'] == 'FLEXI':
+        (cumulative, prices) = forecast_demand_by_price_point_batch(
+            market_mu, price_buckets if price_buckets is not None else q_config['price_config'][tc]
+        )
+    else:
+        cumulative = np.trunc(market_mu).astype(np.int64)[:, None]
+        prices = [q_config['price_config'][tc]]
+
+    # Cumulative [100, 70, 30] -> independent [30, 40, 30]
+    independent = cumulative.copy()
+    independent[:, :-1] -= cumulative[:, 1:]
+
+    total_demand = independent.sum(axis=1)
+    max_revenue = independent @ np.asarray(prices, dtype=float)
+    avg_revenue = np.divide(max_revenue, total_demand,
+                            out=np.zeros(n_scenarios), where=total_demand > 0)
+
+    return {
+        'total_demand': total_demand,
+        'avg_revenue_per_seat': avg_revenue,
+        'independent_bucket_demands': independent,
+        'prices': prices
+    }
+
+
+def allocate_batch(all_quota_forecasts: dict,
+                   capacity: dict = None,
+                   policy_minimums: dict = None) -> dict:
+    """
+    Batch version of the Master + Inner allocation step.
+
+    Args:
+        capacity: {tc: seats}, where seats is a scalar or an (N,) array.
+                  Defaults to config.CAPACITY.
+        policy_minimums: {tc: {q_code: min_seats}}. Defaults to
+                         allocation_engine.POLICY_MINIMUMS.
+
+    Returns:
+        {tc: {q_code: (N, n_buckets) bucket limits}}
+    """
+    capacity = capacity if capacity is not None else config.CAPACITY
+    policy_minimums = policy_minimums if policy_minimums is not None else POLICY_MINIMUMS
+    final_bucket_allocations = {}
+
+    for tc, class_forecasts in all_quota_forecasts.items():
+        q_codes = list(class_forecasts.keys())
+
+        # --- Master allocation (Quota vs Quota) ---
+        rates = np.stack([class_forecasts[q]['avg_revenue_per_seat'] for q in q_codes], axis=1)
+        demands = np.stack([class_forecasts[q]['total_demand'] for q in q_codes], axis=1)
+        minimums = [policy_minimums.get(tc, {}).get(q, 0) for q in q_codes]
+        master = np.trunc(solve_knapsack_batch(rates, demands, capacity[tc], minimums))
+
+        # --- Inner allocation (Bucket vs Bucket) ---
+        final_bucket_allocations[tc] = {}
+        for j, q_code in enumerate(q_codes):
+            forecast_data = class_forecasts[q_code]
+            if config.QUOTA_CONFIG[q_code]['type'] == 'FLEXI':
+                bucket_demands = forecast_data['independent_bucket_demands']
+                prices = np.broadcast_to(np.asarray(forecast_data['prices'], dtype=float),
+                                         bucket_demands.shape)
+                inner = solve_knapsack_batch(prices, bucket_demands, master[:, j])
+                final_bucket_allocations[tc][q_code] = np.trunc(inner).astype(np.int64)
+            else:
+                final_bucket_allocations[tc][q_code] = master[:, j:j + 1].astype(np.int64)
+
+    return final_bucket_allocations
+
+
+def draw_arrivals_batch(all_quota_forecasts: dict,
+                        rng: np.random.Generator = None) -> dict:
+    """
+    Draws the Poisson arrivals for every day, class, quota and scenario
+    in a single call.
+
+    Returns:
+        {tc: {q_code: (N,) total arrivals over the booking window}}
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    keys = [(tc, q) for tc in all_quota_forecasts for q in all_quota_forecasts[tc]]
+
+    # rates[k, n, d] = total_demand[k, n] * fraction[k, d]
+    fractions = np.stack([
+        get_daily_arrival_fractions(q, config.QUOTA_CONFIG[q], tc=tc)[1:] for (tc, q) in keys
+    ])
+    totals = np.stack([all_quota_forecasts[tc][q]['total_demand'] for (tc, q) in keys])
+    daily_arrivals = rng.poisson(totals[:, :, None] * fractions[:, None, :])
+    total_arrivals = daily_arrivals.sum(axis=2)
+
+    arrivals = {tc: {} for tc in all_quota_forecasts}
+    for k, (tc, q) in enumerate(keys):
+        arrivals[tc][q] = total_arrivals[k]
+    return arrivals
+
+
+def simulate_booking_batch(all_quota_forecasts: dict,
+                           final_bucket_allocations: dict,
+                           arrivals: dict) -> dict:
+    """
+    Batch version of the online booking phase.
+
+    With a static allocation plan, each arrival takes the cheapest bucket
+    that still has seats, so the nested spill-up is fully determined by
+    the cumulative arrivals against the cumulative bucket limits.
+
+    A forecast's 'prices' may be one ladder (B,) or one per scenario
+    (N, B), e.g. when scoring many candidate fare ladders at once.
+
+    Returns:
+        A dict with per-scenario 'revenue' (N,), 'sales' {tc: {q: (N, B)}},
+        'rejections' {tc: {q: (N,)}} and 'seats_sold' {tc: (N,)}.
+    """
+    revenue = 0
+    sales = {}
+    rejections = {}
+    seats_sold = {}
+
+    for tc, class_allocs in final_bucket_allocations.items():
+        sales[tc] = {}
+        rejections[tc] = {}
+        seats_sold[tc] = 0
+
+        for q_code, limits in class_allocs.items():
+            quota_arrivals = arrivals[tc][q_code]
+            prices = np.asarray(all_quota_forecasts[tc][q_code]['prices'], dtype=float)
+
+            cumulative_limits = np.cumsum(limits, axis=1)
+            filled = np.minimum(quota_arrivals[:, None], cumulative_limits)
+            bucket_sales = np.diff(filled, axis=1, prepend=0)
+
+            sales[tc][q_code] = bucket_sales
+            rejections[tc][q_code] = quota_arrivals - filled[:, -1]
+            seats_sold[tc] = seats_sold[tc] + filled[:, -1]
+            revenue = revenue + (bucket_sales @ prices if prices.ndim == 1
+                                 else (bucket_sales * prices).sum(axis=1))
+
+    return {
+        'revenue': revenue,
+        'sales': sales,
+        'rejections': rejections,
+        'seats_sold': seats_sold
+    }
+
+
+def run_batch_simulation(n_scenarios: int,
+                         stochastic_mode: bool = True,
+                         seed=None,
+                         chunk_size: int = 5000) -> dict:
+    """
+    Runs N full scenarios (forecast sample -> allocation -> booking).
+
+    Scenarios are processed in chunks to bound the memory used by the
+    (quotas x scenarios x days) arrival array.
+
+    Returns:
+        The simulate_booking_batch() dict, concatenated over all chunks.
+    """
+    rng = np.random.default_rng(seed)
+    chunks = []
+
+    for start in range(0, n_scenarios, chunk_size):
+        n = min(chunk_size, n_scenarios - start)
+        forecasts = sample_quota_forecasts_batch(n, stochastic_mode=stochastic_mode, rng=rng)
+        allocations = allocate_batch(forecasts)
+        arrivals = draw_arrivals_batch(forecasts, rng=rng)
+        chunks.append(simulate_booking_batch(forecasts, allocations, arrivals))
+
+    return _concatenate_results(chunks)
+
+
+def _concatenate_results(chunks: list) -> dict:
+    """(Internal) Joins per-chunk result dicts along the scenario axis."""
+    if len(chunks) == 1:
+        return chunks[0]
+
+    first = chunks[0]
+    return {
+        'revenue': np.concatenate([c['revenue'] for c in chunks]),
+        'sales': {
+            tc: {q: np.concatenate([c['sales'][tc][q] for c in chunks]) for q in first['sales'][tc]}
+            for tc in first['sales']
+        },
+        'rejections': {
+            tc: {q: np.concatenate([c['rejections'][tc][q] for c in chunks]) for q in first['rejections'][tc]}
+            for tc in first['rejections']
+        },
+        'seats_sold': {
+            tc: np.concatenate([c['seats_sold'][tc] for c in chunks]) for tc in first['seats_sold']
+        }
+    }
+
+
+# This block lets you benchmark the batch engine from the command line
+if __name__ == "__main__":
+    import time
+
+    for n in (100, 1000, 10000):
+        start = time.perf_counter()
+        results = run_batch_simulation(n, stochastic_mode=True, seed=42)
+        elapsed = time.perf_counter() - start
+        print(f"{n:>6} runs: {elapsed:.3f}s  "
+              f"mean ₹{results['revenue'].mean():,.2f}  std ₹{results['revenue'].std():,.2f}")
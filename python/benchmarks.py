@@ -0,0 +1,317 @@
+# FILE 19: benchmarks.py (Stage Benchmarks, Scaling Curves & Regression Check)
+# Times every hot stage of the pipeline at several input sizes, fits a
+# scaling exponent per stage, stores the results as JSON and compares
+# them against a stored baseline.
+#
+# Examples:
+#   python python/benchmarks.py --output bench/current.json
+#   python python/benchmarks.py --compare bench/baseline.json --threshold 0.25
+#   python python/benchmarks.py --quick --plot scaling.png
+
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import config
+import engine
+from unconstraining import unconstrain_demand
+from factor_calculator import calculate_demand_factors
+from allocation_engine import partition_capacity_by_quota, partition_quota_into_buckets
+from simulation import run_dynamic_simulation
+
+MIN_REPEATS = 3
+MAX_REPEATS = 20
+TARGET_SECONDS = 0.2 # Stop repeating once a measurement has used this much time
+DEFAULT_THRESHOLD = 0.25 # Allowed slowdown (25%) before the regression check fails
+
+QUOTA_MIX = [('GN', 0.7), ('TK', 0.2), ('LD', 0.1)]
+DAYS_OF_WEEK = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+@contextlib.contextmanager
+def _patched(obj, attr: str, value):
+    """(Internal) Temporarily replaces obj.attr (config tables etc.)."""
+    original = getattr(obj, attr)
+    setattr(obj, attr, value)
+    try:
+        yield
+    finally:
+        setattr(obj, attr, original)
+
+
+def _synthetic_history(n_rows: int, capacity: int, rng) -> list:
+    """(Internal) DETAILED_HISTORICAL_DATA-style records for one class."""
+    quotas = rng.choice([q for q, _ in QUOTA_MIX], size=n_rows, p=[w for _, w in QUOTA_MIX])
+    sold = np.minimum(rng.poisson(0.8 * capacity, size=n_rows), capacity)
+    return [
+        {
+            'train_id': i,
+            'total_sold': int(sold[i]),
+            'days_early': int(rng.integers(0, 11)) if sold[i] >= capacity else 0,
+            'is_holiday': bool(rng.random() < 0.1),
+            'day_of_week': DAYS_OF_WEEK[i % 7],
+            'quota': str(quotas[i])
+        }
+        for i in range(n_rows)
+    ]
+
+
+# --- Stage definitions ---
+# Each stage maps a size to a zero-argument callable (setup happens
+# outside the timed region).
+def _stage_unconstrain(n_rows: int):
+    rng = np.random.default_rng(0)
+    records = [
+        {'train_id': r['train_id'], 'days_before_departure': r['days_early'], 'total_sold': r['total_sold']}
+        for r in _synthetic_history(n_rows, 110, rng)
+    ]
+    return lambda: unconstrain_demand(records, 110, quiet=True)
+
+
+def _stage_demand_factors(n_rows: int):
+    records = _synthetic_history(n_rows, 110, np.random.default_rng(0))
+    return lambda: calculate_demand_factors(records, 110, quiet=True)
+
+
+def _stage_quota_forecasts(n_rows: int):
+    history = {
+        tc: _synthetic_history(n_rows, config.CAPACITY[tc], np.random.default_rng(i))
+        for i, tc in enumerate(config.TRAVEL_CLASSES)
+    }
+
+    def run():
+        # Cold: the cache would otherwise hide the forecasting work
+        engine.clear_forecast_cache()
+        with _patched(config, 'DETAILED_HISTORICAL_DATA', history):
+            engine.get_quota_forecasts(stochastic_mode=True, rng=np.random.default_rng(0))
+    return run
+
+
+def _stage_master_lp(seats: int):
+    forecasts = {
+        q_code: {'total_demand': 1.3 * seats * share, 'avg_revenue_per_seat': 2000 + 500 * i}
+        for i, (q_code, share) in enumerate(QUOTA_MIX)
+    }
+    return lambda: partition_capacity_by_quota(forecasts, seats, '3AC', quiet_mode=True)
+
+
+def _stage_inner_lp(n_buckets: int):
+    prices = [1800 + 20 * i for i in range(n_buckets)]
+    demands = [10 + (i % 7) for i in range(n_buckets)]
+    allocation = sum(demands) // 2
+    return lambda: partition_quota_into_buckets(demands, prices, allocation, 'GN', quiet_mode=True)
+
+
+def _stage_simulation(seats: int):
+    # Scale capacity and historical sales together, so demand (and the
+    # number of arrivals) grows with the train
+    scale = seats / sum(config.CAPACITY.values())
+    capacity = {tc: max(1, int(round(cap * scale))) for tc, cap in config.CAPACITY.items()}
+    history = {
+        tc: [dict(r, total_sold=int(round(r['total_sold'] * scale))) for r in records]
+        for tc, records in config.DETAILED_HISTORICAL_DATA.items()
+    }
+
+    def run():
+        with _patched(config, 'CAPACITY', capacity), _patched(config, 'DETAILED_HISTORICAL_DATA', history):
+            run_dynamic_simulation(stochastic_mode=True, quiet_mode=True, rng=np.random.default_rng(0))
+    return run
+
+
+def _stage_dp(days: int):
+    from dynamic_programming import solve_class_dp
+    rng = np.random.default_rng(0)
+    fares = np.asarray([1800, 1980, 2160, 2340, 2500, 2600, 1800], dtype=float)
+    daily_rates = np.zeros((days + 1, len(fares)))
+    # ~1.25 requests per product per day: a longer window means more periods
+    daily_rates[1:] = rng.uniform(0.0, 2.5, size=(days, len(fares)))
+    return lambda: solve_class_dp(fares, daily_rates, 110)
+
+
+def _stage_monte_carlo(runs: int):
+    from main import run_analysis
+
+    def run():
+        for _ in run_analysis(n_simulations=runs, seed=0):
+            pass
+    return run
+
+
+# stage name -> (size parameter, sizes, quick sizes, factory)
+STAGES = {
+    'unconstrain_demand': ('history_rows', [1_000, 10_000, 100_000], [1_000, 10_000], _stage_unconstrain),
+    'calculate_demand_factors': ('history_rows', [1_000, 10_000, 100_000], [1_000, 10_000], _stage_demand_factors),
+    'get_quota_forecasts': ('history_rows', [100, 1_000, 10_000], [100, 1_000], _stage_quota_forecasts),
+    'master_lp': ('seats', [100, 1_000, 10_000], [100, 1_000], _stage_master_lp),
+    'inner_lp': ('buckets', [5, 50, 500], [5, 50], _stage_inner_lp),
+    'simulation': ('seats', [200, 800, 3_200], [200, 800], _stage_simulation),
+    'dp': ('days', [30, 120, 365], [30, 120], _stage_dp),
+    'monte_carlo': ('runs', [20, 80, 320], [20, 80], _stage_monte_carlo),
+}
+
+
+# --- Running ---
+def time_callable(fn) -> dict:
+    """Best-of-n wall time; repeats until TARGET_SECONDS or MAX_REPEATS."""
+    fn() # Warm-up (imports, caches that are not part of the stage)
+    times = []
+    while len(times) < MIN_REPEATS or (sum(times) < TARGET_SECONDS and len(times) < MAX_REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'median': float(np.median(times)), 'repeats': len(times)}
+
+
+def scaling_exponent(sizes: list, seconds: list) -> float:
+    """Slope of log(time) vs log(size): ~1 linear, ~2 quadratic, ~0 flat."""
+    if len(sizes) < 2:
+        return float('nan')
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(seconds, 1e-9)), 1)[0])
+
+
+def run_benchmarks(stages: list = None, quick: bool = False, quiet: bool = False) -> dict:
+    """
+    Runs the selected stages (default: all) at each of their sizes.
+
+    Returns:
+        {'meta': {...}, 'stages': {stage: {'param', 'sizes', 'seconds',
+                                           'median_seconds', 'scaling_exponent'}}}
+    """
+    results = {'meta': _environment(), 'stages': {}}
+    for name in stages or list(STAGES):
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage '{name}'. Options: {list(STAGES)}")
+        param, sizes, quick_sizes, factory = STAGES[name]
+        sizes = quick_sizes if quick else sizes
+        best, median = [], []
+        for size in sizes:
+            timing = time_callable(factory(size))
+            best.append(timing['best'])
+            median.append(timing['median'])
+            if not quiet:
+                print(f"  {name:<26} {f'{param}={size}':<20} {timing['best'] * 1000:10.3f} ms "
+                      f"({timing['repeats']} runs)")
+        results['stages'][name] = {
+            'param': param,
+            'sizes': sizes,
+            'seconds': best,
+            'median_seconds': median,
+            'scaling_exponent': scaling_exponent(sizes, best)
+        }
+    return results
+
+
+def _environment() -> dict:
+    """(Internal) Where and on what the benchmark ran."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine()
+    }
+
+
+# --- Regression check ---
+def compare_results(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Compares matching (stage, size) timings.
+
+    Returns:
+        A list of {'stage', 'param', 'size', 'baseline', 'current', 'ratio',
+                   'regression'} rows; regression = ratio > 1 + threshold.
+    """
+    rows = []
+    for name, cur in current['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if base is None:
+            continue
+        base_by_size = dict(zip(base['sizes'], base['seconds']))
+        for size, seconds in zip(cur['sizes'], cur['seconds']):
+            if size not in base_by_size:
+                continue
+            ratio = seconds / base_by_size[size] if base_by_size[size] > 0 else float('inf')
+            rows.append({
+                'stage': name,
+                'param': cur['param'],
+                'size': size,
+                'baseline': base_by_size[size],
+                'current': seconds,
+                'ratio': ratio,
+                'regression': ratio > 1.0 + threshold
+            })
+    return rows
+
+
+def plot_scaling(results: dict, path: str):
+    """Log-log scaling curves, one panel per size parameter."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    params = sorted({s['param'] for s in results['stages'].values()})
+    fig, axes = plt.subplots(1, len(params), figsize=(4.5 * len(params), 4), squeeze=False)
+    for ax, param in zip(axes[0], params):
+        for name, stage in results['stages'].items():
+            if stage['param'] == param:
+                ax.loglog(stage['sizes'], stage['seconds'], marker='o',
+                          label=f"{name} (k={stage['scaling_exponent']:.2f})")
+        ax.set_xlabel(param)
+        ax.set_ylabel('seconds (best)')
+        ax.legend(fontsize=7)
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage.")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=None)
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes only.")
+    parser.add_argument('--output', default=None, help="Write results as JSON.")
+    parser.add_argument('--compare', default=None, help="Baseline JSON to check against.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before failing (0.25 = 25%%).")
+    parser.add_argument('--plot', default=None, help="Save log-log scaling curves to this image.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.stages, quick=args.quick)
+    print("\nScaling exponents:")
+    for name, stage in results['stages'].items():
+        print(f"  {name:<26} {stage['scaling_exponent']:5.2f}  (vs {stage['param']})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.plot:
+        plot_scaling(results, args.plot)
+        print(f"Scaling curves written to {args.plot}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, results, args.threshold)
+        regressions = [r for r in rows if r['regression']]
+        print(f"\nCompared {len(rows)} timings against {args.compare} "
+              f"(commit {baseline.get('meta', {}).get('commit')}), threshold +{args.threshold:.0%}:")
+        for r in rows:
+            flag = "REGRESSION" if r['regression'] else "ok"
+            label = f"{r['param']}={r['size']}"
+            print(f"  {r['stage']:<26} {label:<20} {r['ratio']:6.2f}x  {flag}")
+        if regressions:
+            print(f"\n{len(regressions)} stage timing(s) regressed beyond the threshold.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+# FILE 15: booking_controls.py (Nested and Bid-Price Booking Controls)
+# Fast alternatives to the partitioned LP plan. Each control decides, per
+# booking request, which bucket (if any) to sell:
+#   - PartitionedControl: the static allocation_engine plan, first come
+#     first served (what simulation.py does by default).
+#   - EMSRbControl: nested booking limits from EMSR-b protection levels,
+#     O(buckets) to compute, no solver call.
+#   - BidPriceControl: accept if the fare covers the displacement cost of
+#     a seat, given the remaining capacity and remaining expected demand.
+#   - 'dp': the cheapest bucket covering the Lee-Hersh DP threshold,
+#     looked up per (day, seats left) (dynamic_programming.DPControl).
+
+import time
+import numpy as np
+from statistics import NormalDist
+import config
+from allocation_engine import POLICY_MINIMUMS
+from booking_curve_model import get_daily_arrival_fractions
+
+CONTROL_POLICIES = ['partitioned', 'emsr_b', 'bid_price', 'dp']
+
+_STANDARD_NORMAL = NormalDist()
+
+
+# --- EMSR-b ---
+def emsr_b_protection_levels(prices: list, means: list, sigmas: list) -> np.ndarray:
+    """
+    EMSR-b protection levels for a fare ladder sorted by ascending price.
+
+    Buckets above i are aggregated into one virtual class (summed mean,
+    summed variance, demand-weighted price) and protected against bucket i:
+        P(aggregate demand > y) = price_i / weighted_price
+
+    Returns:
+        (B,) array; protection[i] = seats held back from bucket i for the
+        more expensive buckets (protection[-1] = 0).
+    """
+    prices = np.asarray(prices, dtype=float)
+    means = np.asarray(means, dtype=float)
+    sigmas = np.asarray(sigmas, dtype=float)
+    protection = np.zeros(len(prices))
+
+    agg_mean = agg_revenue = agg_var = 0.0
+    for i in range(len(prices) - 1, 0, -1):
+        agg_mean += means[i]
+        agg_revenue += prices[i] * means[i]
+        agg_var += sigmas[i] ** 2
+        if agg_mean <= 0:
+            continue
+        ratio = prices[i - 1] / (agg_revenue / agg_mean)
+        if ratio >= 1.0:
+            continue # Cheaper bucket is worth as much: protect nothing
+        if agg_var == 0:
+            protection[i - 1] = agg_mean
+        else:
+            z = _STANDARD_NORMAL.inv_cdf(1.0 - ratio)
+            protection[i - 1] = max(agg_mean + z * agg_var ** 0.5, 0.0)
+    return protection
+
+
+def emsr_b_booking_limits(prices: list, means: list, sigmas: list, capacity: int) -> list:
+    """
+    Nested booking limits (ascending price order): bucket i is open while
+    the seats sold in the nest are below limits[i]. limits[-1] = capacity.
+    """
+    protection = emsr_b_protection_levels(prices, means, sigmas)
+    return [int(max(capacity - round(p), 0)) for p in protection]
+
+
+def _bucket_sigmas(forecast_data: dict) -> list:
+    """(Internal) Splits the quota's forecast sigma over its buckets at a common CV."""
+    demands = forecast_data['independent_bucket_demands']
+    total = forecast_data['total_demand']
+    cv = forecast_data.get('sigma', 0.0) / total if total > 0 else 0.0
+    return [d * cv for d in demands]
+
+
+def _n_buckets(tc: str, q_config: dict) -> int:
+    """(Internal) Number of buckets of a quota in class tc."""
+    return len(q_config['price_config'][tc]) if q_config['type'] == 'FLEXI' else 1
+
+
+def _bucket_caps(forecast_data: dict) -> list:
+    """(Internal) Forecast (independent) demand caps per bucket; the top bucket is uncapped."""
+    caps = [int(np.ceil(d)) for d in forecast_data['independent_bucket_demands']]
+    return caps[:-1] + [float('inf')]
+
+
+def _unmet_minimums(class_forecasts: dict, class_minimums: dict) -> dict:
+    """(Internal) Policy minimums of one class, capped at each quota's forecast demand."""
+    return {
+        q_code: min(minimum, int(np.ceil(class_forecasts[q_code]['total_demand'])))
+        for q_code, minimum in class_minimums.items()
+        if q_code in class_forecasts
+    }
+
+
+# --- Controls ---
+class PartitionedControl:
+    """Static partitioned plan: each bucket sells up to its own allocation."""
+
+    def __init__(self, final_bucket_allocations: dict):
+        self.limits = {
+            tc: {
+                q_code: [
+                    class_allocs.get(f"{q_code}_Bucket_{i}_Allocation", 0)
+                    for i in range(_n_buckets(tc, q_config))
+                ]
+                for q_code, q_config in config.QUOTA_CONFIG.items()
+            }
+            for tc, class_allocs in final_bucket_allocations.items()
+        }
+        self.sold = {tc: {q: [0] * len(l) for q, l in quotas.items()} for tc, quotas in self.limits.items()}
+
+    def select_bucket(self, tc: str, q_code: str, day: int):
+        """Returns the bucket index to sell, or None to reject."""
+        sold = self.sold[tc][q_code]
+        for i, limit in enumerate(self.limits[tc][q_code]):
+            if sold[i] < limit:
+                return i
+        return None
+
+    def record_sale(self, tc: str, q_code: str, bucket: int):
+        self.sold[tc][q_code][bucket] += 1
+
+
+class EMSRbControl:
+    """
+    Nested EMSR-b limits inside each quota. Seats are split between quotas
+    by the Master allocation; within a FLEXI quota, every bucket shares
+    the quota's seats, with protection for the more expensive buckets.
+    """
+
+    def __init__(self, all_quota_forecasts: dict, master_allocations: dict):
+        self.limits = {}
+        for tc, class_forecasts in all_quota_forecasts.items():
+            self.limits[tc] = {}
+            for q_code, forecast_data in class_forecasts.items():
+                quota_capacity = master_allocations[tc].get(f"{q_code}_Allocation", 0)
+                self.limits[tc][q_code] = emsr_b_booking_limits(
+                    forecast_data['prices'],
+                    forecast_data['independent_bucket_demands'],
+                    _bucket_sigmas(forecast_data),
+                    quota_capacity
+                )
+        self.sold = {tc: {q: 0 for q in quotas} for tc, quotas in self.limits.items()}
+
+    def select_bucket(self, tc: str, q_code: str, day: int):
+        """Cheapest open bucket, or None to reject."""
+        nest_sold = self.sold[tc][q_code]
+        for i, limit in enumerate(self.limits[tc][q_code]):
+            if nest_sold < limit:
+                return i
+        return None
+
+    def record_sale(self, tc: str, q_code: str, bucket: int):
+        self.sold[tc][q_code] += 1
+
+
+class BidPriceControl:
+    """
+    Dynamic bid prices over each class's whole capacity (no quota split).
+
+    The bid price for a remaining capacity C on day d is the fare of the
+    C-th most valuable seat of expected remaining demand (0 if remaining
+    demand does not fill C seats), i.e. the capacity dual of the
+    remaining-demand knapsack. A request gets the cheapest bucket whose
+    fare is at least the bid price and whose forecast (independent)
+    demand is not yet sold out; the top bucket has no such cap. Unmet
+    policy minimums of other quotas are held back.
+    """
+
+    def __init__(self, all_quota_forecasts: dict, capacity: dict = None, policy_minimums: dict = None):
+        capacity = capacity or config.CAPACITY
+        policy_minimums = POLICY_MINIMUMS if policy_minimums is None else policy_minimums
+        self.remaining = {tc: capacity[tc] for tc in all_quota_forecasts}
+        self.prices = {}
+        self.bucket_caps = {}
+        self.bucket_sold = {}
+        self.cumulative_demand = {}
+        self.sorted_prices = {}
+        self.unmet_minimums = {}
+
+        for tc, class_forecasts in all_quota_forecasts.items():
+            remaining_share = {
+                q_code: np.cumsum(get_daily_arrival_fractions(q_code, config.QUOTA_CONFIG[q_code], tc=tc))
+                for q_code in class_forecasts
+            }
+            product_prices, daily_demand = [], []
+            self.prices[tc] = {}
+            self.bucket_caps[tc] = {}
+            self.bucket_sold[tc] = {}
+            for q_code, forecast_data in class_forecasts.items():
+                self.prices[tc][q_code] = list(forecast_data['prices'])
+                self.bucket_caps[tc][q_code] = _bucket_caps(forecast_data)
+                self.bucket_sold[tc][q_code] = [0] * len(forecast_data['prices'])
+                for price, demand in zip(forecast_data['prices'], forecast_data['independent_bucket_demands']):
+                    product_prices.append(price)
+                    daily_demand.append(demand * remaining_share[q_code])
+            # Products sorted by price, most valuable first
+            order = np.argsort(product_prices, kind='stable')[::-1]
+            self.sorted_prices[tc] = np.asarray(product_prices, dtype=float)[order]
+            # cumulative_demand[tc][day] = running remaining demand over the sorted products
+            self.cumulative_demand[tc] = np.cumsum(np.asarray(daily_demand)[order].T, axis=1)
+            self.unmet_minimums[tc] = _unmet_minimums(class_forecasts, policy_minimums.get(tc, {}))
+
+    def bid_price(self, tc: str, day: int) -> float:
+        """Displacement cost of one seat in class tc at the start of `day`."""
+        idx = int(np.searchsorted(self.cumulative_demand[tc][day], self.remaining[tc], side='right'))
+        prices = self.sorted_prices[tc]
+        return float(prices[idx]) if idx < len(prices) else 0.0
+
+    def select_bucket(self, tc: str, q_code: str, day: int):
+        """Cheapest bucket priced at or above the bid price, or None to reject."""
+        held_back = sum(m for q, m in self.unmet_minimums[tc].items() if q != q_code)
+        if self.remaining[tc] - held_back <= 0:
+            return None
+        bid = self.bid_price(tc, day)
+        caps = self.bucket_caps[tc][q_code]
+        sold = self.bucket_sold[tc][q_code]
+        for i, price in enumerate(self.prices[tc][q_code]):
+            if price >= bid and sold[i] < caps[i]:
+                return i
+        return None
+
+    def record_sale(self, tc: str, q_code: str, bucket: int):
+        self.remaining[tc] -= 1
+        self.bucket_sold[tc][q_code][bucket] += 1
+        if self.unmet_minimums[tc].get(q_code, 0) > 0:
+            self.unmet_minimums[tc][q_code] -= 1
+
+
+def build_control(control_policy: str, all_quota_forecasts: dict,
+                  master_allocations: dict = None, final_bucket_allocations: dict = None):
+    """
+    Builds the booking control for a policy name in CONTROL_POLICIES.
+    'partitioned' needs final_bucket_allocations, 'emsr_b' needs master_allocations.
+    """
+    if control_policy == 'partitioned':
+        return PartitionedControl(final_bucket_allocations)
+    if control_policy == 'emsr_b':
+        return EMSRbControl(all_quota_forecasts, master_allocations)
+    if control_policy == 'bid_price':
+        return BidPriceControl(all_quota_forecasts)
+    if control_policy == 'dp':
+        # Imported here: dynamic_programming builds on this module
+        from dynamic_programming import DPControl
+        return DPControl(all_quota_forecasts)
+    raise ValueError(f"Unknown control policy '{control_policy}'. Options: {CONTROL_POLICIES}")
+
+
+def benchmark_controls(n_runs: int = 200, n_decisions: int = 100_000, seed: int = 42) -> dict:
+    """
+    Compares the control policies on identical scenarios (same seeds).
+
+    Returns:
+        {policy: {'mean_revenue', 'std_revenue', 'setup_time', 'decision_time'}}
+        setup_time is the mean per-run cost of building the control
+        (including the LPs for 'partitioned', the DP for 'dp'); decision_time is the mean
+        cost of one accept/reject decision.
+    """
+    # Imported here: simulation imports this module
+    from engine import get_quota_forecasts
+    from allocation_engine import partition_capacity_by_quota, partition_quota_into_buckets
+    from simulation import run_dynamic_simulation
+
+    report = {}
+    forecasts = get_quota_forecasts(stochastic_mode=True, rng=np.random.default_rng(seed))
+    for control_policy in CONTROL_POLICIES:
+        revenues = [
+            run_dynamic_simulation(stochastic_mode=True, quiet_mode=True,
+                                   rng=np.random.default_rng([seed, run]),
+                                   control_policy=control_policy)
+            for run in range(n_runs)
+        ]
+
+        # --- Setup cost: plan or control from one set of forecasts ---
+        n_setups = 50
+        start = time.perf_counter()
+        for _ in range(n_setups):
+            master = final = None
+            if control_policy in ('partitioned', 'emsr_b'):
+                master = {
+                    tc: partition_capacity_by_quota(forecasts[tc], config.CAPACITY[tc], tc, quiet_mode=True)
+                    for tc in config.TRAVEL_CLASSES
+                }
+            if control_policy == 'partitioned':
+                final = {tc: {} for tc in config.TRAVEL_CLASSES}
+                for tc in config.TRAVEL_CLASSES:
+                    for q_code, q_config in config.QUOTA_CONFIG.items():
+                        alloc = master[tc].get(f"{q_code}_Allocation", 0)
+                        if q_config['type'] == 'FLEXI' and alloc > 0:
+                            final[tc].update(partition_quota_into_buckets(
+                                forecasts[tc][q_code]['independent_bucket_demands'],
+                                forecasts[tc][q_code]['prices'], alloc, q_code, quiet_mode=True
+                            ))
+                        else:
+                            final[tc][f"{q_code}_Bucket_0_Allocation"] = alloc
+            control = build_control(control_policy, forecasts, master, final)
+        setup_time = (time.perf_counter() - start) / n_setups
+
+        # --- Decision cost: a stream of GN requests, never recorded as sales ---
+        start = time.perf_counter()
+        for k in range(n_decisions):
+            control.select_bucket('3AC', 'GN', 1 + k % config.BOOKING_WINDOW_DAYS)
+        decision_time = (time.perf_counter() - start) / n_decisions
+
+        report[control_policy] = {
+            'mean_revenue': float(np.mean(revenues)),
+            'std_revenue': float(np.std(revenues)),
+            'setup_time': setup_time,
+            'decision_time': decision_time
+        }
+    return report
+
+
+# This block runs the policy benchmark from the command line
+if __name__ == "__main__":
+    results = benchmark_controls()
+    print(f"{'Policy':<12} {'Mean revenue':>14} {'Std':>10} {'Setup':>10} {'Per decision':>14}")
+    for control_policy, r in results.items():
+        mean, std = f"₹{r['mean_revenue']:,.0f}", f"₹{r['std_revenue']:,.0f}"
+        print(f"{control_policy:<12} {mean:>14} {std:>10} "
+              f"{r['setup_time'] * 1e6:>8.0f}µs {r['decision_time'] * 1e6:>12.2f}µs")
@@ -1,84 +1,217 @@
 # FILE 6: booking_curve_model.py (FIXED & UPDATED)
 # This file defines the booking pick-up curve logic for different quotas.
+#
+# (UPDATED) Curves live in a registry that maps each quota (optionally
+# per travel class) to a curve spec, and each spec to a NumPy array of
+# daily arrival fractions, computed once and cached. A spec is a dict
+# naming a parametric family plus its parameters, e.g.
+#     {'family': 'power', 'exponent': 0.5}
+# The spec of a quota is looked up in this order:
+#     1. register_curve(q_code, spec, tc=tc)   per-class override
+#     2. register_curve(q_code, spec)          quota override
+#     3. config.QUOTA_CONFIG[q_code]['booking_curve']
+#     4. DEFAULT_CURVES[q_code], else DEFAULT_CURVE
+# so a new quota (e.g. Premium Tatkal) only needs a QUOTA_CONFIG entry.
 
+import inspect
 import numpy as np
+import config
 from config import BOOKING_WINDOW_DAYS
 
-def _generate_general_pickup_curve(window_days: int) -> dict:
+
+# --- Curve families ---
+# Each family returns the cumulative share of demand booked by the *start*
+# of each day: cumulative[d] for d = 0 .. W, with W the quota's booking
+# window (days before departure it opens), cumulative[W] = 0 and
+# cumulative[0] = 1. The share arriving on day d is
+# cumulative[d - 1] - cumulative[d].
+def _power_cumulative(window: int, exponent: float = 0.5) -> np.ndarray:
     """
-    (Internal) Simulates a non-linear "square root" pick-up curve
-    for the General Quota (GN).
-    
-    Returns:
-        A dict where:
-        - key = day (e.g., 120, 119, ... 1)
-        - value = cumulative % of tickets *sold* by the *start* of that day.
+    Non-linear pick-up: the share still to book at the start of day d is
+    (d / W) ** exponent. exponent = 0.5 is the "square root" curve of the
+    General Quota (GN); exponent = 1 is uniform.
+    """
+    days = np.arange(window + 1)
+    return 1.0 - (days / float(window)) ** exponent
+
+
+def _bimodal_cumulative(window: int, early_days: int = 30, late_days: int = 15,
+                        early_share: float = 0.5) -> np.ndarray:
+    """
+    "Bimodal" (U-shaped) pick-up, as for the Ladies Quota (LD):
+    early_share books linearly in the first early_days of the window,
+    the rest linearly in the last late_days, nothing in between.
+    """
+    days = np.arange(window + 1)
+    late_share = 1.0 - early_share
+    return np.where(
+        days > window - early_days,
+        (window - days) / early_days * early_share,                  # Early period
+        np.where(days <= late_days,
+                 early_share + (late_days - days) / late_days * late_share, # Late period
+                 early_share)                                          # Middle: hold
+    )
+
+
+def _opening_day_cumulative(window: int) -> np.ndarray:
+    """All demand arrives on the day the quota opens (e.g. Tatkal)."""
+    cumulative = np.ones(window + 1)
+    cumulative[window] = 0.0
+    return cumulative
+
+
+def _empirical_cumulative(window: int, fractions) -> np.ndarray:
+    """
+    A tabulated curve: fractions[d] = share of demand arriving on day d
+    (index 0 unused), e.g. fitted from booking records. Days beyond the
+    window are dropped and the rest renormalised.
+    """
+    daily = np.zeros(window + 1)
+    fractions = np.asarray(fractions, dtype=float)
+    n = min(len(fractions), window + 1)
+    daily[1:n] = fractions[1:n]
+    total = daily.sum()
+    if total <= 0:
+        return _opening_day_cumulative(window)
+    # cumulative[d] = share arriving before day d, i.e. on days > d
+    return np.concatenate([np.cumsum(daily[::-1])[::-1][1:], [0.0]]) / total
+
+
+CURVE_FAMILIES = {
+    'power': _power_cumulative,
+    'bimodal': _bimodal_cumulative,
+    'opening_day': _opening_day_cumulative,
+    'empirical': _empirical_cumulative,
+}
+
+DEFAULT_CURVES = {
+    'GN': {'family': 'power', 'exponent': 0.5},
+    'LD': {'family': 'bimodal', 'early_days': 30, 'late_days': 15, 'early_share': 0.5},
+    'TK': {'family': 'opening_day'},
+}
+DEFAULT_CURVE = {'family': 'power', 'exponent': 0.5} # Quotas without a curve of their own
+
+
+def validate_curve_spec(spec: dict):
     """
+    Checks a curve spec against its family's signature, so a bad spec
+    fails when it is registered rather than when a curve is first drawn.
 
-    curve = {}
-    gn_window_len = float(window_days)
-    
-    for day in range(window_days, 0, -1):
-        days_remaining_gn = day
-        percent_remaining = (days_remaining_gn / gn_window_len) ** 0.5
-        percent_sold = 1.0 - percent_remaining
-        curve[day] = percent_sold
+    Raises:
+        ValueError: unknown family, unknown or missing parameters, or
+        empirical fractions that are not a non-empty 1-D array of
+        non-negative numbers.
+    """
+    family = spec.get('family')
+    if family not in CURVE_FAMILIES:
+        raise ValueError(f"Unknown curve family '{family}'. Options: {list(CURVE_FAMILIES)}")
+    params = {name for name in spec if name != 'family'}
+    signature = inspect.signature(CURVE_FAMILIES[family]).parameters
+    accepted = set(signature) - {'window'}
+    required = {name for name in accepted if signature[name].default is inspect.Parameter.empty}
+    if params - accepted:
+        raise ValueError(f"Curve family '{family}' got unknown parameters {sorted(params - accepted)}; "
+                         f"accepted: {sorted(accepted)}")
+    if required - params:
+        raise ValueError(f"Curve family '{family}' is missing required parameters {sorted(required - params)}")
+    if family == 'empirical':
+        fractions = np.asarray(spec['fractions'], dtype=float)
+        if fractions.ndim != 1 or fractions.size == 0:
+            raise ValueError(f"Empirical 'fractions' must be a non-empty 1-D sequence, got shape {fractions.shape}")
+        if not np.all(np.isfinite(fractions)) or np.any(fractions < 0):
+            raise ValueError("Empirical 'fractions' must be finite and non-negative")
+
+
+def _spec_key(spec: dict) -> tuple:
+    """(Internal) Hashable form of a curve spec."""
+    return tuple(sorted(
+        (name, tuple(np.asarray(value, dtype=float).ravel()) if np.ndim(value) else value)
+        for name, value in spec.items()
+    ))
+
+
+class CurveRegistry:
+    """Resolves curve specs and caches their daily fraction arrays."""
+
+    def __init__(self):
+        self.overrides = {} # (q_code, tc or None) -> spec
+        self._cache = {}
+
+    def register_curve(self, q_code: str, spec: dict, tc: str = None):
+        """Sets the curve of a quota, for every class or (with tc) one class."""
+        validate_curve_spec(spec)
+        self.overrides[(q_code, tc)] = dict(spec)
+
+    def unregister_curve(self, q_code: str, tc: str = None):
+        self.overrides.pop((q_code, tc), None)
+
+    def clear_cache(self):
+        self._cache.clear()
 
-    curve[window_days] = 0.0 
-    return curve
+    def fingerprint(self) -> list:
+        """The registered overrides in a stable, hashable form (for cache keys)."""
+        return sorted(
+            ((q_code, tc or ''), _spec_key(spec)) for (q_code, tc), spec in self.overrides.items()
+        )
 
-def _generate_ladies_pickup_curve(window_days: int) -> dict:
+    def curve_spec(self, q_code: str, tc: str = None, q_config: dict = None) -> dict:
+        q_config = q_config if q_config is not None else config.QUOTA_CONFIG.get(q_code, {})
+        for key in ((q_code, tc), (q_code, None)):
+            if key in self.overrides:
+                return self.overrides[key]
+        if 'booking_curve' in q_config:
+            return q_config['booking_curve']
+        return DEFAULT_CURVES.get(q_code, DEFAULT_CURVE)
+
+    def daily_fractions(self, q_code: str, tc: str = None, q_config: dict = None,
+                        window_days: int = BOOKING_WINDOW_DAYS) -> np.ndarray:
+        """
+        Share of the quota's total demand arriving on each day.
+
+        Returns:
+            A read-only array of length window_days + 1, indexed by day
+            (index 0 unused), zero before the quota opens.
+        """
+        q_config = q_config if q_config is not None else config.QUOTA_CONFIG[q_code]
+        spec = self.curve_spec(q_code, tc, q_config)
+        window = min(q_config['booking_window_open'], window_days)
+        key = (_spec_key(spec), window, window_days)
+        if key not in self._cache:
+            params = {name: value for name, value in spec.items() if name != 'family'}
+            cumulative = CURVE_FAMILIES[spec['family']](window, **params)
+            fractions = np.zeros(window_days + 1)
+            fractions[1:window + 1] = cumulative[:-1] - cumulative[1:]
+            fractions.setflags(write=False)
+            self._cache[key] = fractions
+        return self._cache[key]
+
+    def class_daily_fractions(self, tc: str, quota_config: dict = None,
+                              window_days: int = BOOKING_WINDOW_DAYS) -> np.ndarray:
+        """
+        Daily fractions of every quota of a class as one matrix:
+        (window_days + 1, n_quotas), columns in quota_config order. Daily
+        arrival rates are then fractions * total_demands in one operation.
+        """
+        quota_config = quota_config or config.QUOTA_CONFIG
+        return np.column_stack([
+            self.daily_fractions(q_code, tc, q_config, window_days)
+            for q_code, q_config in quota_config.items()
+        ])
+
+
+# --- The process-wide registry ---
+REGISTRY = CurveRegistry()
+register_curve = REGISTRY.register_curve
+
+
+def get_daily_arrival_fractions(q_code: str, q_config: dict,
+                                window_days: int = BOOKING_WINDOW_DAYS,
+                                tc: str = None) -> np.ndarray:
     """
-    Simulates a "bimodal" (U-shaped) pick-up curve
-    for the Ladies Quota (LD).
-    
-    Assumes:
-    - 50% of demand books in the first 30 days (Days 120-91)
-    - 50% of demand books in the last 15 days (Days 15-1)
+    Returns the share of a quota's total demand that arrives on each day.
+
+    Returns:
+        A read-only array of length window_days + 1, indexed by day
+        (index 0 is unused), from the curve registry.
     """
-    curve = {}
-    
-    # Define booking periods
-    EARLY_PERIOD_DAYS = 30  # Days 120 down to 91
-    LATE_PERIOD_DAYS = 15   # Days 15 down to 1
-    
-    total_early_sold = 0.50
-    total_late_sold = 0.50
-
-    for day in range(window_days, 0, -1):
-        percent_sold = 0.0
-        
-        if day > (window_days - EARLY_PERIOD_DAYS):
-            # --- Early Period (e.g., Day 120 to 91) ---
-            # Linear ramp-up during this period
-            days_into_window = window_days - day
-            percent_sold = (days_into_window / EARLY_PERIOD_DAYS) * total_early_sold
-        
-        elif day <= LATE_PERIOD_DAYS:
-            # --- Late Period (e.g., Day 15 to 1) ---
-            # We already sold 50% (total_early_sold)
-            # Now, sell the remaining 50%
-            days_remaining = day
-            # We use (LATE_PERIOD_DAYS - days_remaining) to get days *into* the late period
-            days_into_late_period = LATE_PERIOD_DAYS - days_remaining
-            percent_sold_in_late_period = (days_into_late_period / LATE_PERIOD_DAYS) * total_late_sold
-            percent_sold = total_early_sold + percent_sold_in_late_period
-        
-        else:
-            # --- Middle Period (e.g., Day 90 to 16) ---
-            # No new bookings, hold at 50%
-            percent_sold = total_early_sold
-
-        curve[day] = percent_sold
-
-    # At the start of Day 120, 0% are sold.
-    curve[window_days] = 0.0
-    
-    # At the start of Day 0 (end of Day 1), 100% are sold.
-    curve[0] = 1.0 
-    
-    return curve
-
-# --- Initialize the pick-up curves globally ---
-GENERAL_PICKUP_CURVE = _generate_general_pickup_curve(BOOKING_WINDOW_DAYS)
-LADIES_PICKUP_CURVE = _generate_ladies_pickup_curve(BOOKING_WINDOW_DAYS)
\ No newline at end of file
+    return REGISTRY.daily_fractions(q_code, tc, q_config, window_days)
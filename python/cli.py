@@ -0,0 +1,202 @@
+# FILE 18: cli.py (Headless Command-Line Runner)
+# Runs the Monte Carlo analysis without the Streamlit UI, for batch and
+# scheduled jobs. Only the standard library is imported before the
+# arguments are parsed; NumPy and the pipeline modules are imported when
+# a run actually starts, and optional libraries (pyarrow / pandas for
+# Parquet output) only on the paths that need them.
+#
+# Examples:
+#   python python/cli.py --runs 1000 --seed 42 --workers 4 --output results.json
+#   python python/cli.py --policy bid_price --output results.parquet
+#   python python/cli.py --profile-startup
+#   python python/cli.py --runs 200 --trace trace.json
+#   python python/cli.py --seed 42 --target-ci-rel 0.005 --runs 20000
+
+import argparse
+import json
+import sys
+import time
+
+# Must match booking_controls.CONTROL_POLICIES (not imported: it pulls in NumPy)
+POLICIES = ['partitioned', 'emsr_b', 'bid_price', 'dp']
+DEFAULT_RUNS = 100 # --runs without an adaptive target
+
+# Pipeline modules in dependency order, for --profile-startup
+STARTUP_MODULES = [
+    'numpy', 'config', 'unconstraining', 'factor_calculator', 'forecasting',
+    'booking_curve_model', 'allocation_engine', 'engine', 'booking_controls',
+    'simulation', 'streaming_stats', 'main'
+]
+HEAVY_LIBRARIES = ['numpy', 'scipy', 'pandas', 'pulp', 'matplotlib', 'highspy', 'pyarrow', 'streamlit']
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Run the railway revenue-management Monte Carlo analysis headlessly."
+    )
+    parser.add_argument('--runs', type=int, default=None,
+                        help="Total runs, including the deterministic baseline (default: 100). "
+                             "In adaptive mode, the maximum number of runs (default: main.MAX_ADAPTIVE_RUNS).")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Root seed; the same seed and runs give identical results for any --workers.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for the stochastic runs (default: 1).")
+    parser.add_argument('--policy', choices=POLICIES, default='partitioned',
+                        help="Booking control policy (default: partitioned).")
+    parser.add_argument('--target-ci-abs', type=float, default=None,
+                        help="Adaptive mode: stop once the CI half-width of the mean revenue is below this many ₹.")
+    parser.add_argument('--target-ci-rel', type=float, default=None,
+                        help="Adaptive mode: stop once the CI half-width is this fraction of the mean.")
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help="Adaptive mode: stop after this many seconds.")
+    parser.add_argument('--output', default=None,
+                        help="Write results to this file (.json or .parquet).")
+    parser.add_argument('--format', choices=['json', 'parquet'], default=None,
+                        help="Output format (default: from the --output extension).")
+    parser.add_argument('--include-log', action='store_true',
+                        help="Include the deterministic run's log in JSON output.")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Only print the final summary.")
+    parser.add_argument('--log-jsonl', default=None,
+                        help="Append the pipeline's structured log events to this JSON-lines file.")
+    parser.add_argument('--trace', default=None,
+                        help="Record per-stage timings and counters, print them and write a "
+                             "Chrome trace to this file (runs in worker processes are not recorded).")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Report the import cost of each pipeline module and exit.")
+    return parser
+
+
+def profile_startup() -> dict:
+    """
+    Imports the pipeline module by module and times each step. Each
+    time only includes modules that were not already loaded.
+
+    Returns:
+        {'modules': [(name, seconds)], 'total': seconds, 'heavy_loaded': [names]}
+    """
+    import importlib
+    timings = []
+    start_total = time.perf_counter()
+    for name in STARTUP_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings.append((name, time.perf_counter() - start))
+    return {
+        'modules': timings,
+        'total': time.perf_counter() - start_total,
+        'heavy_loaded': [lib for lib in HEAVY_LIBRARIES if lib in sys.modules]
+    }
+
+
+def results_to_record(results: dict, include_log: bool = False) -> dict:
+    """Flattens the run_analysis() results into JSON-serialisable values."""
+    record = {}
+    for key, value in results.items():
+        if key == 'revenue_stats' or (key == 'deterministic_log' and not include_log):
+            continue
+        if key == 'histogram':
+            record['histogram_edges'] = [float(v) for v in value['edges']]
+            record['histogram_counts'] = [int(v) for v in value['counts']]
+        elif hasattr(value, 'item'): # NumPy scalar
+            record[key] = value.item()
+        else:
+            record[key] = value
+    # Entropy can exceed 64 bits; keep it exact
+    record['seed'] = str(record.get('seed'))
+    return record
+
+
+def resolve_parquet_engine() -> str:
+    """
+    Finds a Parquet writer without importing it, so a missing engine is
+    reported before the simulation runs rather than after.
+
+    Returns:
+        'pyarrow', or 'fastparquet' (written through pandas).
+    """
+    from importlib.util import find_spec
+    if find_spec('pyarrow') is not None:
+        return 'pyarrow'
+    if find_spec('pandas') is not None and find_spec('fastparquet') is not None:
+        return 'fastparquet'
+    raise SystemExit("Parquet output needs pyarrow (or pandas with fastparquet); use --format json instead")
+
+
+def write_output(record: dict, path: str, fmt: str, parquet_engine: str = None):
+    """Writes one result record as JSON or a one-row Parquet table."""
+    if fmt == 'json':
+        with open(path, 'w') as f:
+            json.dump(record, f, indent=2)
+        return
+    engine = parquet_engine or resolve_parquet_engine()
+    if engine == 'pyarrow':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.Table.from_pylist([record]), path)
+    else:
+        import pandas as pd
+        pd.DataFrame([record]).to_parquet(path, engine=engine)
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.profile_startup:
+        report = profile_startup()
+        for name, seconds in report['modules']:
+            print(f"  {name:<22} {seconds * 1000:8.1f} ms")
+        print(f"  {'total':<22} {report['total'] * 1000:8.1f} ms")
+        print(f"Heavy libraries loaded: {', '.join(report['heavy_loaded']) or 'none'}")
+        return 0
+
+    fmt = args.format
+    if args.output and fmt is None:
+        fmt = 'parquet' if args.output.endswith('.parquet') else 'json'
+    parquet_engine = resolve_parquet_engine() if args.output and fmt == 'parquet' else None
+
+    # Heavy imports start here
+    import contextlib
+    import event_log
+    import instrumentation
+    from main import run_analysis
+
+    log_sink = event_log.add_sink(event_log.JsonLinesSink(args.log_jsonl)) if args.log_jsonl else None
+    try:
+        adaptive = any(v is not None for v in (args.target_ci_abs, args.target_ci_rel, args.time_budget))
+        run_args = {'max_runs': args.runs} if adaptive else {'n_simulations': args.runs or DEFAULT_RUNS}
+
+        final_results = None
+        with (instrumentation.recording() if args.trace else contextlib.nullcontext()) as recorder:
+            for status in run_analysis(seed=args.seed,
+                                       n_workers=args.workers,
+                                       target_ci_abs=args.target_ci_abs,
+                                       target_ci_rel=args.target_ci_rel,
+                                       time_budget=args.time_budget,
+                                       control_policy=args.policy,
+                                       **run_args):
+                if isinstance(status, dict):
+                    final_results = status
+                elif not args.quiet:
+                    print(status)
+
+        record = results_to_record(final_results, include_log=args.include_log)
+        print(f"Policy: {args.policy}  Runs: {record['n_simulations']}  "
+              f"Mean revenue: ₹{record['mean_revenue']:,.0f} ± ₹{record['ci_half_width']:,.0f}  "
+              f"({record['elapsed_seconds']:.2f}s, seed {record['seed']})")
+        if args.output:
+            write_output(record, args.output, fmt, parquet_engine)
+            print(f"Results written to {args.output}")
+        if args.trace:
+            print(recorder.format_report())
+            recorder.write_chrome_trace(args.trace)
+            print(f"Chrome trace written to {args.trace}")
+    finally:
+        if log_sink is not None:
+            event_log.remove_sink(log_sink)
+            log_sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -83,4 +83,10 @@ DETAILED_HISTORICAL_DATA = {
         {'train_id': 5, 'total_sold': 15, 'days_early': 1,  'is_holiday': False, 'day_of_week': 'Tue', 'quota': 'TK'},
         {'train_id': 6, 'total_sold': 10, 'days_early': 1,  'is_holiday': False, 'day_of_week': 'Fri', 'quota': 'LD'},
     ]
-}
\ No newline at end of file
+}
+
+# --- (NEW) On-Disk History Store ---
+# Path of a columnar store written by history_store.write_history_store().
+# When set, forecasting reads the memory-mapped store instead of
+# DETAILED_HISTORICAL_DATA, which then only serves as a small built-in fixture.
+HISTORY_STORE_PATH = None
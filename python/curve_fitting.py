@@ -0,0 +1,272 @@
+# FILE 23: curve_fitting.py (Booking Curves Fitted from Booking Records)
+# Estimates each (class, quota) pick-up curve from individual booking
+# records (days before departure of each booking), replacing the
+# hand-coded shapes in booking_curve_model:
+#   1. One bincount over (group, day) builds every group's histogram.
+#   2. Gaussian smoothing along the day axis, vectorized over groups and
+#      renormalised inside each quota's booking window. The bandwidth
+#      shrinks as 1 / sqrt(records per day), like the histogram's noise,
+#      so well-sampled groups keep sharp features (e.g. the late GN spike).
+#   3. Optionally, a least-squares fit of the 'power' family
+#      (share still to book at the start of day d = (d / W) ** exponent),
+#      in log space, for all groups at once.
+# Results are cached on disk, keyed on a hash of the records and the
+# fitting parameters, so a nightly refresh only refits when data changed.
+
+import os
+import time
+import hashlib
+import numpy as np
+import config
+import event_log
+from booking_curve_model import REGISTRY, get_daily_arrival_fractions
+
+CURVE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'orbit', 'booking_curves')
+DEFAULT_SMOOTHING = 2.0 # Gaussian kernel sigma in days for sparse groups (0 = no smoothing)
+SMOOTHING_REFERENCE = 10 # Records per day at (and below) which the full sigma applies
+
+
+def _encode(values, categories: list = None) -> tuple:
+    """(Internal) Category codes and categories of a column (codes pass through)."""
+    if categories is not None:
+        return np.asarray(values, dtype=np.int64), [str(c) for c in categories]
+    categories, codes = np.unique(np.asarray(values).astype(str), return_inverse=True)
+    return codes.astype(np.int64), categories.tolist()
+
+
+def _data_hash(group: np.ndarray, days: np.ndarray, labels: list, params: dict) -> str:
+    """(Internal) Content hash of the encoded records and fitting parameters."""
+    digest = hashlib.sha256()
+    digest.update(repr((labels, sorted(params.items()))).encode('utf-8'))
+    digest.update(np.ascontiguousarray(group, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(days, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def _smooth_rows(counts: np.ndarray, inside: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+    """
+    (Internal) Gaussian smoothing of each row (with its own sigma), using
+    only the days marked inside (the quota's window); weights are
+    renormalised at the edges so no mass leaks outside the window.
+    """
+    values = counts * inside
+    if sigma.max() <= 0:
+        return values
+    radius = int(np.ceil(3 * sigma.max()))
+    mask = inside.astype(float)
+    smoothed = np.zeros_like(values)
+    weight = np.zeros_like(values)
+    safe_sigma = np.maximum(sigma, 1e-6)[:, None]
+    for offset in range(-radius, radius + 1):
+        w = np.exp(-0.5 * (offset / safe_sigma) ** 2)
+        lo, hi = max(0, offset), values.shape[1] + min(0, offset)
+        smoothed[:, lo:hi] += w * values[:, lo - offset:hi - offset]
+        weight[:, lo:hi] += w * mask[:, lo - offset:hi - offset]
+    return np.where(inside, smoothed / np.maximum(weight, 1e-12), 0.0)
+
+
+def _fit_power_exponents(fractions: np.ndarray, windows: np.ndarray) -> tuple:
+    """
+    (Internal) Least-squares power exponent per row, in log space:
+    log R(d) = k * log(d / W), with R(d) the share booked on day d or
+    later-in-time (i.e. with d or fewer days to go).
+
+    Returns:
+        (exponent (G,), rmse (G,) of the fitted daily fractions)
+    """
+    n_groups, width = fractions.shape
+    days = np.arange(width)[None, :]
+    W = windows[:, None].astype(float)
+    remaining = np.cumsum(fractions, axis=1) # R(d) = sum over days 1..d
+    usable = (days >= 1) & (days < W) & (remaining > 0)
+    x = np.where(usable, np.log(np.maximum(days, 1) / W), 0.0)
+    y = np.where(usable, np.log(np.maximum(remaining, 1e-300)), 0.0)
+    sxx = (x * x).sum(axis=1)
+    exponent = np.where(sxx > 0, (x * y).sum(axis=1) / np.maximum(sxx, 1e-300), 1.0)
+
+    # Fitted daily fractions: ((d / W) ** k) - (((d - 1) / W) ** k) inside the window
+    inside = (days >= 1) & (days <= W)
+    share = np.clip(days / W, 0.0, 1.0) ** exponent[:, None]
+    fitted = np.where(inside, share - np.clip((days - 1) / W, 0.0, 1.0) ** exponent[:, None], 0.0)
+    rmse = np.sqrt((((fitted - fractions) ** 2) * inside).sum(axis=1) / np.maximum(inside.sum(axis=1), 1))
+    return exponent, rmse
+
+
+def fit_booking_curves(travel_class, quota, days_before,
+                       class_categories: list = None,
+                       quota_categories: list = None,
+                       smoothing: float = DEFAULT_SMOOTHING,
+                       fit_power: bool = True,
+                       window_days: int = config.BOOKING_WINDOW_DAYS,
+                       cache_dir: str = CURVE_CACHE_DIR,
+                       quiet: bool = True) -> dict:
+    """
+    Fits the daily arrival curve of every (class, quota) in the records.
+
+    Args:
+        travel_class, quota: Per-booking labels (strings), or integer codes
+                             with class_categories / quota_categories (much
+                             faster for millions of records).
+        days_before: Days before departure of each booking; clipped to
+                     1 .. the quota's booking window.
+        smoothing: Gaussian sigma in days for groups with up to
+                   SMOOTHING_REFERENCE records per day, shrinking as
+                   1 / sqrt(records per day) above that (0 = raw histogram).
+        fit_power: Also fit the 'power' family by least squares.
+        cache_dir: Directory for cached fits (None = no caching).
+
+    Returns:
+        {(tc, q_code): {'fractions': (window_days + 1,) daily shares (index 0 unused),
+                        'n_records': int, 'window': int,
+                        'exponent': float, 'rmse': float}}  (last two if fit_power)
+    """
+    class_codes, classes = _encode(travel_class, class_categories)
+    quota_codes, quotas = _encode(quota, quota_categories)
+    days = np.asarray(days_before, dtype=np.int64)
+    group = class_codes * len(quotas) + quota_codes
+
+    params = {'smoothing': float(smoothing), 'reference': SMOOTHING_REFERENCE, 'fit_power': bool(fit_power), 'window_days': int(window_days),
+              'windows': {q: config.QUOTA_CONFIG[q]['booking_window_open'] for q in quotas if q in config.QUOTA_CONFIG}}
+    cache_path = None
+    if cache_dir:
+        key = _data_hash(group, days, [classes, quotas], params)
+        cache_path = os.path.join(cache_dir, f"{key}.npz")
+        if os.path.exists(cache_path):
+            if not quiet:
+                event_log.info('curves', "Booking curves loaded from cache ({})", key[:12])
+            return _load_fits(cache_path)
+
+    start = time.perf_counter()
+    n_groups = len(classes) * len(quotas)
+    width = window_days + 1
+    quota_windows = np.asarray([
+        min(config.QUOTA_CONFIG[q]['booking_window_open'], window_days) if q in config.QUOTA_CONFIG else window_days
+        for q in quotas
+    ])
+    windows = np.tile(quota_windows, len(classes)) # Per group (class-major)
+    days = np.clip(days, 1, windows[group])
+
+    counts = np.bincount(group * width + days, minlength=n_groups * width).reshape(n_groups, width).astype(float)
+    n_records = counts.sum(axis=1)
+    inside = (np.arange(width)[None, :] >= 1) & (np.arange(width)[None, :] <= windows[:, None])
+    records_per_day = n_records / np.maximum(windows, 1)
+    sigma = smoothing * np.minimum(1.0, np.sqrt(SMOOTHING_REFERENCE / np.maximum(records_per_day, 1e-12)))
+    smoothed = _smooth_rows(counts, inside, sigma)
+    fractions = smoothed / np.maximum(smoothed.sum(axis=1, keepdims=True), 1e-12)
+
+    labels = [(tc, q) for tc in classes for q in quotas]
+    fits = {'labels': labels, 'fractions': fractions, 'n_records': n_records, 'windows': windows}
+    if fit_power:
+        # Fitted on the raw histogram: smoothing would bias the curve's ends
+        raw = counts / np.maximum(n_records[:, None], 1)
+        fits['exponent'], fits['rmse'] = _fit_power_exponents(raw, windows)
+
+    if not quiet:
+        event_log.info('curves', "Fitted {} booking curves from {:,} records in {:.2f}s",
+                       int((n_records > 0).sum()), len(days), time.perf_counter() - start)
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        _save_fits(cache_path, fits)
+    return _fits_to_dict(fits)
+
+
+# --- Disk cache ---
+def _save_fits(path: str, fits: dict):
+    arrays = {name: value for name, value in fits.items() if name != 'labels'}
+    arrays['label_tc'] = np.asarray([tc for tc, _ in fits['labels']])
+    arrays['label_quota'] = np.asarray([q for _, q in fits['labels']])
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path) # Atomic: concurrent readers never see half a file
+
+
+def _load_fits(path: str) -> dict:
+    with np.load(path) as data:
+        fits = {name: data[name] for name in data.files}
+    fits['labels'] = list(zip(fits.pop('label_tc').tolist(), fits.pop('label_quota').tolist()))
+    return _fits_to_dict(fits)
+
+
+def _fits_to_dict(fits: dict) -> dict:
+    """(Internal) Per-group result dict; groups without records are left out."""
+    result = {}
+    for i, (tc, q_code) in enumerate(fits['labels']):
+        if fits['n_records'][i] <= 0:
+            continue
+        entry = {
+            'fractions': fits['fractions'][i],
+            'n_records': int(fits['n_records'][i]),
+            'window': int(fits['windows'][i])
+        }
+        if 'exponent' in fits:
+            entry['exponent'] = float(fits['exponent'][i])
+            entry['rmse'] = float(fits['rmse'][i])
+        result[(tc, q_code)] = entry
+    return result
+
+
+# --- Registry ---
+def register_fitted_curves(fits: dict, family: str = 'empirical', min_records: int = 100,
+                           registry=REGISTRY) -> list:
+    """
+    Registers fitted curves as per-class overrides in the curve registry.
+
+    Args:
+        family: 'empirical' (smoothed histogram) or 'power' (fitted exponent).
+        min_records: Groups with fewer records keep their current curve.
+
+    Returns:
+        The (tc, q_code) pairs that were registered.
+    """
+    if family not in ('empirical', 'power'):
+        raise ValueError(f"Unknown fitted family '{family}'. Options: ['empirical', 'power']")
+    registered = []
+    for (tc, q_code), fit in fits.items():
+        if fit['n_records'] < min_records:
+            continue
+        if family == 'power':
+            if 'exponent' not in fit:
+                raise ValueError("Power curves need fit_booking_curves(..., fit_power=True)")
+            spec = {'family': 'power', 'exponent': fit['exponent']}
+        else:
+            spec = {'family': 'empirical', 'fractions': fit['fractions']}
+        registry.register_curve(q_code, spec, tc=tc)
+        registered.append((tc, q_code))
+    return registered
+
+
+def make_synthetic_bookings(n_records: int, seed=None) -> dict:
+    """Booking records (as codes) drawn from the current registry curves, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    classes, quotas = list(config.TRAVEL_CLASSES), list(config.QUOTA_CONFIG)
+    class_codes = rng.integers(0, len(classes), size=n_records)
+    quota_codes = rng.integers(0, len(quotas), size=n_records)
+    days = np.zeros(n_records, dtype=np.int64)
+    for q, q_code in enumerate(quotas):
+        fractions = get_daily_arrival_fractions(q_code, config.QUOTA_CONFIG[q_code])
+        rows = quota_codes == q
+        days[rows] = rng.choice(len(fractions), size=int(rows.sum()), p=fractions / fractions.sum())
+    return {
+        'travel_class': class_codes, 'class_categories': classes,
+        'quota': quota_codes, 'quota_categories': quotas,
+        'days_before': days
+    }
+
+
+# This block benchmarks the fitter from the command line
+if __name__ == "__main__":
+    import tempfile
+    n_records = 5_000_000
+    bookings = make_synthetic_bookings(n_records, seed=42)
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ('Cold fit', 'Cached'):
+            start = time.perf_counter()
+            fits = fit_booking_curves(bookings['travel_class'], bookings['quota'], bookings['days_before'],
+                                      class_categories=bookings['class_categories'],
+                                      quota_categories=bookings['quota_categories'],
+                                      cache_dir=tmp)
+            print(f"{label + ':':<10} {time.perf_counter() - start:.2f}s for {n_records:,} records")
+
+    print(f"\n{'Class':<6} {'Quota':<6} {'Records':>10} {'Exponent':>9} {'RMSE':>9}")
+    for (tc, q_code), fit in sorted(fits.items()):
+        print(f"{tc:<6} {q_code:<6} {fit['n_records']:>10,} {fit['exponent']:>9.3f} {fit['rmse']:>9.5f}")
@@ -0,0 +1,208 @@
+# FILE 16: dynamic_programming.py (Lee-Hersh Dynamic Programming Policy)
+# Exact single-class DP over (time, remaining seats) for the
+# independent-demand model: each day is split into sub-periods short
+# enough for at most one request per sub-period, and a request for
+# product j (quota x bucket) is accepted iff its fare covers the
+# opportunity cost of the seat:
+#     V_t(x) = V_t+1(x) + sum_j p_j * max(f_j - (V_t+1(x) - V_t+1(x-1)), 0)
+# The recursion is vectorized over the seat dimension.
+
+import time
+import numpy as np
+import config
+from booking_curve_model import get_daily_arrival_fractions
+from allocation_engine import POLICY_MINIMUMS
+from booking_controls import _bucket_caps, _unmet_minimums
+
+MAX_ARRIVAL_PROB = 0.2 # Upper bound on P(request) per sub-period
+
+
+def build_class_products(class_forecasts: dict, window_days: int = config.BOOKING_WINDOW_DAYS,
+                         tc: str = None) -> dict:
+    """
+    Flattens one class's quota forecasts into DP products (with the
+    booking curves of class tc, if it has overrides).
+
+    Returns:
+        {'fares': (J,), 'quota': [q_code] * J, 'bucket': (J,),
+         'daily_rates': (window_days + 1, J) expected requests per day}
+    """
+    fares, quotas, buckets, rates = [], [], [], []
+    for q_code, forecast_data in class_forecasts.items():
+        fractions = get_daily_arrival_fractions(q_code, config.QUOTA_CONFIG[q_code], window_days, tc=tc)
+        for i, (price, demand) in enumerate(zip(forecast_data['prices'],
+                                                forecast_data['independent_bucket_demands'])):
+            fares.append(price)
+            quotas.append(q_code)
+            buckets.append(i)
+            rates.append(demand * fractions)
+    return {
+        'fares': np.asarray(fares, dtype=float),
+        'quota': quotas,
+        'bucket': np.asarray(buckets),
+        'daily_rates': np.column_stack(rates) if rates else np.zeros((window_days + 1, 0))
+    }
+
+
+def solve_class_dp(fares: np.ndarray, daily_rates: np.ndarray, capacity: int,
+                   max_arrival_prob: float = MAX_ARRIVAL_PROB) -> dict:
+    """
+    Backward recursion from the last day (day 1) to the window opening.
+
+    Args:
+        fares: (J,) fare of each product.
+        daily_rates: (W + 1, J) expected requests per product per day
+                     (row 0 unused).
+        capacity: Seats in the class.
+        max_arrival_prob: Each day gets enough sub-periods that the total
+                          request probability per sub-period is at most this.
+
+    Returns:
+        {'value': (W + 1, C + 1)  expected revenue-to-go at the start of
+                                  day d with x seats left,
+         'thresholds': (W + 1, C + 1)  opportunity cost of the x-th seat
+                                       on day d (inf for x = 0),
+         'n_periods': int, 'solve_time': float}
+    """
+    start = time.perf_counter()
+    fares = np.asarray(fares, dtype=float)
+    window_days = daily_rates.shape[0] - 1
+
+    V = np.zeros(capacity + 1)
+    value = np.zeros((window_days + 1, capacity + 1))
+    thresholds = np.full((window_days + 1, capacity + 1), np.inf)
+    n_periods = 0
+
+    for day in range(1, window_days + 1):
+        rates = daily_rates[day]
+        active = rates > 0
+        n_sub = max(1, int(np.ceil(rates.sum() / max_arrival_prob)))
+        p = (rates[active] / n_sub)[:, None]     # (J_active, 1)
+        f = fares[active][:, None]
+        # Sub-periods run backwards in time: the last one computed is the
+        # first of the day, whose thresholds the simulator uses.
+        for _ in range(n_sub):
+            delta = V[1:] - V[:-1]
+            V[1:] += (p * np.maximum(f - delta, 0.0)).sum(axis=0)
+        thresholds[day, 1:] = delta
+        value[day] = V
+        n_periods += n_sub
+
+    return {
+        'value': value,
+        'thresholds': thresholds,
+        'n_periods': n_periods,
+        'solve_time': time.perf_counter() - start
+    }
+
+
+def solve_dp_policy(all_quota_forecasts: dict, capacity: dict = None,
+                    max_arrival_prob: float = MAX_ARRIVAL_PROB) -> dict:
+    """
+    Solves the DP for every class and builds its threshold tables.
+
+    Returns:
+        {tc: {'value', 'thresholds', 'n_periods', 'solve_time',
+              'lowest_open_bucket': {q_code: (W + 1, C + 1) int array}}}
+        lowest_open_bucket[q][d, x] is the cheapest bucket of quota q open
+        on day d with x seats left (-1 = reject).
+    """
+    capacity = capacity or config.CAPACITY
+    policy = {}
+    for tc, class_forecasts in all_quota_forecasts.items():
+        products = build_class_products(class_forecasts, tc=tc)
+        result = solve_class_dp(products['fares'], products['daily_rates'], capacity[tc], max_arrival_prob)
+
+        result['lowest_open_bucket'] = {}
+        for q_code, forecast_data in class_forecasts.items():
+            quota_fares = np.asarray(forecast_data['prices'], dtype=float)
+            idx = np.searchsorted(quota_fares, result['thresholds'], side='left')
+            result['lowest_open_bucket'][q_code] = np.where(idx < len(quota_fares), idx, -1)
+        policy[tc] = result
+    return policy
+
+
+class DPControl:
+    """
+    Booking control driven by the DP thresholds. lowest_open_bucket gives,
+    per quota, the cheapest bucket whose fare covers the opportunity cost
+    of a seat on (day, remaining seats): one table lookup per request.
+    Bucket caps and policy minimums work as in BidPriceControl.
+    """
+
+    def __init__(self, all_quota_forecasts: dict, dp_policy: dict = None,
+                 capacity: dict = None, policy_minimums: dict = None):
+        capacity = capacity or config.CAPACITY
+        policy_minimums = POLICY_MINIMUMS if policy_minimums is None else policy_minimums
+        dp_policy = dp_policy or solve_dp_policy(all_quota_forecasts, capacity)
+        self.lowest_open_bucket = {tc: result['lowest_open_bucket'] for tc, result in dp_policy.items()}
+        self.remaining = {tc: capacity[tc] for tc in all_quota_forecasts}
+        self.bucket_caps = {
+            tc: {q_code: _bucket_caps(f) for q_code, f in class_forecasts.items()}
+            for tc, class_forecasts in all_quota_forecasts.items()
+        }
+        self.bucket_sold = {
+            tc: {q_code: [0] * len(caps) for q_code, caps in class_caps.items()}
+            for tc, class_caps in self.bucket_caps.items()
+        }
+        self.unmet_minimums = {
+            tc: _unmet_minimums(class_forecasts, policy_minimums.get(tc, {}))
+            for tc, class_forecasts in all_quota_forecasts.items()
+        }
+
+    def select_bucket(self, tc: str, q_code: str, day: int):
+        """Cheapest open bucket that is not sold out, or None to reject."""
+        held_back = sum(m for q, m in self.unmet_minimums[tc].items() if q != q_code)
+        if self.remaining[tc] - held_back <= 0:
+            return None
+        lowest = int(self.lowest_open_bucket[tc][q_code][day, self.remaining[tc]])
+        if lowest < 0:
+            return None
+        caps = self.bucket_caps[tc][q_code]
+        sold = self.bucket_sold[tc][q_code]
+        for i in range(lowest, len(caps)):
+            if sold[i] < caps[i]:
+                return i
+        return None
+
+    def record_sale(self, tc: str, q_code: str, bucket: int):
+        self.remaining[tc] -= 1
+        self.bucket_sold[tc][q_code][bucket] += 1
+        if self.unmet_minimums[tc].get(q_code, 0) > 0:
+            self.unmet_minimums[tc][q_code] -= 1
+
+
+# This block benchmarks the DP and compares it with the LP plan
+if __name__ == "__main__":
+    from engine import get_quota_forecasts
+    from allocation_engine import partition_capacity_by_quota, partition_quota_into_buckets
+
+    forecasts = get_quota_forecasts(stochastic_mode=True, rng=np.random.default_rng(42))
+    policy = solve_dp_policy(forecasts)
+    print(f"{'Class':<6} {'Seats':>6} {'Periods':>8} {'Solve':>9} {'DP value':>12} {'LP plan':>12}")
+    for tc, result in policy.items():
+        master = partition_capacity_by_quota(forecasts[tc], config.CAPACITY[tc], tc, quiet_mode=True)
+        lp_revenue = 0
+        for q_code, forecast_data in forecasts[tc].items():
+            alloc = master.get(f"{q_code}_Allocation", 0)
+            buckets = partition_quota_into_buckets(
+                forecast_data['independent_bucket_demands'], forecast_data['prices'],
+                alloc, q_code, quiet_mode=True
+            ) if alloc > 0 else {}
+            lp_revenue += sum(
+                buckets.get(f"{q_code}_Bucket_{i}_Allocation", 0) * price
+                for i, price in enumerate(forecast_data['prices'])
+            )
+        dp_value, lp_value = f"₹{result['value'][-1, -1]:,.0f}", f"₹{lp_revenue:,.0f}"
+        print(f"{tc:<6} {config.CAPACITY[tc]:>6} {result['n_periods']:>8} "
+              f"{result['solve_time'] * 1000:>7.1f}ms {dp_value:>12} {lp_value:>12}")
+
+    # --- Scaling: a 1,000-seat train with proportionally more demand ---
+    scale = 1000 / config.CAPACITY['3AC']
+    big = {
+        q_code: {**f, 'independent_bucket_demands': [d * scale for d in f['independent_bucket_demands']]}
+        for q_code, f in forecasts['3AC'].items()
+    }
+    products = build_class_products(big)
+    result = solve_class_dp(products['fares'], products['daily_rates'], 1000)
+    print(f"1,000-seat class: {result['n_periods']} periods solved in {result['solve_time'] * 1000:.1f}ms")
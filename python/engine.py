@@ -1,16 +1,76 @@
 # FILE 4: engine.py (UPDATED for Stochastic Mode)
 # This file's job is *only* to forecast total demand.
 
+import hashlib
+import json
 import numpy as np # <-- For stochastic sampling
+import forecasting
+import unconstraining
+import event_log
+import instrumentation
 from forecasting import (
     forecast_demand, 
+    forecast_demand_from_base,
     forecast_demand_by_price_point,
     get_flat_price_demand_forecast
 )
-from factor_calculator import calculate_demand_factors
+from factor_calculator import calculate_demand_factors, factors_from_group_stats
 
 import config
-import pulp
+
+# --- Forecast Cache ---
+# The deterministic (mu, sigma) of each class/quota only depends on the
+# historical data, external factors and model parameters, so it is
+# computed once and reused by every Monte Carlo run. Entries are keyed
+# on a content hash of those inputs; clear_forecast_cache() drops them.
+_FORECAST_CACHE = {}
+# Streamed history-store aggregates, keyed the same way
+_STORE_STATS_CACHE = {}
+
+
+def content_hash(*objects) -> str:
+    """Stable SHA-256 of JSON-serialisable objects (dict order ignored)."""
+    payload = json.dumps(objects, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _history_fingerprint():
+    """(Internal) Identifies the history: the store's fingerprint, or the literal itself."""
+    if config.HISTORY_STORE_PATH:
+        # Imported here: only needed when a store is configured
+        from history_store import HistoryStore
+        return HistoryStore(config.HISTORY_STORE_PATH).fingerprint
+    return config.DETAILED_HISTORICAL_DATA
+
+
+def forecast_cache_key() -> str:
+    """Content hash of every input of the deterministic forecast stage."""
+    return content_hash(
+        _history_fingerprint(),
+        config.EXTERNAL_FACTORS,
+        config.CAPACITY,
+        unconstraining.DAILY_SPILL_FACTOR,
+        unconstraining.UNCONSTRAINING_METHOD,
+        forecasting.PRICE_ELASTICITY_COEFFICIENT,
+        forecasting.FORECAST_SIGMA_FRACTION
+    )
+
+
+def clear_forecast_cache():
+    """Explicitly invalidates all cached deterministic forecasts."""
+    _FORECAST_CACHE.clear()
+    _STORE_STATS_CACHE.clear()
+
+
+def _history_store_stats(cache_key: str) -> dict:
+    """(Internal) One streaming pass over config.HISTORY_STORE_PATH, cached per cache key."""
+    if cache_key not in _STORE_STATS_CACHE:
+        from history_store import HistoryStore, aggregate_demand_stats
+        _STORE_STATS_CACHE[cache_key] = aggregate_demand_stats(
+            HistoryStore(config.HISTORY_STORE_PATH), config.CAPACITY
+        )
+    return _STORE_STATS_CACHE[cache_key]
+
 
 def _convert_cumulative_to_independent_demand(cumulative_demand: list) -> list:
     """Helper to convert cumulative [100, 70, 30] to independent [30, 40, 30]."""
@@ -24,7 +84,95 @@ def _convert_cumulative_to_independent_demand(cumulative_demand: list) -> list:
     return independent_demand
 
 
-def get_quota_forecasts(stochastic_mode: bool = False): # <-- For stochastic sampling
+def get_market_forecast(tc: str, q_code: str, quiet: bool = False, cache_key: str = None) -> tuple:
+    """
+    (Cached) Deterministic stage of the forecast: the total market
+    (mu, sigma) for one class and quota.
+
+    Quiet calls are served from the cache. Verbose calls always recompute
+    (so that the log is complete) and refresh the cache entry.
+
+    Args:
+        cache_key: Precomputed forecast_cache_key(), to hash only once per batch.
+    """
+    if cache_key is None:
+        cache_key = forecast_cache_key()
+    entry = (cache_key, tc, q_code)
+
+    if quiet and entry in _FORECAST_CACHE:
+        instrumentation.count('forecast_cache_hits')
+        return _FORECAST_CACHE[entry]
+    instrumentation.count('forecast_cache_misses')
+
+    if config.HISTORY_STORE_PATH:
+        result = _forecast_market_total_from_store(tc, q_code, cache_key, quiet=quiet)
+    else:
+        result = _forecast_market_total(tc, q_code, quiet=quiet)
+    _FORECAST_CACHE[entry] = result
+    return result
+
+
+@instrumentation.timed('forecast.market')
+def _forecast_market_total(tc: str, q_code: str, quiet: bool = False) -> tuple:
+    """
+    Deterministic part of the forecast: the total market (mu, sigma)
+    for one class and quota, from the historical data and external factors.
+    """
+    total_class_capacity = config.CAPACITY[tc]
+    # Copy the records: calculate_demand_factors() annotates them with
+    # 'true_demand', which must not leak back into the config (or the cache key).
+    class_historical_data = [
+        dict(r) for r in config.DETAILED_HISTORICAL_DATA[tc] 
+        if r['quota'] == q_code
+    ]
+
+    forecast_total = {'mu': 0, 'sigma': 0}
+    if class_historical_data:
+        factors = calculate_demand_factors(class_historical_data, total_class_capacity, quiet=quiet)
+        unconstrained = [rec['true_demand'] for rec in class_historical_data]
+        forecast_total = forecast_demand(
+            unconstrained, config.EXTERNAL_FACTORS, factors, q_code, quiet=quiet
+        )
+    
+    total_market_mu = forecast_total['mu']
+    total_market_sigma = forecast_total['sigma'] # Get sigma
+    
+    if total_market_mu == 0 and not class_historical_data:
+         if not quiet:
+            event_log.info('forecast', "... No historical data, using fallback demand 10.", tc=tc, quota=q_code)
+         total_market_mu = 10 
+         total_market_sigma = total_market_mu * forecasting.FORECAST_SIGMA_FRACTION # Assign a sigma
+
+    return total_market_mu, total_market_sigma
+
+
+@instrumentation.timed('forecast.market')
+def _forecast_market_total_from_store(tc: str, q_code: str, cache_key: str, quiet: bool = False) -> tuple:
+    """
+    _forecast_market_total() for an on-disk history store: works from the
+    streamed per-group aggregates instead of record lists.
+    """
+    stats = _history_store_stats(cache_key).get((tc, q_code))
+    if stats is None:
+        if not quiet:
+            event_log.info('forecast', "... No historical data, using fallback demand 10.", tc=tc, quota=q_code)
+        return 10, 10 * forecasting.FORECAST_SIGMA_FRACTION
+
+    factors = factors_from_group_stats(stats)
+    if not quiet:
+        event_log.info('factors', "Factors calculated from {:,} stored records: {}",
+                       int(stats['count'].sum()), factors, tc=tc, quota=q_code)
+    base_mu = stats['sum'].sum() / stats['count'].sum()
+    forecast_total = forecast_demand_from_base(
+        base_mu, config.EXTERNAL_FACTORS, factors, q_code, quiet=quiet
+    )
+    return forecast_total['mu'], forecast_total['sigma']
+
+
+@instrumentation.timed('forecast')
+def get_quota_forecasts(stochastic_mode: bool = False, # <-- For stochastic sampling
+                        rng: np.random.Generator = None,
+                        cache_key: str = None):
     """
     Runs "End-of-Horizon" forecasts for ALL quotas to get
     their total demand and expected revenue potential.
@@ -34,48 +182,42 @@ def get_quota_forecasts(stochastic_mode: bool = False): # <-- For stochastic sam
     Args:
         stochastic_mode: If True, samples demand from a normal distribution
                          instead of using the fixed mean (mu).
+        rng: Random generator used for sampling. Defaults to the
+             global np.random state.
+        cache_key: Precomputed forecast_cache_key(). Hashing the inputs
+                   costs far more than a cached forecast, so batches of
+                   runs should compute it once and pass it in.
     """
+    rng = rng if rng is not None else np.random
     if not stochastic_mode:
-        print("--- RUNNING 'END-OF-HORIZON' FORECASTING ENGINE (Deterministic Mode) ---")
+        event_log.info('forecast', "--- RUNNING 'END-OF-HORIZON' FORECASTING ENGINE (Deterministic Mode) ---")
     
     all_quota_forecasts = {}
+    if cache_key is None:
+        cache_key = forecast_cache_key()
     
     for tc in config.TRAVEL_CLASSES:
         if not stochastic_mode:
-            print(f"\n================ Processing Class: {tc} ================")
+            event_log.info('forecast', "\n================ Processing Class: {} ================", tc, tc=tc)
         all_quota_forecasts[tc] = {}
-        total_class_capacity = config.CAPACITY[tc]
 
         for q_code, q_config in config.QUOTA_CONFIG.items():
             if not stochastic_mode:
-                print(f"\n--- Forecasting TOTAL demand for Quota: {q_code} ---")
-
-            class_historical_data = [
-                r for r in config.DETAILED_HISTORICAL_DATA[tc] 
-                if r['quota'] == q_code
-            ]
-
-            forecast_total = {'mu': 0, 'sigma': 0}
-            if class_historical_data:
-                factors = calculate_demand_factors(class_historical_data, total_class_capacity, quiet=stochastic_mode)
-                unconstrained = [rec['true_demand'] for rec in class_historical_data]
-                forecast_total = forecast_demand(
-                    unconstrained, config.EXTERNAL_FACTORS, factors, q_code, quiet=stochastic_mode
-                )
-            
-            total_market_mu = forecast_total['mu']
-            total_market_sigma = forecast_total['sigma'] # Get sigma
-            
-            if total_market_mu == 0 and not class_historical_data:
-                 if not stochastic_mode:
-                    print("... No historical data, using fallback demand 10.")
-                 total_market_mu = 10 
-                 total_market_sigma = total_market_mu * 0.15 # Assign a sigma
+                event_log.info('forecast', "\n--- Forecasting TOTAL demand for Quota: {} ---", q_code,
+                               tc=tc, quota=q_code)
+
+            # --- Deterministic stage (cached) ---
+            total_market_mu, total_market_sigma = get_market_forecast(
+                tc, q_code, quiet=stochastic_mode, cache_key=cache_key
+            )
+            # Forecast uncertainty, carried to the quota's demand as a CV
+            forecast_cv = (total_market_sigma / total_market_mu) if total_market_mu > 0 else 0
 
+            # --- Sampling stage ---
             # --- STOCHASTIC MODE LOGIC ---
             if stochastic_mode:
                 # Sample the total market demand from its distribution
-                sampled_mu = np.random.normal(total_market_mu, total_market_sigma)
+                sampled_mu = rng.normal(total_market_mu, total_market_sigma)
                 # Ensure demand is non-negative
                 total_market_mu = max(0, int(sampled_mu))
             # --- (END) ---
@@ -106,17 +248,20 @@ def get_quota_forecasts(stochastic_mode: bool = False): # <-- For stochastic sam
             avg_revenue = (max_revenue / total_demand) if total_demand > 0 else 0
             
             if not stochastic_mode:
-                print(f"TOTAL Independent demand for {q_code}: {independent_demand_total}")
-                print(f"Max Revenue: {max_revenue}, Total Demand: {total_demand}, Avg Revenue: {avg_revenue:.2f}")
+                event_log.info('forecast', "TOTAL Independent demand for {}: {}", q_code, independent_demand_total,
+                               tc=tc, quota=q_code)
+                event_log.info('forecast', "Max Revenue: {}, Total Demand: {}, Avg Revenue: {:.2f}",
+                               max_revenue, total_demand, avg_revenue, tc=tc, quota=q_code)
 
             # Store the data for the allocators
             all_quota_forecasts[tc][q_code] = {
                 'total_demand': total_demand,
                 'avg_revenue_per_seat': avg_revenue,
                 'independent_bucket_demands': independent_demand_total,
-                'prices': prices
+                'prices': prices,
+                'sigma': total_demand * forecast_cv
             }
     
     if not stochastic_mode:
-        print("\n--- FORECASTING ENGINE COMPLETE ---")
+        event_log.info('forecast', "\n--- FORECASTING ENGINE COMPLETE ---")
     return all_quota_forecasts
\ No newline at end of file
@@ -0,0 +1,199 @@
+# FILE 21: event_log.py (Structured Event Logging)
+# The pipeline's log messages as structured events: each carries a level,
+# a stage ('forecast', 'lp', 'simulation', ...), the travel class and
+# quota it concerns, and a message template that is only formatted when
+# a sink actually takes the event.
+#
+# Routing:
+#   - By default, events go to the console (stdout), like the print()
+#     calls they replace.
+#   - capture(sink) replaces the console for the current thread only, so
+#     one thread (e.g. a UI session) can collect its own log while others
+#     keep logging normally.
+#   - add_sink(sink) adds a sink (e.g. a JSON-lines file) that receives
+#     the events of every thread.
+# The quiet / quiet_mode flags still guard every call, so quiet runs never
+# build an event at all.
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+RING_BUFFER_EVENTS = 10_000 # Default capacity of a RingBufferSink
+
+
+class Event:
+    """One log event; the message is formatted on first access."""
+    __slots__ = ('time', 'level', 'stage', 'tc', 'quota', 'template', 'args', '_message')
+
+    def __init__(self, level: int, stage: str, template: str, args: tuple, tc: str = None, quota: str = None):
+        self.time = time.time()
+        self.level = level
+        self.stage = stage
+        self.tc = tc
+        self.quota = quota
+        self.template = template
+        self.args = args
+        self._message = None
+
+    @property
+    def message(self) -> str:
+        if self._message is None:
+            self._message = self.template.format(*self.args) if self.args else self.template
+        return self._message
+
+    def to_dict(self) -> dict:
+        return {
+            'time': self.time,
+            'level': LEVEL_NAMES.get(self.level, str(self.level)),
+            'stage': self.stage,
+            'tc': self.tc,
+            'quota': self.quota,
+            'message': self.message.strip('\n'),
+            'pid': os.getpid()
+        }
+
+
+# --- Sinks ---
+class ConsoleSink:
+    """Prints each message, as the old print() calls did."""
+
+    def __init__(self, stream=None, level: int = INFO):
+        self.stream = stream # None = whatever sys.stdout is at write time
+        self.level = level
+
+    def write(self, event: Event):
+        print(event.message, file=self.stream or sys.stdout)
+
+
+class RingBufferSink:
+    """
+    Keeps the last `capacity` events in memory (e.g. for the UI log).
+    Messages are formatted on arrival, so later changes to the logged
+    objects do not alter the log.
+    """
+
+    def __init__(self, capacity: int = RING_BUFFER_EVENTS, level: int = INFO):
+        self.level = level
+        self.buffer = deque(maxlen=capacity)
+        self.n_events = 0
+        self._lock = threading.Lock()
+
+    def write(self, event: Event):
+        event.message # Format now, while the logged objects are as they were
+        with self._lock:
+            self.buffer.append(event)
+            self.n_events += 1
+
+    @property
+    def dropped(self) -> int:
+        return self.n_events - len(self.buffer)
+
+    def events(self) -> list:
+        with self._lock:
+            return list(self.buffer)
+
+    def text(self) -> str:
+        """The buffered messages as one text log (like captured stdout)."""
+        lines = [event.message for event in self.events()]
+        if self.dropped:
+            lines.insert(0, f"... ({self.dropped:,} earlier events dropped)")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+class JsonLinesSink:
+    """
+    Appends one JSON object per event to a file. Each line is a single
+    write to a file opened in append mode, so several processes can share
+    one log file.
+    """
+
+    def __init__(self, path: str, level: int = DEBUG):
+        self.path = path
+        self.level = level
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, event: Event):
+        line = json.dumps(event.to_dict(), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# --- Routing ---
+_CONSOLE = ConsoleSink()
+_SINKS = () # Process-wide sinks (copy-on-write tuple)
+_local = threading.local() # .sinks: this thread's capture() replacement for the console
+
+
+def add_sink(sink):
+    """Adds a process-wide sink, which receives the events of every thread."""
+    global _SINKS
+    _SINKS = _SINKS + (sink,)
+    return sink
+
+
+def remove_sink(sink):
+    global _SINKS
+    _SINKS = tuple(s for s in _SINKS if s is not sink)
+
+
+def set_console_level(level: int):
+    """Only print events at or above `level` to the console (e.g. WARNING)."""
+    _CONSOLE.level = level
+
+
+@contextlib.contextmanager
+def capture(*sinks):
+    """
+    Sends this thread's events to `sinks` instead of the console for the
+    duration of the block (process-wide sinks still receive them).
+    Yields the first sink.
+    """
+    previous = getattr(_local, 'sinks', None)
+    _local.sinks = sinks
+    try:
+        yield sinks[0] if sinks else None
+    finally:
+        _local.sinks = previous
+
+
+def emit(level: int, stage: str, template: str, *args, tc: str = None, quota: str = None):
+    """
+    Sends one event to every sink whose level it reaches. Nothing is
+    built or formatted when no sink takes it.
+    """
+    local_sinks = getattr(_local, 'sinks', None)
+    sinks = (local_sinks if local_sinks is not None else (_CONSOLE,)) + _SINKS
+    event = None
+    for sink in sinks:
+        if level >= sink.level:
+            if event is None:
+                event = Event(level, stage, template, args, tc, quota)
+            sink.write(event)
+
+
+def debug(stage: str, template: str, *args, **context):
+    emit(DEBUG, stage, template, *args, **context)
+
+
+def info(stage: str, template: str, *args, **context):
+    emit(INFO, stage, template, *args, **context)
+
+
+def warning(stage: str, template: str, *args, **context):
+    emit(WARNING, stage, template, *args, **context)
@@ -1,23 +1,20 @@
 # FILE 0: factor_calculator.py (FIXED & UPDATED for Quiet Mode)
 
 import numpy as np
+import event_log
 from unconstraining import unconstrain_demand
 
+# Demand groups used by the factors: 0 = normal (weekday, no holiday),
+# 1 = holiday, 2 = weekend (non-holiday).
+WEEKEND_DAYS = ['Fri', 'Sun']
+N_DEMAND_GROUPS = 3
+
 def get_unconstrained_demand(historical_data: list, capacity: int, quiet: bool = False) -> list: # <-- (NEW)
     """
     Helper function to run unconstraining on the new detailed data format.
+    (UPDATED) Delegates to unconstrain_demand(), reading 'days_early'.
     """
-    # Creating the simple list format required by the original unconstraining function
-    simple_sales_data = [
-        {
-            'train_id': rec['train_id'], 
-            'days_before_departure': rec['days_early'], 
-            'total_sold': rec['total_sold']
-        }
-        for rec in historical_data
-    ]
-    # Pass the quiet flag down
-    return unconstrain_demand(simple_sales_data, capacity, quiet=quiet)
+    return unconstrain_demand(historical_data, capacity, quiet=quiet, days_key='days_early')
 
 
 def calculate_demand_factors(historical_data: list, capacity: int, quiet: bool = False) -> dict: # <-- (NEW)
@@ -29,7 +26,7 @@ def calculate_demand_factors(historical_data: list, capacity: int, quiet: bool =
         {'holiday': 1.45, 'weekend': 1.12, 'base_leisure_split': 0.68}
     """
     if not quiet:
-        print("--- Calculating Demand Factors from Historical Data ---")
+        event_log.info('factors', "--- Calculating Demand Factors from Historical Data ---")
     
     # 1. Get true demand for all historical runs
     true_demand_list = get_unconstrained_demand(historical_data, capacity, quiet=quiet)
@@ -38,44 +35,52 @@ def calculate_demand_factors(historical_data: list, capacity: int, quiet: bool =
     for i, record in enumerate(historical_data):
         record['true_demand'] = true_demand_list[i]
 
-    # --- (LOGIC) ---
-    # 3. Calculate an overall average to use as a safe fallback
-    #    (Use 1.0 to avoid division by zero if true_demand_list is empty)
-    overall_mu = np.mean(true_demand_list) if true_demand_list else 1.0
-
-    # 4. Calculate Base Demand (non-holiday, weekday)
-    normal_demand = [
-        rec['true_demand'] for rec in historical_data
-        if not rec['is_holiday'] and rec['day_of_week'] not in ['Fri', 'Sun']
-    ]
-    # Use 'overall_mu' as the fallback instead of 200
-    base_mu = np.mean(normal_demand) if normal_demand else overall_mu
-    
-    # 5. Calculate Holiday Demand
-    holiday_demand = [
-        rec['true_demand'] for rec in historical_data if rec['is_holiday']
-    ]
-    # Use 'base_mu' as fallback, so factor defaults to 1.0
-    avg_holiday_mu = np.mean(holiday_demand) if holiday_demand else base_mu
+    # --- (UPDATED LOGIC) ---
+    # 3-7. Normal / holiday / weekend means and factors, from per-group
+    #      sums (see factors_from_group_stats() for the fallbacks)
+    n = len(historical_data)
+    is_holiday = np.fromiter((bool(rec['is_holiday']) for rec in historical_data), dtype=bool, count=n)
+    is_weekend = np.fromiter((rec['day_of_week'] in WEEKEND_DAYS for rec in historical_data), dtype=bool, count=n)
+    factors = factors_from_group_stats(
+        demand_group_stats(np.asarray(true_demand_list, dtype=float), is_holiday, is_weekend)
+    )
     
-    # 6. Calculate Weekend Demand
-    weekend_demand = [
-        rec['true_demand'] for rec in historical_data 
-        if rec['day_of_week'] in ['Fri', 'Sun'] and not rec['is_holiday'] # Avoid double-counting
-    ]
-    avg_weekend_mu = np.mean(weekend_demand) if weekend_demand else base_mu
-    # --- (END) ---
+    if not quiet:
+        event_log.info('factors', "Factors calculated: {}", factors)
+    return factors
 
-    # 7. Calculate Factors
-    factor_holiday = (avg_holiday_mu / base_mu) if base_mu > 0 else 1.0
-    factor_weekend = (avg_weekend_mu / base_mu) if base_mu > 0 else 1.0
-    
-    factors = {
+
+# --- (NEW) Array / streaming path ---
+
+def demand_group_codes(is_holiday: np.ndarray, is_weekend: np.ndarray) -> np.ndarray:
+    """Demand group of each record (see N_DEMAND_GROUPS)."""
+    return np.where(is_holiday, 1, np.where(is_weekend, 2, 0))
+
+
+def demand_group_stats(true_demand: np.ndarray, is_holiday: np.ndarray, is_weekend: np.ndarray) -> dict:
+    """
+    Per-group count and sum of unconstrained demand. Stats from separate
+    chunks merge by adding their counts and sums.
+    """
+    groups = demand_group_codes(is_holiday, is_weekend)
+    return {
+        'count': np.bincount(groups, minlength=N_DEMAND_GROUPS).astype(np.int64),
+        'sum': np.bincount(groups, weights=true_demand, minlength=N_DEMAND_GROUPS)
+    }
+
+
+def factors_from_group_stats(stats: dict) -> dict:
+    """
+    Same factors (and fallbacks) as calculate_demand_factors(), computed
+    from demand_group_stats() instead of record lists.
+    """
+    count, total = stats['count'], stats['sum']
+    overall_mu = total.sum() / count.sum() if count.sum() else 1.0
+    base_mu = total[0] / count[0] if count[0] else overall_mu
+    avg_holiday_mu = total[1] / count[1] if count[1] else base_mu
+    avg_weekend_mu = total[2] / count[2] if count[2] else base_mu
+    return {
         'base_mu': base_mu,
-        'factor_holiday': factor_holiday,
-        'factor_weekend': factor_weekend
+        'factor_holiday': (avg_holiday_mu / base_mu) if base_mu > 0 else 1.0,
+        'factor_weekend': (avg_weekend_mu / base_mu) if base_mu > 0 else 1.0
     }
-    
-    if not quiet:
-        print(f"Factors calculated: {factors}")
-    return factors
\ No newline at end of file
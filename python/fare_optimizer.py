@@ -0,0 +1,368 @@
+# FILE 24: fare_optimizer.py (Batched Fare-Ladder Search)
+# Searches FLEXI fare ladders (number of buckets, multipliers and cap) for
+# one travel class, instead of the fixed 1.0x .. 1.4x ladders in
+# config.FLEXI_FARE_STRUCTURE.
+#
+# Every candidate ladder is scored by expected class revenue, with all
+# ladders and scenarios stacked on one axis (row = ladder x scenario):
+#   1. Price-elastic bucket demand for every ladder at once, with the same
+#      model as forecasting.forecast_demand_by_price_point().
+#   2. Master + Inner allocation with batch_simulation.allocate_batch().
+#   3. Booking against common sampled arrivals, by willingness to pay: a
+#      quota's arrivals split over its buckets in proportion to their
+#      independent demand (the customers whose willingness to pay falls
+#      in that bucket's fare band), and a bucket sells at most its limit
+#      and at most its own customers. (The simulators sell any open bucket
+#      to any arrival, so there revenue only grows with the fares.)
+# A ladder never changes the quota's total demand (the base fare is fixed),
+# so every ladder is scored on the same scenarios and arrivals, and the
+# ranking is not blurred by scenario noise. A best ladder on the edge of
+# the search space (most buckets, highest cap) is flagged, since the
+# optimum may lie beyond it. The best few ladders can be re-run through
+# the online simulator (simulation.run_dynamic_simulation()) with
+# shared seeds (confirm_ladders()).
+
+import time
+import itertools
+import contextlib
+from statistics import NormalDist
+import numpy as np
+import config
+import event_log
+import forecasting
+from allocation_engine import POLICY_MINIMUMS
+from batch_simulation import (
+    sample_market_mu_batch,
+    build_quota_forecast_batch,
+    allocate_batch,
+    draw_arrivals_batch
+)
+
+# --- Default search space ---
+LADDER_BUCKETS = range(1, 7)                                   # Number of buckets
+LADDER_CAPS = np.round(np.arange(1.1, 3.001, 0.1), 2)          # Top multiplier
+LADDER_SHAPES = (0.5, 0.75, 1.0, 1.5, 2.0)                     # Spacing exponent (1 = even steps)
+PRICE_ROUNDING = 10                                            # Fares are rounded to ₹10
+MAX_ROWS_PER_CHUNK = 250_000                                   # Ladder x scenario rows per batch
+
+
+# --- Candidate ladders ---
+def generate_ladders(n_buckets=LADDER_BUCKETS, caps=LADDER_CAPS, shapes=LADDER_SHAPES) -> list:
+    """
+    Grid of multiplier ladders. Bucket i of an n-bucket ladder with cap c
+    and shape g has multiplier 1 + (c - 1) * (i / (n - 1)) ** g, so g < 1
+    puts the steps near the cap and g > 1 near the base fare.
+
+    Returns:
+        A list of multiplier tuples, starting at 1.0, without duplicates.
+    """
+    ladders = {(1.0,)} if 1 in n_buckets else set()
+    for n, cap, shape in itertools.product(n_buckets, caps, shapes):
+        if n < 2:
+            continue
+        steps = (np.arange(n) / (n - 1)) ** shape
+        ladders.add(tuple(np.round(1.0 + (cap - 1.0) * steps, 4).tolist()))
+    return sorted(ladders, key=lambda m: (len(m), m))
+
+
+def random_ladders(n_ladders: int, max_buckets: int = max(LADDER_BUCKETS),
+                   max_cap: float = max(LADDER_CAPS), rng: np.random.Generator = None) -> list:
+    """Random ladders: a random bucket count and sorted random multipliers up to max_cap."""
+    rng = rng if rng is not None else np.random.default_rng()
+    ladders = []
+    for n in rng.integers(1, max_buckets + 1, size=n_ladders):
+        steps = np.sort(rng.uniform(1.0, max_cap, size=n - 1))
+        ladders.append(tuple(np.round(np.concatenate([[1.0], steps]), 4).tolist()))
+    return ladders
+
+
+def ladder_price_buckets(multipliers, base_price: float, rounding: int = PRICE_ROUNDING) -> list:
+    """
+    Turns multipliers into a config-style ladder,
+    e.g. [{'name': 'Bucket_1 (1.0x)', 'price': 1800}, ...]. The first
+    bucket keeps the base fare exactly; the others are rounded.
+    """
+    buckets = []
+    for i, m in enumerate(multipliers):
+        price = base_price if i == 0 else int(round(base_price * m / rounding) * rounding)
+        buckets.append({'name': f"Bucket_{i + 1} ({m:.2f}x)", 'price': price})
+    return buckets
+
+
+def _ladder_matrix(ladders: list, base_price: float, rounding: int) -> tuple:
+    """
+    (Internal) Price matrix of the ladders, right-padded with zeros.
+    Ladders whose rounded prices are not strictly increasing are dropped.
+
+    Returns:
+        (kept ladders, (L, max_buckets) prices)
+    """
+    kept, rows = [], []
+    width = max(len(m) for m in ladders)
+    for multipliers in ladders:
+        prices = [b['price'] for b in ladder_price_buckets(multipliers, base_price, rounding)]
+        if any(b <= a for a, b in zip(prices, prices[1:])):
+            continue
+        kept.append(tuple(multipliers))
+        rows.append(prices + [0] * (width - len(prices)))
+    return kept, np.asarray(rows, dtype=float)
+
+
+def _elastic_forecast(market_mu: np.ndarray, prices: np.ndarray) -> dict:
+    """
+    (Internal) forecasting.forecast_demand_by_price_point_batch() with one
+    ladder per row: (N,) market sizes and (N, B) zero-padded prices give
+    the forecast dict of build_quota_forecast_batch(). Padded buckets get
+    no demand.
+    """
+    base_price = prices[:, :1]
+    price_ratio = np.divide(base_price, prices, out=np.zeros_like(prices), where=prices > 0)
+    multipliers = np.where(price_ratio == 1.0, 1.0, price_ratio ** forecasting.PRICE_ELASTICITY_COEFFICIENT)
+    cumulative = np.trunc(market_mu[:, None] * multipliers).astype(np.int64)
+
+    # Cumulative [100, 70, 30, 0] -> independent [30, 40, 30, 0]
+    independent = cumulative.copy()
+    independent[:, :-1] -= cumulative[:, 1:]
+
+    total_demand = independent.sum(axis=1)
+    max_revenue = (independent * prices).sum(axis=1)
+    avg_revenue = np.divide(max_revenue, total_demand,
+                            out=np.zeros(len(market_mu)), where=total_demand > 0)
+    return {
+        'total_demand': total_demand,
+        'avg_revenue_per_seat': avg_revenue,
+        'independent_bucket_demands': independent,
+        'prices': prices
+    }
+
+
+def _score_chunk(tc: str, q_code: str, prices: np.ndarray, market_mu: dict, arrivals: dict,
+                 capacity: dict, policy_minimums: dict) -> np.ndarray:
+    """(Internal) (L, S) class revenue of L ladders over the S common scenarios."""
+    n_ladders = len(prices)
+    n_scenarios = len(market_mu[q_code])
+
+    forecasts = {}
+    for other_q, mu in market_mu.items():
+        if other_q == q_code:
+            forecasts[other_q] = _elastic_forecast(np.tile(mu, n_ladders), np.repeat(prices, n_scenarios, axis=0))
+        else:
+            forecast = build_quota_forecast_batch(mu, tc, other_q)
+            forecasts[other_q] = {
+                name: (value if name == 'prices' else np.tile(value, (n_ladders,) + (1,) * (value.ndim - 1)))
+                for name, value in forecast.items()
+            }
+    allocations = allocate_batch({tc: forecasts}, capacity=capacity, policy_minimums=policy_minimums)[tc]
+
+    # Willingness to pay: each bucket sells to its own share of the arrivals only
+    revenue = np.zeros(n_ladders * n_scenarios)
+    for q, forecast in forecasts.items():
+        independent = np.asarray(forecast['independent_bucket_demands'], dtype=float)
+        share = np.divide(independent, forecast['total_demand'][:, None],
+                          out=np.zeros_like(independent), where=forecast['total_demand'][:, None] > 0)
+        bucket_arrivals = np.tile(arrivals[q], n_ladders)[:, None] * share
+        sales = np.minimum(allocations[q], bucket_arrivals)
+        revenue += (sales * np.broadcast_to(forecast['prices'], sales.shape)).sum(axis=1)
+    return revenue.reshape(n_ladders, n_scenarios)
+
+
+def optimize_fare_ladder(tc: str,
+                         q_code: str = None,
+                         ladders: list = None,
+                         n_scenarios: int = 200,
+                         seed=None,
+                         capacity: dict = None,
+                         policy_minimums: dict = None,
+                         rounding: int = PRICE_ROUNDING,
+                         top_k: int = 10,
+                         quiet: bool = True) -> dict:
+    """
+    Scores candidate fare ladders for one class and FLEXI quota by
+    expected class revenue (all quotas of the class, since a ladder also
+    shifts the Master allocation between quotas), with sales capped by
+    each bucket's willingness-to-pay demand.
+
+    Args:
+        q_code: The FLEXI quota whose ladder is searched (default: the
+                first FLEXI quota in config.QUOTA_CONFIG).
+        ladders: Multiplier tuples starting at 1.0 (default: generate_ladders()).
+                 The current config ladder is always scored as well.
+        n_scenarios: Common demand scenarios per ladder.
+        capacity, policy_minimums: As in batch_simulation.allocate_batch().
+        top_k: Number of best ladders to return.
+
+    Returns:
+        {'top': [{'multipliers', 'price_buckets', 'expected_revenue', 'std_error',
+                  'uplift'}], best first,
+         'current': {...same keys for the config ladder...},
+         'on_edge': [] or the limits of the search space the best ladder
+                    sits on ('n_buckets', 'cap'); widen them and re-run,
+         'n_candidates': int, 'seconds': float}
+    """
+    start = time.perf_counter()
+    if q_code is None:
+        q_code = next(q for q, q_config in config.QUOTA_CONFIG.items() if q_config['type'] == 'FLEXI')
+    if config.QUOTA_CONFIG[q_code]['type'] != 'FLEXI':
+        raise ValueError(f"Quota '{q_code}' has no fare ladder (type {config.QUOTA_CONFIG[q_code]['type']})")
+
+    current_buckets = config.QUOTA_CONFIG[q_code]['price_config'][tc]
+    base_price = current_buckets[0]['price']
+    current = tuple(b['price'] / base_price for b in current_buckets)
+    ladders = generate_ladders() if ladders is None else list(ladders)
+    ladders, prices = _ladder_matrix(ladders, base_price, rounding)
+
+    # The config ladder keeps its own (unrounded) prices
+    width = max(prices.shape[1], len(current_buckets))
+    prices = np.pad(prices, ((0, 0), (0, width - prices.shape[1])))
+    current_prices = [b['price'] for b in current_buckets] + [0] * (width - len(current_buckets))
+    prices = np.vstack([np.asarray(current_prices, dtype=float), prices])
+
+    # --- Common scenarios: demand totals and arrivals shared by every ladder ---
+    rng = np.random.default_rng(seed)
+    market_mu = sample_market_mu_batch(n_scenarios, stochastic_mode=True, rng=rng)[tc]
+    base_forecasts = {tc: {q: build_quota_forecast_batch(mu, tc, q) for q, mu in market_mu.items()}}
+    arrivals = draw_arrivals_batch(base_forecasts, rng=rng)[tc]
+
+    capacity = capacity if capacity is not None else config.CAPACITY
+    policy_minimums = policy_minimums if policy_minimums is not None else POLICY_MINIMUMS
+    ladders_per_chunk = max(1, MAX_ROWS_PER_CHUNK // n_scenarios)
+    revenue = np.vstack([
+        _score_chunk(tc, q_code, prices[i:i + ladders_per_chunk], market_mu, arrivals,
+                     capacity, policy_minimums)
+        for i in range(0, len(prices), ladders_per_chunk)
+    ])
+
+    # Paired standard errors against the current ladder (same scenarios)
+    mean = revenue.mean(axis=1)
+    uplift_se = (revenue - revenue[0]).std(axis=1, ddof=1) / np.sqrt(n_scenarios)
+    std_error = revenue.std(axis=1, ddof=1) / np.sqrt(n_scenarios)
+
+    def describe(i: int, multipliers: tuple) -> dict:
+        n_buckets = int((prices[i] > 0).sum())
+        return {
+            'multipliers': tuple(round(float(m), 4) for m in multipliers),
+            'price_buckets': (current_buckets if i == 0
+                              else ladder_price_buckets(multipliers, base_price, rounding)[:n_buckets]),
+            'expected_revenue': float(mean[i]),
+            'std_error': float(std_error[i]),
+            'uplift': float(mean[i] - mean[0]),
+            'uplift_std_error': float(uplift_se[i])
+        }
+
+    order = np.argsort(-mean[1:], kind='stable')[:top_k] + 1
+    best = ladders[order[0] - 1]
+    on_edge = []
+    if len(best) == max(len(m) for m in ladders):
+        on_edge.append('n_buckets')
+    if len(best) > 1 and best[-1] >= max(m[-1] for m in ladders) - 1e-9:
+        on_edge.append('cap')
+    result = {
+        'top': [describe(i, ladders[i - 1]) for i in order],
+        'current': describe(0, current),
+        'on_edge': on_edge,
+        'n_candidates': len(ladders),
+        'seconds': time.perf_counter() - start
+    }
+    if not quiet:
+        best = result['top'][0]
+        event_log.info('fare', "Scored {} {} ladders for {} in {:.2f}s: best {} (₹{:+,.0f} vs current)",
+                       result['n_candidates'], q_code, tc, result['seconds'],
+                       [b['price'] for b in best['price_buckets']], best['uplift'], tc=tc, quota=q_code)
+        if on_edge:
+            event_log.warning('fare', "Best {} ladder for {} is on the edge of the search space ({}); "
+                              "the optimum may lie beyond it", q_code, tc, ", ".join(on_edge),
+                              tc=tc, quota=q_code)
+    return result
+
+
+@contextlib.contextmanager
+def _ladder_override(tc: str, q_code: str, price_buckets: list):
+    """(Internal) Uses price_buckets as the (tc, q_code) ladder in config.QUOTA_CONFIG inside the block."""
+    original = config.QUOTA_CONFIG[q_code]
+    config.QUOTA_CONFIG[q_code] = {**original, 'price_config': {**original['price_config'], tc: price_buckets}}
+    try:
+        yield
+    finally:
+        config.QUOTA_CONFIG[q_code] = original
+
+
+def confirm_ladders(tc: str, candidates: list, q_code: str = None,
+                    n_runs: int = 200, seed=None,
+                    control_policy: str = 'partitioned',
+                    confidence: float = 0.95) -> list:
+    """
+    Re-checks the best ladders with the online simulator
+    (simulation.run_dynamic_simulation(): sampled forecasts, LP
+    allocation, daily arrivals and the booking control), against the
+    current ladder. Run r of every ladder uses the same seed, so the
+    differences are paired.
+
+    Note that the simulator sells any open bucket to any arrival, while
+    optimize_fare_ladder() caps sales by willingness to pay, so the two
+    can disagree on how much a higher cap is worth.
+
+    Args:
+        candidates: Entries of optimize_fare_ladder()['top'].
+        q_code: The FLEXI quota the ladders are for (default: the first
+                FLEXI quota, as in optimize_fare_ladder()); other quotas
+                keep their config ladders.
+        n_runs: Simulation runs per ladder.
+        control_policy: Booking control of every run (see booking_controls).
+
+    Returns:
+        One dict per candidate, in the same order: {'variant', 'baseline',
+        'mean_revenue', 'mean_diff', 'ci_low', 'ci_high', 'ci_half_width'}.
+    """
+    from engine import forecast_cache_key
+    from simulation import run_dynamic_simulation
+    if q_code is None:
+        q_code = next(q for q, q_config in config.QUOTA_CONFIG.items() if q_config['type'] == 'FLEXI')
+    run_seeds = np.random.SeedSequence(seed).spawn(n_runs)
+    cache_key = forecast_cache_key() # Ladders do not change the market forecast
+
+    def simulate() -> np.ndarray:
+        return np.asarray([
+            run_dynamic_simulation(stochastic_mode=True, quiet_mode=True, rng=np.random.default_rng(run_seed),
+                                   control_policy=control_policy, cache_key=cache_key)
+            for run_seed in run_seeds
+        ], dtype=float)
+
+    base = simulate()
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    differences = []
+    for i, candidate in enumerate(candidates):
+        with _ladder_override(tc, q_code, candidate['price_buckets']):
+            revenue = simulate()
+        diff = revenue - base
+        mean_diff = float(diff.mean())
+        half_width = z * float(diff.std(ddof=1)) / np.sqrt(n_runs) if n_runs > 1 else float('inf')
+        differences.append({
+            'variant': f"ladder_{i + 1}",
+            'baseline': 'current',
+            'mean_revenue': float(revenue.mean()),
+            'mean_diff': mean_diff,
+            'ci_low': mean_diff - half_width,
+            'ci_high': mean_diff + half_width,
+            'ci_half_width': half_width
+        })
+    return differences
+
+
+# This block searches every class's GN ladder from the command line
+if __name__ == "__main__":
+    for tc in config.TRAVEL_CLASSES:
+        result = optimize_fare_ladder(tc, seed=42, top_k=3)
+        current = result['current']
+        print(f"\n{tc}: {result['n_candidates']} ladders x 200 scenarios in {result['seconds']:.2f}s"
+              + (f"  (best on the search edge: {', '.join(result['on_edge'])})" if result['on_edge'] else ""))
+        print(f"  current {[b['price'] for b in current['price_buckets']]}: ₹{current['expected_revenue']:,.0f}")
+        for rank, candidate in enumerate(result['top'], 1):
+            print(f"  #{rank} {[b['price'] for b in candidate['price_buckets']]}: "
+                  f"₹{candidate['expected_revenue']:,.0f} "
+                  f"(₹{candidate['uplift']:+,.0f} ± {1.96 * candidate['uplift_std_error']:,.0f})")
+
+        start = time.perf_counter()
+        confirmed = confirm_ladders(tc, result['top'], seed=7)
+        print(f"  Online simulator, 200 paired runs, in {time.perf_counter() - start:.2f}s:")
+        for d in confirmed:
+            print(f"    {d['variant']}: ₹{d['mean_diff']:+,.0f} [₹{d['ci_low']:+,.0f}, ₹{d['ci_high']:+,.0f}]")
@@ -0,0 +1,201 @@
+# FILE 10: fleet.py (Fleet-Scale Batch Mode)
+# Forecasts, allocates and simulates many trains x departures in one run.
+# Work that only depends on the route (historical factors) is done once
+# and shared; everything per-departure is vectorized with batch_simulation.
+
+import time
+import numpy as np
+import config
+import forecasting
+from factor_calculator import calculate_demand_factors
+from forecasting import forecast_demand
+from batch_simulation import (
+    build_quota_forecast_batch,
+    allocate_batch,
+    draw_arrivals_batch,
+    simulate_booking_batch
+)
+
+WEEKEND_DAYS = ['Fri', 'Sun']
+DAYS_OF_WEEK = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def _to_columns(departures) -> dict:
+    """(Internal) Accepts a dict of columns or a list of row dicts."""
+    if isinstance(departures, dict):
+        return {k: np.asarray(v) for k, v in departures.items()}
+    keys = departures[0].keys() if departures else []
+    return {k: np.asarray([row[k] for row in departures]) for k in keys}
+
+
+def _route_market_forecasts(history: dict, tc: str, q_code: str) -> dict:
+    """
+    (Internal) Shared per-route work: unconstrains the route's history
+    and computes its demand factors once, then returns the total-market
+    (mu, sigma) for each (is_holiday, is_weekend) combination.
+    """
+    class_historical_data = [
+        dict(r) for r in history.get(tc, []) if r['quota'] == q_code
+    ]
+
+    forecasts = {}
+    if not class_historical_data:
+        # Same fallback as engine.get_quota_forecasts()
+        for combo in [(h, w) for h in (False, True) for w in (False, True)]:
+            forecasts[combo] = (10, 10 * forecasting.FORECAST_SIGMA_FRACTION)
+        return forecasts
+
+    factors = calculate_demand_factors(class_historical_data, config.CAPACITY[tc], quiet=True)
+    unconstrained = [rec['true_demand'] for rec in class_historical_data]
+    for is_holiday in (False, True):
+        for is_weekend in (False, True):
+            external_factors = {
+                'is_holiday': is_holiday,
+                'day_of_week': WEEKEND_DAYS[0] if is_weekend else 'Wed'
+            }
+            forecast = forecast_demand(unconstrained, external_factors, factors, q_code, quiet=True)
+            forecasts[(is_holiday, is_weekend)] = (forecast['mu'], forecast['sigma'])
+    return forecasts
+
+
+def run_fleet(departures,
+              history_by_route: dict = None,
+              stochastic_mode: bool = False,
+              seed=None,
+              chunk_size: int = 5000) -> dict:
+    """
+    Runs forecasting, allocation and simulation for a whole fleet.
+
+    Args:
+        departures: A table (dict of columns, or list of row dicts) with
+                    'train_id', 'departure', 'route', 'is_holiday' and
+                    'day_of_week'. Optional 'capacity_<class>' columns
+                    (e.g. 'capacity_3AC') override config.CAPACITY.
+        history_by_route: {route: DETAILED_HISTORICAL_DATA-style dict}.
+                          Routes not listed use config.DETAILED_HISTORICAL_DATA.
+        stochastic_mode: If True, samples each departure's demand.
+        seed: Seed for the random generator (arrivals and sampling).
+        chunk_size: Departures simulated per vectorized chunk.
+
+    Returns:
+        {'columns': {name: array}, 'n_departures': int,
+         'elapsed_seconds': float, 'trains_per_second': float}
+    """
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    history_by_route = history_by_route or {}
+
+    table = _to_columns(departures)
+    n_departures = len(table['train_id'])
+    is_holiday = table['is_holiday'].astype(bool)
+    is_weekend = np.isin(table['day_of_week'], WEEKEND_DAYS)
+
+    # --- 1. Shared work: one forecast per (history, class, quota, day type) ---
+    # Routes that share a history object share its factors.
+    histories = []
+    history_index = {}
+    route_codes = np.empty(n_departures, dtype=np.int64)
+    for route in np.unique(table['route']):
+        history = history_by_route.get(route, config.DETAILED_HISTORICAL_DATA)
+        if id(history) not in history_index:
+            history_index[id(history)] = len(histories)
+            histories.append(history)
+        route_codes[table['route'] == route] = history_index[id(history)]
+
+    # combo code = history * 4 + holiday * 2 + weekend
+    combo_codes = route_codes * 4 + is_holiday * 2 + is_weekend
+    market_mu = {}
+    market_sigma = {}
+    for tc in config.TRAVEL_CLASSES:
+        market_mu[tc] = {}
+        market_sigma[tc] = {}
+        for q_code in config.QUOTA_CONFIG:
+            mu_table = np.zeros(len(histories) * 4)
+            sigma_table = np.zeros(len(histories) * 4)
+            for h, history in enumerate(histories):
+                for (hol, wkd), (mu, sigma) in _route_market_forecasts(history, tc, q_code).items():
+                    mu_table[h * 4 + hol * 2 + wkd] = mu
+                    sigma_table[h * 4 + hol * 2 + wkd] = sigma
+            market_mu[tc][q_code] = mu_table[combo_codes]
+            market_sigma[tc][q_code] = sigma_table[combo_codes]
+
+    capacity = {
+        tc: table[f'capacity_{tc}'].astype(float) if f'capacity_{tc}' in table
+        else np.full(n_departures, float(config.CAPACITY[tc]))
+        for tc in config.TRAVEL_CLASSES
+    }
+
+    # --- 2. Per-departure work, vectorized in chunks ---
+    columns = {
+        'train_id': table['train_id'],
+        'departure': table['departure'],
+        'route': table['route'],
+        'revenue': np.zeros(n_departures)
+    }
+    for tc in config.TRAVEL_CLASSES:
+        columns[f'demand_{tc}'] = np.zeros(n_departures, dtype=np.int64)
+        columns[f'seats_sold_{tc}'] = np.zeros(n_departures, dtype=np.int64)
+        columns[f'rejected_{tc}'] = np.zeros(n_departures, dtype=np.int64)
+        columns[f'load_factor_{tc}'] = np.zeros(n_departures)
+
+    for lo in range(0, n_departures, chunk_size):
+        hi = min(lo + chunk_size, n_departures)
+        forecasts = {}
+        for tc in config.TRAVEL_CLASSES:
+            forecasts[tc] = {}
+            for q_code in config.QUOTA_CONFIG:
+                mu = market_mu[tc][q_code][lo:hi]
+                if stochastic_mode:
+                    sampled_mu = rng.normal(mu, market_sigma[tc][q_code][lo:hi])
+                    mu = np.maximum(np.trunc(sampled_mu), 0)
+                forecasts[tc][q_code] = build_quota_forecast_batch(mu, tc, q_code)
+
+        chunk_capacity = {tc: capacity[tc][lo:hi] for tc in config.TRAVEL_CLASSES}
+        allocations = allocate_batch(forecasts, capacity=chunk_capacity)
+        arrivals = draw_arrivals_batch(forecasts, rng=rng)
+        results = simulate_booking_batch(forecasts, allocations, arrivals)
+
+        columns['revenue'][lo:hi] = results['revenue']
+        for tc in config.TRAVEL_CLASSES:
+            columns[f'demand_{tc}'][lo:hi] = sum(f['total_demand'] for f in forecasts[tc].values())
+            columns[f'seats_sold_{tc}'][lo:hi] = results['seats_sold'][tc]
+            columns[f'rejected_{tc}'][lo:hi] = sum(results['rejections'][tc].values())
+            columns[f'load_factor_{tc}'][lo:hi] = results['seats_sold'][tc] / np.maximum(chunk_capacity[tc], 1)
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'columns': columns,
+        'n_departures': n_departures,
+        'elapsed_seconds': elapsed,
+        'trains_per_second': n_departures / elapsed if elapsed > 0 else float('inf')
+    }
+
+
+def make_synthetic_fleet(n_trains: int = 300, n_days: int = 365,
+                         n_routes: int = 50, holiday_rate: float = 0.05,
+                         seed=None) -> dict:
+    """
+    Builds a synthetic departures table (n_trains x n_days rows) for
+    benchmarking run_fleet().
+    """
+    rng = np.random.default_rng(seed)
+    train_ids = np.repeat(np.arange(n_trains), n_days)
+    day_index = np.tile(np.arange(n_days), n_trains)
+    return {
+        'train_id': train_ids,
+        'departure': day_index,
+        'route': (train_ids % n_routes),
+        'is_holiday': rng.random(n_trains * n_days) < holiday_rate,
+        'day_of_week': np.asarray(DAYS_OF_WEEK)[day_index % 7]
+    }
+
+
+# This block lets you benchmark the fleet mode from the command line
+if __name__ == "__main__":
+    fleet = make_synthetic_fleet(n_trains=300, n_days=365, seed=42)
+    fleet_results = run_fleet(fleet, stochastic_mode=True, seed=42)
+    revenue = fleet_results['columns']['revenue']
+    print(f"Departures simulated: {fleet_results['n_departures']:,}")
+    print(f"Elapsed:              {fleet_results['elapsed_seconds']:.2f}s")
+    print(f"Trains per second:    {fleet_results['trains_per_second']:,.0f}")
+    print(f"Total fleet revenue:  ₹{revenue.sum():,.0f}")
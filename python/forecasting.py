@@ -2,10 +2,14 @@
 
 import numpy as np
 import config
+import event_log
 
 # --- Elasticity Parameters ---
 PRICE_ELASTICITY_COEFFICIENT = 1.5 
 
+# --- Forecast Uncertainty ---
+FORECAST_SIGMA_FRACTION = 0.15 # Forecast sigma as a fraction of mu
+
 
 def forecast_demand(unconstrained_estimates: list, 
                     external_factors: dict, 
@@ -16,29 +20,44 @@ def forecast_demand(unconstrained_estimates: list,
     Forecasts the total potential market for a specific quota.
     """
     if not quiet:
-        print(f"\nStep 2: Forecasting *total potential market* for {quota_type} quota...")
+        event_log.info('forecast', "\nStep 2: Forecasting *total potential market* for {} quota...", quota_type,
+                       quota=quota_type)
     
-    base_mu = np.mean(unconstrained_estimates) if unconstrained_estimates else 0
+    base_mu = np.mean(unconstrained_estimates) if len(unconstrained_estimates) else 0
+    return forecast_demand_from_base(base_mu, external_factors, demand_factors, quota_type, quiet=quiet)
+
+
+def forecast_demand_from_base(base_mu: float,
+                              external_factors: dict,
+                              demand_factors: dict,
+                              quota_type: str,
+                              quiet: bool = False) -> dict:
+    """
+    forecast_demand() from an already aggregated mean unconstrained
+    demand (e.g. streamed from history_store).
+    """
     # Ensure sigma is non-zero, e.g., 15% of mu or a fallback
-    base_sigma = base_mu * 0.15 if base_mu > 0 else 1.0 
+    base_sigma = base_mu * FORECAST_SIGMA_FRACTION if base_mu > 0 else 1.0 
     forecast = {'mu': base_mu, 'sigma': base_sigma}
     
     if external_factors.get('is_holiday'):
         if not quiet:
-            print(f"... applying holiday factor ({demand_factors.get('factor_holiday', 1.0):.2f})")
+            event_log.info('forecast', "... applying holiday factor ({:.2f})", demand_factors.get('factor_holiday', 1.0),
+                           quota=quota_type)
         forecast['mu'] *= demand_factors.get('factor_holiday', 1.0)
         
     if external_factors.get('day_of_week') in ['Fri', 'Sun']:
         if not quiet:
-            print(f"... applying weekend factor ({demand_factors.get('factor_weekend', 1.0):.2f})")
+            event_log.info('forecast', "... applying weekend factor ({:.2f})", demand_factors.get('factor_weekend', 1.0),
+                           quota=quota_type)
         forecast['mu'] *= demand_factors.get('factor_weekend', 1.0)
     
     forecast['mu'] = int(forecast['mu'])
     # Also scale sigma by the same factors
-    forecast['sigma'] = int(forecast['mu'] * 0.15) 
+    forecast['sigma'] = int(forecast['mu'] * FORECAST_SIGMA_FRACTION) 
         
     if not quiet:
-        print(f"Total potential market forecast for {quota_type}: {forecast}")
+        event_log.info('forecast', "Total potential market forecast for {}: {}", quota_type, forecast, quota=quota_type)
     return forecast
 
 
@@ -53,7 +72,7 @@ def forecast_demand_by_price_point(total_market_mu: int,
         e.g., ([150, 85, 60], [1800, 1980, 2160])
     """
     if not quiet:
-        print(f"... simulating price-elastic demand from market size {total_market_mu}")
+        event_log.info('forecast', "... simulating price-elastic demand from market size {}", total_market_mu)
     prices = [b['price'] for b in price_buckets]
     
     if not price_buckets:
@@ -73,7 +92,7 @@ def forecast_demand_by_price_point(total_market_mu: int,
             cumulative_demand_per_bucket.append(int(demand))
 
     if not quiet:
-        print(f"... CUMULATIVE price-elastic demand: {cumulative_demand_per_bucket}")
+        event_log.info('forecast', "... CUMULATIVE price-elastic demand: {}", cumulative_demand_per_bucket)
     return (cumulative_demand_per_bucket, prices)
 
 
@@ -88,7 +107,7 @@ def get_flat_price_demand_forecast(total_market_mu: int,
         e.g., ([20], [2600])
     """
     if not quiet:
-        print(f"... formatting FLAT price demand for market size {total_market_mu}")
+        event_log.info('forecast', "... formatting FLAT price demand for market size {}", total_market_mu)
     
     # For a flat price, the "cumulative" demand is just the total market
     # forecast, and there is only one price.
@@ -96,5 +115,28 @@ def get_flat_price_demand_forecast(total_market_mu: int,
     prices = [price]
     
     if not quiet:
-        print(f"... FLAT price demand: {cumulative_demand} at {prices}")
-    return (cumulative_demand, prices)
\ No newline at end of file
+        event_log.info('forecast', "... FLAT price demand: {} at {}", cumulative_demand, prices)
+    return (cumulative_demand, prices)
+
+def forecast_demand_by_price_point_batch(total_market_mu: np.ndarray,
+                                         price_buckets: list) -> (np.ndarray, list):
+    """
+    Vectorized version of forecast_demand_by_price_point() for many
+    market sizes at once (one per scenario).
+    
+    Returns:
+        A tuple of (cumulative_demand_array, price_list), where the
+        array has shape (n_scenarios, n_buckets).
+    """
+    total_market_mu = np.asarray(total_market_mu, dtype=float)
+    prices = [b['price'] for b in price_buckets]
+    
+    if not price_buckets:
+        return (np.zeros((total_market_mu.shape[0], 0), dtype=np.int64), [])
+
+    base_price = price_buckets[0]['price']
+    price_ratio = base_price / np.asarray(prices, dtype=float)
+    multipliers = np.where(price_ratio == 1.0, 1.0, price_ratio ** PRICE_ELASTICITY_COEFFICIENT)
+    
+    cumulative_demand = np.trunc(total_market_mu[:, None] * multipliers[None, :])
+    return (cumulative_demand.astype(np.int64), prices)
@@ -0,0 +1,239 @@
+# FILE 17: history_store.py (Columnar, Memory-Mapped Historical Data)
+# Stores the booking history as one .npy file per column plus a
+# meta.json (categories and a content fingerprint). Columns are opened
+# with memory mapping and aggregated in chunks, so histories larger than
+# RAM can be summarised without materialising records.
+#
+# Layout of a store directory:
+#   meta.json               {'n_rows', 'columns': {name: {'dtype', 'categories'?}}, 'fingerprint'}
+#   travel_class.npy        int16 category codes
+#   quota.npy               int16 category codes
+#   day_of_week.npy         int16 category codes
+#   train_id.npy            int64
+#   total_sold.npy          int32
+#   days_early.npy          int32
+#   is_holiday.npy          bool
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import config
+import unconstraining
+from unconstraining import unconstrain_demand_array
+from factor_calculator import WEEKEND_DAYS, N_DEMAND_GROUPS, demand_group_codes
+
+CATEGORICAL_COLUMNS = ['travel_class', 'quota', 'day_of_week']
+NUMERIC_COLUMNS = {
+    'train_id': np.int64,
+    'total_sold': np.int32,
+    'days_early': np.int32,
+    'is_holiday': np.bool_
+}
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+
+# --- Writing ---
+def records_to_columns(detailed_historical_data: dict) -> dict:
+    """
+    Converts the DETAILED_HISTORICAL_DATA literal ({class: [record]})
+    into plain columns (categoricals as strings).
+    """
+    rows = [
+        (tc, rec) for tc, records in detailed_historical_data.items() for rec in records
+    ]
+    return {
+        'travel_class': np.asarray([tc for tc, _ in rows]),
+        'quota': np.asarray([rec['quota'] for _, rec in rows]),
+        'day_of_week': np.asarray([rec['day_of_week'] for _, rec in rows]),
+        'train_id': np.asarray([rec['train_id'] for _, rec in rows], dtype=np.int64),
+        'total_sold': np.asarray([rec['total_sold'] for _, rec in rows], dtype=np.int32),
+        'days_early': np.asarray([rec['days_early'] for _, rec in rows], dtype=np.int32),
+        'is_holiday': np.asarray([rec['is_holiday'] for _, rec in rows], dtype=np.bool_)
+    }
+
+
+def write_history_store(path: str, columns: dict) -> str:
+    """
+    Writes columns to a store directory.
+
+    Args:
+        columns: {name: array} with every CATEGORICAL_COLUMNS entry (strings,
+                 or integer codes plus a '<name>_categories' list) and every
+                 NUMERIC_COLUMNS entry.
+
+    Returns:
+        The store's content fingerprint.
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {'columns': {}}
+    digest = hashlib.sha256()
+    n_rows = None
+
+    for name in CATEGORICAL_COLUMNS + list(NUMERIC_COLUMNS):
+        if name not in columns:
+            raise ValueError(f"History store column '{name}' is missing")
+        if name in CATEGORICAL_COLUMNS:
+            if f'{name}_categories' in columns:
+                categories = [str(c) for c in columns[f'{name}_categories']]
+                data = np.asarray(columns[name], dtype=np.int16)
+            else:
+                categories, codes = np.unique(np.asarray(columns[name]).astype(str), return_inverse=True)
+                categories = categories.tolist()
+                data = codes.astype(np.int16)
+            meta['columns'][name] = {'dtype': 'int16', 'categories': categories}
+            digest.update(json.dumps(categories).encode('utf-8'))
+        else:
+            data = np.asarray(columns[name], dtype=NUMERIC_COLUMNS[name])
+            meta['columns'][name] = {'dtype': data.dtype.name}
+
+        if n_rows is None:
+            n_rows = len(data)
+        elif len(data) != n_rows:
+            raise ValueError(f"Column '{name}' has {len(data)} rows, expected {n_rows}")
+        np.save(os.path.join(path, f'{name}.npy'), data)
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(data).tobytes())
+
+    meta['n_rows'] = int(n_rows)
+    meta['fingerprint'] = digest.hexdigest()
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta['fingerprint']
+
+
+def write_fixture_store(path: str) -> str:
+    """Writes config.DETAILED_HISTORICAL_DATA as a store (for tests and demos)."""
+    return write_history_store(path, records_to_columns(config.DETAILED_HISTORICAL_DATA))
+
+
+# --- Reading ---
+class HistoryStore:
+    """Read-only, memory-mapped view of a store directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._columns = {}
+
+    @property
+    def n_rows(self) -> int:
+        return self.meta['n_rows']
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta['fingerprint']
+
+    def categories(self, name: str) -> list:
+        return self.meta['columns'][name].get('categories', [])
+
+    def code(self, name: str, value: str) -> int:
+        """Category code of a value, or -1 if it never occurs."""
+        categories = self.categories(name)
+        return categories.index(value) if value in categories else -1
+
+    def column(self, name: str) -> np.ndarray:
+        """The whole column, memory-mapped (nothing is read until used)."""
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        return self._columns[name]
+
+    def iter_chunks(self, columns: list = None, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        """Yields {name: array} for consecutive row ranges, read chunk by chunk."""
+        columns = columns or list(self.meta['columns'])
+        for lo in range(0, self.n_rows, chunk_rows):
+            hi = min(lo + chunk_rows, self.n_rows)
+            yield {name: np.asarray(self.column(name)[lo:hi]) for name in columns}
+
+
+# --- Streaming aggregation ---
+def aggregate_demand_stats(store: HistoryStore, capacity: dict = None,
+                           chunk_rows: int = DEFAULT_CHUNK_ROWS) -> dict:
+    """
+    One streaming pass over the store: unconstrains every record and
+    accumulates per-(class, quota) demand group stats.
+
+    Only the 'spill' unconstraining method streams: EM needs every record
+    of a group at once.
+
+    Returns:
+        {(tc, q_code): {'count': (N_DEMAND_GROUPS,), 'sum': (N_DEMAND_GROUPS,)}}
+        in the format of factor_calculator.demand_group_stats().
+    """
+    if unconstraining.UNCONSTRAINING_METHOD != 'spill':
+        raise ValueError(
+            f"History store aggregation supports UNCONSTRAINING_METHOD = 'spill' only "
+            f"(got '{unconstraining.UNCONSTRAINING_METHOD}')"
+        )
+    capacity = capacity or config.CAPACITY
+    classes = store.categories('travel_class')
+    quotas = store.categories('quota')
+    n_classes, n_quotas = len(classes), len(quotas)
+    # Lookup tables indexed by category code
+    class_capacity = np.asarray([capacity.get(tc, np.iinfo(np.int32).max) for tc in classes])
+    weekend_by_code = np.isin(store.categories('day_of_week'), WEEKEND_DAYS)
+
+    n_keys = n_classes * n_quotas * N_DEMAND_GROUPS
+    counts = np.zeros(n_keys, dtype=np.int64)
+    sums = np.zeros(n_keys)
+    for chunk in store.iter_chunks(chunk_rows=chunk_rows):
+        true_demand = unconstrain_demand_array(
+            chunk['total_sold'], class_capacity[chunk['travel_class']], chunk['days_early'], method='spill'
+        )
+        groups = demand_group_codes(chunk['is_holiday'], weekend_by_code[chunk['day_of_week']])
+        keys = (chunk['travel_class'].astype(np.int64) * n_quotas + chunk['quota']) * N_DEMAND_GROUPS + groups
+        counts += np.bincount(keys, minlength=n_keys)
+        sums += np.bincount(keys, weights=true_demand, minlength=n_keys)
+
+    counts = counts.reshape(n_classes, n_quotas, N_DEMAND_GROUPS)
+    sums = sums.reshape(n_classes, n_quotas, N_DEMAND_GROUPS)
+    return {
+        (tc, q_code): {'count': counts[i, j], 'sum': sums[i, j]}
+        for i, tc in enumerate(classes)
+        for j, q_code in enumerate(quotas)
+        if counts[i, j].sum() > 0
+    }
+
+
+def make_synthetic_history(n_rows: int, seed=None) -> dict:
+    """Synthetic history columns (as codes) for benchmarking large stores."""
+    rng = np.random.default_rng(seed)
+    classes = list(config.TRAVEL_CLASSES)
+    quotas = list(config.QUOTA_CONFIG)
+    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    class_codes = rng.integers(0, len(classes), size=n_rows).astype(np.int16)
+    capacity = np.asarray([config.CAPACITY[tc] for tc in classes])[class_codes]
+    return {
+        'travel_class': class_codes,
+        'travel_class_categories': classes,
+        'quota': rng.integers(0, len(quotas), size=n_rows).astype(np.int16),
+        'quota_categories': quotas,
+        'day_of_week': rng.integers(0, len(days), size=n_rows).astype(np.int16),
+        'day_of_week_categories': days,
+        'train_id': np.arange(n_rows, dtype=np.int64),
+        'total_sold': np.minimum(rng.poisson(0.8 * capacity), capacity).astype(np.int32),
+        'days_early': rng.integers(0, 11, size=n_rows).astype(np.int32),
+        'is_holiday': rng.random(n_rows) < 0.05
+    }
+
+
+# This block benchmarks streaming aggregation from the command line
+if __name__ == "__main__":
+    import tempfile
+    n_rows = 10_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        write_history_store(tmp, make_synthetic_history(n_rows, seed=42))
+        write_time = time.perf_counter() - start
+
+        store = HistoryStore(tmp)
+        start = time.perf_counter()
+        stats = aggregate_demand_stats(store)
+        aggregate_time = time.perf_counter() - start
+
+    print(f"Records:          {n_rows:,}")
+    print(f"Write time:       {write_time:.2f}s")
+    print(f"Streaming pass:   {aggregate_time:.2f}s ({n_rows / aggregate_time / 1e6:.1f}M records/s)")
+    print(f"Groups found:     {len(stats)} (class, quota) pairs")
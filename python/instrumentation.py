@@ -0,0 +1,236 @@
+# FILE 20: instrumentation.py (Opt-In Stage Timers, Counters & Trace Export)
+# Records where a run spends its time: wall time per stage (forecasting,
+# LP build and solve, the arrival loop, ...) plus counters such as LP
+# solves, arrivals and rejections. Recording is off by default; the hooks
+# in engine, allocation_engine and simulation then cost one global check
+# per call.
+#
+# Usage:
+#   with instrumentation.recording() as recorder:
+#       run_dynamic_simulation(stochastic_mode=True, quiet_mode=True)
+#   recorder.report()                       # structured dict
+#   recorder.write_chrome_trace('run.json') # open in chrome://tracing or Perfetto
+#
+# Only the recording process is instrumented: with n_workers > 1 the
+# stochastic runs in the worker processes are not recorded.
+
+import os
+import json
+import time
+import threading
+import contextlib
+import functools
+
+MAX_TRACE_EVENTS = 1_000_000 # Beyond this only the per-stage totals are kept
+
+# Stages whose time counts as LP solver time in the report summary
+SOLVER_STAGES = ('lp.solve', 'lp.cbc_solve')
+
+_ACTIVE = None # The Recorder in use, or None when recording is off
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Recorder:
+    """
+    Collects stage timings and counters. Each finished span adds to its
+    stage's totals and, up to max_events, to the trace event list.
+    """
+
+    def __init__(self, max_events: int = MAX_TRACE_EVENTS):
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.stages = {}   # name -> {'calls': int, 'seconds': float}
+        self.counters = {} # name -> number
+        self.events = []   # (name, start, duration, thread id, args)
+        self.dropped_events = 0
+
+    # --- Recording ---
+    def begin(self, name: str, args: dict = None) -> tuple:
+        """Starts a span; pass the returned token to end()."""
+        return (name, time.perf_counter(), args)
+
+    def end(self, token: tuple):
+        name, start, args = token
+        duration = time.perf_counter() - start
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'calls': 0, 'seconds': 0.0}
+        stage['calls'] += 1
+        stage['seconds'] += duration
+        if len(self.events) < self.max_events:
+            self.events.append((name, start, duration, threading.get_ident(), args))
+        else:
+            self.dropped_events += 1
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        token = self.begin(name, args or None)
+        try:
+            yield
+        finally:
+            self.end(token)
+
+    def count(self, name: str, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # --- Reporting ---
+    def report(self) -> dict:
+        """
+        Returns:
+            {'wall_seconds': float,
+             'stages': {name: {'calls', 'seconds'}},  slowest first
+             'counters': {name: number},
+             'summary': {'lp_solves', 'lp_solver_seconds', 'arrivals', 'rejections'}}
+        """
+        stages = dict(sorted(self.stages.items(), key=lambda item: -item[1]['seconds']))
+        return {
+            'wall_seconds': time.perf_counter() - self.origin,
+            'stages': {name: dict(stage) for name, stage in stages.items()},
+            'counters': dict(self.counters),
+            'summary': {
+                'lp_solves': self.counters.get('lp_solves', 0),
+                'lp_solver_seconds': sum(
+                    self.stages[name]['seconds'] for name in SOLVER_STAGES if name in self.stages
+                ),
+                'arrivals': self.counters.get('arrivals', 0),
+                'rejections': self.counters.get('rejections', 0)
+            }
+        }
+
+    def format_report(self) -> str:
+        """The report as an aligned text table."""
+        report = self.report()
+        lines = [f"{'Stage':<24} {'Calls':>8} {'Total':>11} {'Mean':>11}"]
+        for name, stage in report['stages'].items():
+            lines.append(f"{name:<24} {stage['calls']:>8} {stage['seconds'] * 1000:>9.1f}ms "
+                         f"{stage['seconds'] / stage['calls'] * 1000:>9.3f}ms")
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f"{name:<24} {value:>8}")
+        lines.append(f"Wall time: {report['wall_seconds']:.3f}s")
+        return "\n".join(lines)
+
+    def to_chrome_trace(self) -> dict:
+        """
+        The recorded spans in Chrome trace-event format: one complete
+        ('X') event per span, timestamps in microseconds, plus the final
+        counter values as counter ('C') events.
+        """
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'railway-rm'}}]
+        for name, start, duration, tid, args in self.events:
+            event = {
+                'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+        end_ts = (time.perf_counter() - self.origin) * 1e6
+        for name, value in sorted(self.counters.items()):
+            events.append({'name': name, 'ph': 'C', 'pid': pid, 'ts': end_ts, 'args': {name: value}})
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'dropped_events': self.dropped_events}
+        }
+
+    def write_chrome_trace(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+
+# --- Switching recording on and off ---
+@contextlib.contextmanager
+def recording(recorder: Recorder = None):
+    """Records every instrumented call inside the block into recorder (or a new one)."""
+    global _ACTIVE
+    recorder = recorder if recorder is not None else Recorder()
+    previous, _ACTIVE = _ACTIVE, recorder
+    try:
+        yield recorder
+    finally:
+        _ACTIVE = previous
+
+
+def enabled() -> bool:
+    return _ACTIVE is not None
+
+
+# --- Hooks (no-ops unless recording) ---
+def stage(name: str, **args):
+    """Context manager timing the block as `name`."""
+    if _ACTIVE is None:
+        return _NULL_SPAN
+    return _ACTIVE.span(name, **args)
+
+
+def begin(name: str, **args):
+    """Starts a span without a with-block (for long loops); returns a token or None."""
+    if _ACTIVE is None:
+        return None
+    return (_ACTIVE, _ACTIVE.begin(name, args or None))
+
+
+def end(token):
+    """Ends a span started with begin(), in the recorder that started it."""
+    if token is not None:
+        recorder, span = token
+        recorder.end(span)
+
+
+def count(name: str, n=1):
+    """Adds n to a counter."""
+    if _ACTIVE is not None:
+        _ACTIVE.count(name, n)
+
+
+def timed(name: str, counter: str = None):
+    """
+    Decorator timing every call of a function as stage `name`, and
+    optionally counting the calls in `counter`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _ACTIVE
+            if recorder is None:
+                return fn(*args, **kwargs)
+            if counter is not None:
+                recorder.count(counter)
+            token = recorder.begin(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.end(token)
+        return wrapper
+    return decorator
+
+
+# This block profiles a few simulation runs from the command line
+if __name__ == "__main__":
+    import sys
+    import numpy as np
+    # The hooks live in the imported module, not in this __main__ copy
+    import instrumentation
+    from simulation import run_dynamic_simulation
+
+    n_runs = 50
+    run_dynamic_simulation(stochastic_mode=True, quiet_mode=True) # Warm-up (forecast cache)
+    rng = np.random.default_rng(42)
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        run_dynamic_simulation(stochastic_mode=True, quiet_mode=True, rng=rng)
+    plain_time = time.perf_counter() - start
+
+    rng = np.random.default_rng(42)
+    with instrumentation.recording() as recorder:
+        start = time.perf_counter()
+        for _ in range(n_runs):
+            run_dynamic_simulation(stochastic_mode=True, quiet_mode=True, rng=rng)
+        recorded_time = time.perf_counter() - start
+
+    print(recorder.format_report())
+    print(f"\n{n_runs} runs: {plain_time:.3f}s without recording, {recorded_time:.3f}s with")
+    if len(sys.argv) > 1:
+        recorder.write_chrome_trace(sys.argv[1])
+        print(f"Chrome trace written to {sys.argv[1]}")
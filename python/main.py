@@ -2,66 +2,257 @@
 # This file can now be run directly OR imported by app.py --> NICE 
 
 import numpy as np
+import config
+import allocation_engine
+import booking_curve_model
+from engine import content_hash, forecast_cache_key
 from simulation import run_dynamic_simulation
-import io
-import contextlib
+from streaming_stats import RevenueAggregator
+import event_log
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # --- Monte Carlo Parameters ---
 N_SIMULATIONS = 100 # Number of times to run the simulation
+PROGRESS_EVERY = 10 # Runs per work chunk (and per progress update)
+MAX_ADAPTIVE_RUNS = 100_000 # Safety cap for adaptive mode without max_runs
 
-def run_analysis():
+
+class ProgressUpdate(str):
+    """
+    A progress message that is still a plain str for existing consumers
+    (app.py, the command line), but also carries structured fields such
+    as completed/total runs and the current confidence interval.
+    """
+    def __new__(cls, message: str, **fields):
+        update = super().__new__(cls, message)
+        update.__dict__.update(fields)
+        return update
+
+
+def revenue_upper_bound() -> float:
+    """Highest possible revenue: every seat sold at the top price of its class."""
+    bound = 0
+    for tc in config.TRAVEL_CLASSES:
+        top_price = 0
+        for q_config in config.QUOTA_CONFIG.values():
+            price_config = q_config['price_config'][tc]
+            if q_config['type'] == 'FLEXI':
+                top_price = max([top_price] + [b['price'] for b in price_config])
+            else:
+                top_price = max(top_price, price_config)
+        bound += config.CAPACITY[tc] * top_price
+    return float(bound)
+
+
+def analysis_cache_key(**run_args) -> str:
+    """
+    Content hash identifying a run_analysis() result: the forecast inputs
+    (history, factors, capacity, model parameters), the quota and fare
+    tables, the registered booking curves, the allocation settings and
+    the run arguments (seed, runs, policy, ...). Only meaningful when a
+    seed is given.
+    """
+    return content_hash(
+        forecast_cache_key(),
+        config.TRAVEL_CLASSES,
+        config.QUOTA_CONFIG,
+        config.BOOKING_WINDOW_DAYS,
+        booking_curve_model.REGISTRY.fingerprint(),
+        allocation_engine.POLICY_MINIMUMS,
+        allocation_engine.ALLOCATION_SOLVER,
+        run_args
+    )
+
+
+def _run_stochastic_chunk(seed_sequences: list, control_policy: str = 'partitioned',
+                          cache_key: str = None) -> list:
+    """
+    (Worker) Runs one stochastic simulation per seed sequence.
+
+    Each run gets its own independent stream, so the revenues only
+    depend on (seed, run index), never on which worker ran them.
+    The forecast cache key is hashed once per chunk at most (run_analysis
+    passes the one it computed for the whole batch).
+    """
+    if cache_key is None:
+        cache_key = forecast_cache_key()
+    return [
+        run_dynamic_simulation(
+            stochastic_mode=True,
+            quiet_mode=True,
+            rng=np.random.default_rng(seed_seq),
+            control_policy=control_policy,
+            cache_key=cache_key
+        )
+        for seed_seq in seed_sequences
+    ]
+
+
+def _aggregate_stochastic_chunk(seed_sequences: list, hist_range: tuple,
+                                control_policy: str = 'partitioned',
+                                cache_key: str = None) -> RevenueAggregator:
+    """(Worker) Runs a chunk and returns only its partial aggregator."""
+    return RevenueAggregator(*hist_range).update(_run_stochastic_chunk(seed_sequences, control_policy, cache_key))
+
+
+def _iter_chunk_aggregates(chunks: list, hist_range: tuple, pool=None, control_policy: str = 'partitioned',
+                           cache_key: str = None):
+    """
+    Yields one partial aggregator per chunk, always in chunk order, so the
+    merged floating-point result never depends on the number of workers.
+    """
+    if pool is None:
+        for chunk in chunks:
+            yield _aggregate_stochastic_chunk(chunk, hist_range, control_policy, cache_key)
+        return
+    futures = [pool.submit(_aggregate_stochastic_chunk, chunk, hist_range, control_policy, cache_key)
+               for chunk in chunks]
+    for future in futures:
+        yield future.result()
+
+
+def run_analysis(n_simulations: int = N_SIMULATIONS,
+                 seed: int = None,
+                 n_workers: int = 1,
+                 target_ci_abs: float = None,
+                 target_ci_rel: float = None,
+                 confidence: float = 0.95,
+                 time_budget: float = None,
+                 max_runs: int = None,
+                 control_policy: str = 'partitioned'):
     """
     Runs the full Monte Carlo analysis and returns the results.
     This function yields progress updates for the Streamlit UI.
+
+    Args:
+        n_simulations: Total number of runs (1 baseline + N-1 stochastic).
+        seed: Seed for the root numpy.random.SeedSequence. The same
+              (seed, n_simulations) gives bit-identical revenues for any
+              n_workers. If None, fresh entropy is drawn (and reported).
+        n_workers: Number of worker processes for the stochastic runs.
+                   1 runs everything in this process.
+        control_policy: Booking control used by every run
+                        ('partitioned', 'emsr_b', 'bid_price' or 'dp').
+
+    Adaptive mode (enabled by any of the arguments below) ignores
+    n_simulations and keeps running batches until the confidence-interval
+    half-width of the mean revenue is small enough, reporting the current
+    interval after each batch:
+        target_ci_abs: Target half-width in ₹.
+        target_ci_rel: Target half-width as a fraction of the mean (0.01 = 1%).
+        confidence: Confidence level of the interval.
+        time_budget: Stop after this many seconds.
+        max_runs: Stop after this many runs (default MAX_ADAPTIVE_RUNS).
     """
-    all_revenues = []
+    adaptive = any(v is not None for v in (target_ci_abs, target_ci_rel, time_budget, max_runs))
+    if adaptive and max_runs is None:
+        max_runs = MAX_ADAPTIVE_RUNS
+    start_time = time.perf_counter()
+
+    root_seq = np.random.SeedSequence(seed)
+    # One child stream per run: [baseline, stochastic_1, ..., stochastic_N-1].
+    # Spawning is incremental, so adaptive batches get the same streams
+    # a fixed run of the same length would.
+    run_seqs = root_seq.spawn(1)
+    # Hash the forecast inputs once for the whole batch, not once per run
+    forecast_key = forecast_cache_key()
     
     # --- Run 1: DETERMINISTIC (Baseline) ---
     yield "Running Deterministic (Baseline) Simulation..."
     
-    # We must capture the standard output from the detailed run
-    log_stream = io.StringIO()
-    with contextlib.redirect_stdout(log_stream):
+    # Collect the detailed run's log events (this thread only) for the UI
+    with event_log.capture(event_log.RingBufferSink()) as log_sink:
         baseline_revenue = run_dynamic_simulation(
             stochastic_mode=False, 
-            quiet_mode=False
+            quiet_mode=False,
+            rng=np.random.default_rng(run_seqs[0]),
+            control_policy=control_policy,
+            cache_key=forecast_key
         )
-    deterministic_log = log_stream.getvalue()
-    all_revenues.append(baseline_revenue)
+    deterministic_log = log_sink.text()
     
     yield "Deterministic run complete. Running stochastic simulations..."
 
     # --- Run N-1 stochastic simulations ---
-    for i in range(N_SIMULATIONS - 1):
-        revenue = run_dynamic_simulation(
-            stochastic_mode=True, 
-            quiet_mode=True
-        )
-        all_revenues.append(revenue)
-        
-        # Yield progress updates to the UI
-        current_sim_num = i + 2
-        if (current_sim_num % 10 == 0) or (current_sim_num == N_SIMULATIONS):
-             yield f"  Simulation {current_sim_num}/{N_SIMULATIONS} complete."
+    # Constant-memory statistics instead of a list of every revenue
+    hist_range = (0.0, revenue_upper_bound())
+    stats = RevenueAggregator(*hist_range).update(baseline_revenue)
+    completed = 1 # The baseline run
+    total_runs = max_runs if adaptive else n_simulations
+    stop_reason = 'n_simulations'
+
+    pool = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        while completed < total_runs:
+            # Fixed mode submits everything at once; adaptive mode runs one
+            # round (a chunk per worker) and then re-checks the interval.
+            remaining = total_runs - completed
+            if adaptive:
+                remaining = min(remaining, PROGRESS_EVERY * max(1, n_workers))
+            batch_seqs = root_seq.spawn(remaining)
+            chunks = [
+                batch_seqs[i:i + PROGRESS_EVERY]
+                for i in range(0, len(batch_seqs), PROGRESS_EVERY)
+            ]
+
+            partials = _iter_chunk_aggregates(chunks, hist_range, pool, control_policy, forecast_key)
+            for chunk, partial in zip(chunks, partials):
+                stats.merge(partial)
+                completed += len(chunk)
+                mean, half_width = stats.confidence_interval(confidence)
+                if adaptive:
+                    message = (f"  {completed} runs: mean ₹{mean:,.0f} ± ₹{half_width:,.0f} "
+                               f"({confidence:.0%} CI)")
+                else:
+                    message = f"  Simulation {completed}/{n_simulations} complete."
+                # Yield progress updates to the UI
+                yield ProgressUpdate(message, completed=completed, total=total_runs,
+                                     mean=mean, ci_half_width=half_width, stats=stats)
+
+            if adaptive:
+                mean, half_width = stats.confidence_interval(confidence)
+                if target_ci_abs is not None and half_width <= target_ci_abs:
+                    stop_reason = 'target_ci_abs'
+                elif target_ci_rel is not None and half_width <= target_ci_rel * abs(mean):
+                    stop_reason = 'target_ci_rel'
+                elif time_budget is not None and time.perf_counter() - start_time >= time_budget:
+                    stop_reason = 'time_budget'
+                elif completed >= max_runs:
+                    stop_reason = 'max_runs'
+                else:
+                    continue
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     yield "All simulations complete. Analyzing results..."
 
     # --- Final Analysis ---
-    mean_revenue = np.mean(all_revenues)
-    std_dev = np.std(all_revenues)
-    min_revenue = np.min(all_revenues)
-    max_revenue = np.max(all_revenues)
+    summary = stats.summary()
+    ci_mean, ci_half_width = stats.confidence_interval(confidence)
     
     # Return all results in a single dictionary
     results = {
         "baseline_revenue": baseline_revenue,
-        "mean_revenue": mean_revenue,
-        "std_dev": std_dev,
-        "min_revenue": min_revenue,
-        "max_revenue": max_revenue,
-        "all_revenues": all_revenues,
+        "mean_revenue": summary['mean'],
+        "std_dev": summary['std'],
+        "min_revenue": summary['min'],
+        "max_revenue": summary['max'],
+        "p5_revenue": summary['p5'],
+        "p50_revenue": summary['p50'],
+        "p95_revenue": summary['p95'],
+        "cvar_5_revenue": summary['cvar_5'],
+        "histogram": stats.histogram(),
+        "revenue_stats": stats,
         "deterministic_log": deterministic_log,
-        "n_simulations": N_SIMULATIONS
+        "n_simulations": completed,
+        "ci_half_width": ci_half_width,
+        "confidence": confidence,
+        "stop_reason": stop_reason,
+        "elapsed_seconds": time.perf_counter() - start_time,
+        "seed": root_seq.entropy
     }
     
     # --- THIS IS THE FIX ---
@@ -88,4 +279,9 @@ if __name__ == "__main__":
         print(f"Average (Mean) Revenue:         ₹{final_results['mean_revenue']:,.2f}")
         print(f"Standard Deviation:             ₹{final_results['std_dev']:,.2f}")
         print(f"Min Revenue (Worst Case):       ₹{final_results['min_revenue']:,.2f}")
-        print(f"Max Revenue (Best Case):        ₹{final_results['max_revenue']:,.2f}")
\ No newline at end of file
+        print(f"Max Revenue (Best Case):        ₹{final_results['max_revenue']:,.2f}")
+        print(f"P5 / P50 / P95 Revenue:         ₹{final_results['p5_revenue']:,.0f} / "
+              f"₹{final_results['p50_revenue']:,.0f} / ₹{final_results['p95_revenue']:,.0f}")
+        print(f"CVaR 5% (Mean of Worst 5%):     ₹{final_results['cvar_5_revenue']:,.2f}")
+        print(f"Mean {final_results['confidence']:.0%} CI Half-Width:         ±₹{final_results['ci_half_width']:,.2f}")
+        print(f"Seed:                           {final_results['seed']}")
\ No newline at end of file
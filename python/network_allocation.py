@@ -0,0 +1,227 @@
+# FILE 11: network_allocation.py (Origin-Destination Network LP)
+# Allocates capacity across itineraries that use several legs of a train.
+# Each itinerary x quota x bucket "product" consumes one seat on every leg
+# it covers. The constraint matrix is built directly as a sparse matrix
+# (no PuLP expression objects) and solved in-process with HiGHS.
+
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+import config
+import event_log
+from forecasting import forecast_demand_by_price_point_batch
+
+
+def line_itinerary_legs(origins: np.ndarray, destinations: np.ndarray) -> tuple:
+    """
+    Leg incidence for a single line of stations, where leg k joins
+    station k and k + 1, so itinerary o -> d covers legs o .. d-1.
+
+    Returns:
+        (itinerary_index, leg_index) arrays, one entry per (itinerary, leg).
+    """
+    origins = np.asarray(origins, dtype=np.int64)
+    destinations = np.asarray(destinations, dtype=np.int64)
+    n_legs = destinations - origins
+    itinerary_index = np.repeat(np.arange(len(origins)), n_legs)
+    # Position of each entry inside its own itinerary: 0, 1, ..., n_legs-1
+    offsets = np.arange(n_legs.sum()) - np.repeat(np.cumsum(n_legs) - n_legs, n_legs)
+    leg_index = np.repeat(origins, n_legs) + offsets
+    return (itinerary_index, leg_index)
+
+
+def build_leg_product_matrix(itinerary_legs: tuple,
+                             product_itinerary: np.ndarray,
+                             n_legs: int) -> sp.csr_matrix:
+    """
+    Builds the (legs x products) 0/1 incidence matrix A, where
+    A[l, p] = 1 if product p uses leg l.
+
+    Args:
+        itinerary_legs: (itinerary_index, leg_index) from line_itinerary_legs().
+        product_itinerary: (n_products,) itinerary of each product.
+    """
+    itin_of_entry, leg_of_entry = itinerary_legs
+    product_itinerary = np.asarray(product_itinerary, dtype=np.int64)
+    n_itineraries = int(itin_of_entry.max()) + 1 if len(itin_of_entry) else 0
+
+    # itinerary -> legs, as a sparse (itineraries x legs) matrix ...
+    itin_legs = sp.csr_matrix(
+        (np.ones(len(itin_of_entry)), (itin_of_entry, leg_of_entry)),
+        shape=(n_itineraries, n_legs)
+    )
+    # ... and product -> itinerary, so A = (P x I) @ (I x L), transposed.
+    product_itin = sp.csr_matrix(
+        (np.ones(len(product_itinerary)), (np.arange(len(product_itinerary)), product_itinerary)),
+        shape=(len(product_itinerary), n_itineraries)
+    )
+    return (product_itin @ itin_legs).T.tocsr()
+
+
+def solve_network_allocation(leg_capacity: np.ndarray,
+                             leg_product_matrix: sp.csr_matrix,
+                             prices: np.ndarray,
+                             demands: np.ndarray,
+                             quiet_mode: bool = True) -> dict:
+    """
+    Solves  max sum(price_p * x_p)
+            s.t. A x <= leg_capacity,  0 <= x_p <= demand_p
+
+    Returns:
+        {'allocation': (P,), 'revenue': float, 'bid_prices': (L,),
+         'status': str, 'solve_time': float}
+        bid_prices are the leg duals: the revenue of one more seat on each leg.
+    """
+    start = time.perf_counter()
+    prices = np.asarray(prices, dtype=float)
+    demands = np.asarray(demands, dtype=float)
+
+    res = linprog(
+        c=-prices,
+        A_ub=leg_product_matrix,
+        b_ub=np.asarray(leg_capacity, dtype=float),
+        bounds=np.column_stack([np.zeros_like(demands), demands]),
+        method='highs'
+    )
+    solve_time = time.perf_counter() - start
+
+    if res.status != 0:
+        if not quiet_mode:
+            event_log.warning('network_lp', "WARNING: Network LP status: {}", res.message)
+        return {
+            'allocation': np.zeros_like(prices),
+            'revenue': 0.0,
+            'bid_prices': np.zeros(leg_product_matrix.shape[0]),
+            'status': res.message,
+            'solve_time': solve_time
+        }
+
+    result = {
+        'allocation': res.x,
+        'revenue': -res.fun,
+        # linprog minimises -revenue, so the duals come back non-positive
+        'bid_prices': -res.ineqlin.marginals,
+        'status': 'Optimal',
+        'solve_time': solve_time
+    }
+    if not quiet_mode:
+        event_log.info('network_lp', "Network LP solved in {:.1f} ms. Revenue: ₹{:,.0f}",
+                       solve_time * 1000, result['revenue'])
+    return result
+
+
+def build_network_products(origins: np.ndarray,
+                           destinations: np.ndarray,
+                           od_market_mu: dict,
+                           tc: str,
+                           n_stations: int) -> dict:
+    """
+    Expands O-D pairs into itinerary x quota x bucket products for one
+    travel class, using config.QUOTA_CONFIG prices scaled by distance and
+    the price-elastic bucket split from forecasting.
+
+    Args:
+        od_market_mu: {q_code: (n_itineraries,) total-market demand}.
+
+    Returns:
+        {'product_itinerary', 'prices', 'demands', 'quota', 'bucket'} arrays.
+    """
+    distance_share = (np.asarray(destinations) - np.asarray(origins)) / float(n_stations - 1)
+    parts = {'product_itinerary': [], 'prices': [], 'demands': [], 'quota': [], 'bucket': []}
+
+    for q_code, q_config in config.QUOTA_CONFIG.items():
+        if q_config['type'] == 'FLEXI':
+            price_buckets = q_config['price_config'][tc]
+        else:
+            price_buckets = [{'price': q_config['price_config'][tc]}]
+
+        (cumulative, prices) = forecast_demand_by_price_point_batch(od_market_mu[q_code], price_buckets)
+        independent = cumulative.copy()
+        independent[:, :-1] -= cumulative[:, 1:]
+
+        n_itin, n_buckets = independent.shape
+        parts['product_itinerary'].append(np.repeat(np.arange(n_itin), n_buckets))
+        parts['prices'].append((distance_share[:, None] * np.asarray(prices)[None, :]).ravel())
+        parts['demands'].append(independent.ravel())
+        parts['quota'].append(np.full(n_itin * n_buckets, q_code))
+        parts['bucket'].append(np.tile(np.arange(n_buckets), n_itin))
+
+    return {k: np.concatenate(v) for k, v in parts.items()}
+
+
+def benchmark_network_allocation(n_stations: int = 50,
+                                 n_od_pairs: int = 1000,
+                                 tc: str = '3AC',
+                                 seed=None,
+                                 compare_pulp: bool = True) -> dict:
+    """
+    Times the sparse build and the HiGHS solve on a synthetic line
+    network (default: 50 stations, 1,000 O-D pairs). With compare_pulp,
+    also times building the same constraints as PuLP expressions.
+    """
+    rng = np.random.default_rng(seed)
+
+    # --- Synthetic O-D pairs on a line ---
+    all_pairs = np.array([(o, d) for o in range(n_stations) for d in range(o + 1, n_stations)])
+    chosen = all_pairs[rng.choice(len(all_pairs), size=min(n_od_pairs, len(all_pairs)), replace=False)]
+    origins, destinations = chosen[:, 0], chosen[:, 1]
+    n_legs = n_stations - 1
+
+    od_market_mu = {
+        q_code: np.trunc(rng.gamma(2.0, scale, size=len(chosen)))
+        for q_code, scale in (('GN', 3.0), ('TK', 1.0), ('LD', 0.5))
+        if q_code in config.QUOTA_CONFIG
+    }
+
+    # --- Build ---
+    start = time.perf_counter()
+    products = build_network_products(origins, destinations, od_market_mu, tc, n_stations)
+    itinerary_legs = line_itinerary_legs(origins, destinations)
+    A = build_leg_product_matrix(itinerary_legs, products['product_itinerary'], n_legs)
+    build_time = time.perf_counter() - start
+
+    # --- Solve ---
+    leg_capacity = np.full(n_legs, config.CAPACITY[tc])
+    result = solve_network_allocation(leg_capacity, A, products['prices'], products['demands'])
+
+    report = {
+        'n_stations': n_stations,
+        'n_od_pairs': len(chosen),
+        'n_products': len(products['prices']),
+        'nonzeros': A.nnz,
+        'build_time': build_time,
+        'solve_time': result['solve_time'],
+        'revenue': result['revenue'],
+        'max_bid_price': float(result['bid_prices'].max())
+    }
+
+    if compare_pulp:
+        import pulp
+        start = time.perf_counter()
+        prob = pulp.LpProblem("Network_Allocation", pulp.LpMaximize)
+        x_vars = [
+            pulp.LpVariable(f"x_{p}", lowBound=0, upBound=float(products['demands'][p]))
+            for p in range(len(products['prices']))
+        ]
+        prob += pulp.lpSum(products['prices'][p] * x_vars[p] for p in range(len(x_vars)))
+        A_csr = A.tocsr()
+        for leg in range(n_legs):
+            cols = A_csr.indices[A_csr.indptr[leg]:A_csr.indptr[leg + 1]]
+            prob += pulp.lpSum(x_vars[p] for p in cols) <= float(leg_capacity[leg]), f"Leg_{leg}"
+        report['pulp_build_time'] = time.perf_counter() - start
+
+    return report
+
+
+# This block lets you run the benchmark from the command line
+if __name__ == "__main__":
+    report = benchmark_network_allocation(seed=42)
+    print(f"Stations / O-D pairs:   {report['n_stations']} / {report['n_od_pairs']}")
+    print(f"Products (variables):   {report['n_products']:,}  (nonzeros: {report['nonzeros']:,})")
+    print(f"Sparse build time:      {report['build_time'] * 1000:.1f} ms")
+    if 'pulp_build_time' in report:
+        print(f"PuLP build time:        {report['pulp_build_time'] * 1000:.1f} ms")
+    print(f"HiGHS solve time:       {report['solve_time'] * 1000:.1f} ms")
+    print(f"Optimal revenue:        ₹{report['revenue']:,.0f}")
+    print(f"Highest leg bid price:  ₹{report['max_bid_price']:,.0f}")
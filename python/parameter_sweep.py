@@ -0,0 +1,346 @@
+# FILE 25: parameter_sweep.py (Parallel Parameter Sweeps with a Result Cache)
+# Explores the model's key assumptions without editing code. Each sweep
+# point overrides some of these module constants:
+#   spill_factor      unconstraining.DAILY_SPILL_FACTOR
+#   elasticity        forecasting.PRICE_ELASTICITY_COEFFICIENT
+#   sigma_fraction    forecasting.FORECAST_SIGMA_FRACTION
+#   capacity_<tc>     config.CAPACITY[tc]
+#   ld_minimum_<tc>   allocation_engine.POLICY_MINIMUMS[tc]['LD']
+# and is scored with the batch Monte Carlo engine.
+#
+# Points come from grid(), random_points() or latin_hypercube(). Points
+# are evaluated in a process pool. Each result is cached on disk under
+# the hash of every model input with the point applied, so re-running or
+# extending a sweep only computes the new points. run_sweep() returns a
+# tidy columnar table: one row per point, one column per parameter and
+# per metric, ready to pivot into heatmaps.
+
+import os
+import csv
+import json
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import numpy as np
+import config
+import forecasting
+import unconstraining
+import allocation_engine
+import event_log
+
+SWEEP_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'orbit', 'sweeps')
+SWEEP_VERSION = 2 # Bump to invalidate cached results when the metrics change
+
+_MISSING = object()
+
+# Metrics of evaluate_point(), in table column order
+METRICS = ('mean_revenue', 'std_revenue', 'revenue_p05', 'revenue_p95',
+           'deterministic_revenue', 'load_factor', 'rejection_rate')
+
+
+# --- Sweepable parameters ---
+def _module_constant(module, name: str) -> tuple:
+    """(Internal) (getter, setter) of a module-level constant."""
+    return (lambda: getattr(module, name), lambda value: setattr(module, name, value))
+
+
+def _dict_entry(table: dict, *path) -> tuple:
+    """
+    (Internal) (getter, setter) of a nested dict entry. The dicts are
+    updated in place, so modules that imported them by name see the
+    change. Setting _MISSING removes the entry.
+    """
+    *parents, leaf = path
+
+    def getter():
+        node = table
+        for key in parents:
+            node = node.get(key, {})
+        return node.get(leaf, _MISSING)
+
+    def setter(value):
+        node = table
+        for key in parents:
+            node = node.setdefault(key, {})
+        if value is _MISSING:
+            node.pop(leaf, None)
+            if parents and not node: # Drop the (now empty) dict setdefault() created
+                parent = table
+                for key in parents[:-1]:
+                    parent = parent[key]
+                parent.pop(parents[-1])
+        else:
+            node[leaf] = value
+    return getter, setter
+
+
+PARAMETERS = {
+    'spill_factor': _module_constant(unconstraining, 'DAILY_SPILL_FACTOR'),
+    'elasticity': _module_constant(forecasting, 'PRICE_ELASTICITY_COEFFICIENT'),
+    'sigma_fraction': _module_constant(forecasting, 'FORECAST_SIGMA_FRACTION'),
+    **{f"capacity_{tc}": _dict_entry(config.CAPACITY, tc) for tc in config.TRAVEL_CLASSES},
+    **{f"ld_minimum_{tc}": _dict_entry(allocation_engine.POLICY_MINIMUMS, tc, 'LD')
+       for tc in config.TRAVEL_CLASSES},
+}
+INTEGER_PARAMETERS = {name for name in PARAMETERS if name.startswith(('capacity_', 'ld_minimum_'))}
+
+
+def current_value(name: str):
+    """The parameter's value in the current configuration (0 for an unset LD minimum)."""
+    value = PARAMETERS[name][0]()
+    return 0 if value is _MISSING else value
+
+
+@contextlib.contextmanager
+def apply_parameters(point: dict):
+    """Overrides the point's parameters for the duration of the block."""
+    unknown = [name for name in point if name not in PARAMETERS]
+    if unknown:
+        raise ValueError(f"Unknown sweep parameter(s) {unknown}. Options: {list(PARAMETERS)}")
+    previous = {name: PARAMETERS[name][0]() for name in point}
+    try:
+        for name, value in point.items():
+            PARAMETERS[name][1](int(value) if name in INTEGER_PARAMETERS else float(value))
+        yield
+    finally:
+        for name, value in previous.items():
+            PARAMETERS[name][1](value)
+
+
+# --- Sampling ---
+def grid(**axes) -> list:
+    """Every combination of the given values, e.g. grid(elasticity=[1, 1.5, 2], capacity_3AC=[100, 110])."""
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def _scale(unit: np.ndarray, ranges: dict) -> list:
+    """(Internal) Maps (n, d) points in [0, 1) onto the parameter ranges."""
+    points = []
+    for row in unit:
+        point = {}
+        for u, (name, (low, high)) in zip(row, ranges.items()):
+            value = low + u * (high - low)
+            point[name] = int(round(value)) if name in INTEGER_PARAMETERS else float(value)
+        points.append(point)
+    return points
+
+
+def random_points(ranges: dict, n_points: int, seed=None) -> list:
+    """n_points drawn uniformly from ranges = {name: (low, high)}."""
+    rng = np.random.default_rng(seed)
+    return _scale(rng.random((n_points, len(ranges))), ranges)
+
+
+def latin_hypercube(ranges: dict, n_points: int, seed=None) -> list:
+    """
+    n_points Latin-hypercube samples from ranges = {name: (low, high)}:
+    each parameter's range is cut into n_points equal strata and every
+    stratum is used exactly once, so each axis is evenly covered.
+    """
+    rng = np.random.default_rng(seed)
+    strata = np.argsort(rng.random((len(ranges), n_points)), axis=1).T # (n, d) permutations
+    return _scale((strata + rng.random((n_points, len(ranges)))) / n_points, ranges)
+
+
+# --- Evaluating one point ---
+def point_cache_key(point: dict, n_scenarios: int, seed) -> str:
+    """Content hash of every model input with the point applied, plus the run settings."""
+    # Imported here: main pulls in the whole simulation stack
+    from main import analysis_cache_key
+    with apply_parameters(point):
+        return analysis_cache_key(sweep_version=SWEEP_VERSION, n_scenarios=n_scenarios, seed=seed)
+
+
+def evaluate_point(point: dict, n_scenarios: int = 1000, seed=42) -> dict:
+    """
+    (Worker) Runs the batch Monte Carlo engine with the point applied.
+    Every point uses the same seed (for the batch runs and the
+    deterministic run's arrivals), so neighbouring points share their
+    random draws, differences between them are smooth, and a cached
+    result never depends on which process computed it.
+
+    Returns:
+        {'mean_revenue', 'std_revenue', 'revenue_p05', 'revenue_p95',
+         'deterministic_revenue', 'load_factor', 'rejection_rate'}
+    """
+    from batch_simulation import run_batch_simulation
+    from simulation import run_dynamic_simulation
+
+    with apply_parameters(point):
+        results = run_batch_simulation(n_scenarios, stochastic_mode=True, seed=seed)
+        with event_log.capture(): # Drop the console events quiet_mode does not cover
+            deterministic = run_dynamic_simulation(stochastic_mode=False, quiet_mode=True,
+                                                   rng=np.random.default_rng(seed))
+        total_capacity = sum(config.CAPACITY[tc] for tc in config.TRAVEL_CLASSES)
+
+    revenue = np.asarray(results['revenue'], dtype=float)
+    sold = sum(np.asarray(seats) for seats in results['seats_sold'].values())
+    rejected = sum(np.asarray(r) for class_r in results['rejections'].values() for r in class_r.values())
+    requests = sold + rejected
+    return {
+        'mean_revenue': float(revenue.mean()),
+        'std_revenue': float(revenue.std(ddof=1)) if len(revenue) > 1 else 0.0,
+        'revenue_p05': float(np.percentile(revenue, 5)),
+        'revenue_p95': float(np.percentile(revenue, 95)),
+        'deterministic_revenue': float(deterministic),
+        'load_factor': float(sold.mean() / total_capacity) if total_capacity else 0.0,
+        'rejection_rate': float(rejected.sum() / requests.sum()) if requests.sum() else 0.0
+    }
+
+
+def _evaluate_or_error(point: dict, n_scenarios: int, seed) -> tuple:
+    """
+    (Worker) evaluate_point() that never raises, so one failing point
+    (e.g. an LD minimum the LP cannot meet) does not abort the sweep.
+
+    Returns:
+        (metrics, None), or (NaN metrics, error message) if the point failed.
+    """
+    try:
+        return evaluate_point(point, n_scenarios, seed), None
+    except Exception as e:
+        return {metric: float('nan') for metric in METRICS}, f"{type(e).__name__}: {e}"
+
+
+def _load_cached(cache_dir: str, key: str):
+    path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['metrics']
+
+
+def _save_cached(cache_dir: str, key: str, point: dict, metrics: dict):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'point': point, 'metrics': metrics}, f)
+    os.replace(tmp_path, path) # Atomic: concurrent sweeps never read half a file
+
+
+# --- Sweeps ---
+def run_sweep(points: list,
+              n_scenarios: int = 1000,
+              seed=42,
+              n_workers: int = 1,
+              cache_dir: str = SWEEP_CACHE_DIR,
+              quiet: bool = True) -> dict:
+    """
+    Evaluates every point, reusing cached results.
+
+    Args:
+        points: Parameter dicts, e.g. from grid() or latin_hypercube().
+        n_scenarios: Monte Carlo scenarios per point.
+        n_workers: Worker processes for the uncached points (1 = this process).
+        cache_dir: Directory of the per-point result cache (None = no caching).
+
+    Returns:
+        A tidy columnar table {column: list}, one row per point in input
+        order: every swept parameter (points that leave one out get its
+        current value), every evaluate_point() metric, 'cached', and
+        'error' (None, or why the point failed; its metrics are then NaN
+        and it is not cached).
+    """
+    start = time.perf_counter()
+    points = [dict(point) for point in points]
+    names = list(dict.fromkeys(name for point in points for name in point))
+    keys = [point_cache_key(point, n_scenarios, seed) for point in points]
+
+    metrics = [None] * len(points)
+    errors = [None] * len(points)
+    cached = [False] * len(points)
+    if cache_dir:
+        for i, key in enumerate(keys):
+            metrics[i] = _load_cached(cache_dir, key)
+            cached[i] = metrics[i] is not None
+
+    # Identical points (same key) are only computed once
+    todo = {}
+    for i, key in enumerate(keys):
+        if metrics[i] is None:
+            todo.setdefault(key, []).append(i)
+
+    pool = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 and len(todo) > 1 else None
+    try:
+        if pool is None:
+            results = (_evaluate_or_error(points[rows[0]], n_scenarios, seed) for rows in todo.values())
+        else:
+            futures = [pool.submit(_evaluate_or_error, points[rows[0]], n_scenarios, seed)
+                       for rows in todo.values()]
+            results = (future.result() for future in futures)
+        for (key, rows), (result, error) in zip(todo.items(), results):
+            if cache_dir and error is None:
+                _save_cached(cache_dir, key, points[rows[0]], result)
+            for i in rows:
+                metrics[i], errors[i] = result, error
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if not quiet:
+        event_log.info('sweep', "Swept {} points ({} computed, {} from cache) in {:.2f}s",
+                       len(points), len(todo), sum(cached), time.perf_counter() - start)
+    n_failed = sum(error is not None for error in errors)
+    if n_failed:
+        event_log.warning('sweep', "{} of {} points failed (NaN metrics), e.g. {}",
+                          n_failed, len(points), next(e for e in errors if e is not None))
+
+    table = {name: [point.get(name, current_value(name)) for point in points] for name in names}
+    for metric in METRICS:
+        table[metric] = [m[metric] for m in metrics]
+    table['cached'] = cached
+    table['error'] = errors
+    return table
+
+
+# --- Output ---
+def to_dataframe(table: dict):
+    """The table as a pandas DataFrame (needs the optional pandas package)."""
+    import pandas as pd
+    return pd.DataFrame(table)
+
+
+def write_table(table: dict, path: str):
+    """Writes the table as CSV, or as Parquet for a .parquet path (needs pyarrow or pandas)."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            pa = None
+        if pa is not None:
+            pq.write_table(pa.Table.from_pydict(table), path)
+        else:
+            to_dataframe(table).to_parquet(path)
+        return
+    columns = list(table)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(table[c] for c in columns)))
+
+
+# This block runs an example sweep from the command line
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    points = grid(elasticity=[1.0, 1.5, 2.0, 2.5], capacity_3AC=[90, 110, 130], ld_minimum_3AC=[0, 2, 5])
+    points += latin_hypercube({'spill_factor': (0.0, 0.16), 'sigma_fraction': (0.05, 0.3)}, 16, seed=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ('Cold sweep', 'Re-run'):
+            start = time.perf_counter()
+            table = run_sweep(points, n_scenarios=1000, n_workers=4, cache_dir=tmp)
+            print(f"{label + ':':<12} {len(points)} points in {time.perf_counter() - start:.2f}s "
+                  f"({sum(table['cached'])} cached)")
+
+    print(f"\n{'Elasticity':>10} {'Cap 3AC':>8} {'LD min':>7} {'Mean revenue':>14} {'Load':>6}")
+    for i in range(36):
+        print(f"{table['elasticity'][i]:>10} {table['capacity_3AC'][i]:>8} {table['ld_minimum_3AC'][i]:>7} "
+              f"₹{table['mean_revenue'][i]:>13,.0f} {table['load_factor'][i]:>6.1%}")
+    if len(sys.argv) > 1:
+        write_table(table, sys.argv[1])
+        print(f"Table written to {sys.argv[1]}")
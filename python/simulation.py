@@ -1,20 +1,128 @@
 # FILE 7: simulation.py (UPDATED for Stochastic/Quiet Mode)
 
+import time
 import numpy as np
 import config
+import event_log
+import instrumentation
 from engine import get_quota_forecasts 
-from allocation_engine import partition_capacity_by_quota, partition_quota_into_buckets
-# Import both curves
-from booking_curve_model import GENERAL_PICKUP_CURVE, LADIES_PICKUP_CURVE
+from allocation_engine import partition_capacity_by_quota, partition_quota_into_buckets, POLICY_MINIMUMS
+from booking_curve_model import REGISTRY as CURVE_REGISTRY
+from booking_controls import build_control, CONTROL_POLICIES
+from allocation_plan import AllocationPlan
 
-def _get_or_initialize_key(data_dict, key, default_val=0):
-    """Helper to safely initialize nested dict keys."""
-    if key not in data_dict:
-        data_dict[key] = default_val
-    return data_dict[key]
 
+# --- (NEW) Re-optimization checkpoints ---
+def reoptimization_checkpoints(every: int = 10, include_tatkal: bool = True) -> list:
+    """
+    Builds a checkpoint schedule for run_dynamic_simulation(reoptimize_days=...).
+    
+    Args:
+        every: Re-optimize every `every` days (e.g. days 110, 100, ..., 10).
+        include_tatkal: Also re-optimize on the day each FLAT quota opens.
+    
+    Returns:
+        A list of days, latest-first.
+    """
+    days = set(range(config.BOOKING_WINDOW_DAYS - every, 0, -every)) if every else set()
+    if include_tatkal:
+        days.update(
+            q_config['booking_window_open'] for q_config in config.QUOTA_CONFIG.values()
+            if q_config['booking_window_open'] < config.BOOKING_WINDOW_DAYS
+        )
+    return sorted(days, reverse=True)
+
+
+@instrumentation.timed('simulation.reoptimize')
+def _reoptimize_class(tc: str, class_forecasts: dict, remaining_share: dict,
+                      class_seats_sold: dict, class_arrivals: dict) -> dict:
+    """
+    (Internal) Re-forecasts the remaining demand of one class and re-solves
+    its Master and Inner allocations for the remaining capacity.
+    
+    The remaining demand blends the observed pickup with the prior
+    forecast, weighted by how much of the booking curve has elapsed:
+    expected total = observed + remaining_share * prior, of which
+    remaining_share still has to arrive. It is split over the buckets in
+    proportion to each bucket's re-forecast demand net of its sales, so
+    buckets that already sold out are not re-opened.
+    
+    Returns:
+        New bucket limits for the class ({'GN_Bucket_0_Allocation': ...}),
+        counted from the start of the window (seats already sold included).
+    """
+    remaining_forecasts = {}
+    sold_by_quota = {}
+    for q_code, forecast_data in class_forecasts.items():
+        share = remaining_share[q_code]
+        prior = forecast_data['total_demand']
+        expected_total = class_arrivals.get(q_code, 0) + share * prior
+        remaining_demand = share * expected_total
+        
+        scale = expected_total / prior if prior > 0 else 0.0
+        unsold = [
+            max(d * scale - class_seats_sold.get(f"{q_code}_Bucket_{i}", 0), 0)
+            for i, d in enumerate(forecast_data['independent_bucket_demands'])
+        ]
+        unsold_total = sum(unsold)
+        # Whole seats, rounded up so truncation never closes a bucket early
+        bucket_demands = [
+            int(np.ceil(u * remaining_demand / unsold_total - 1e-9)) if unsold_total > 0 else 0
+            for u in unsold
+        ]
+        
+        remaining_forecasts[q_code] = {
+            'total_demand': sum(bucket_demands),
+            'avg_revenue_per_seat': (
+                sum(d * p for d, p in zip(bucket_demands, forecast_data['prices'])) / sum(bucket_demands)
+                if sum(bucket_demands) > 0 else forecast_data['avg_revenue_per_seat']
+            ),
+            'independent_bucket_demands': bucket_demands,
+            'prices': forecast_data['prices']
+        }
+        sold_by_quota[q_code] = sum(
+            sold for key, sold in class_seats_sold.items() if key.startswith(f"{q_code}_Bucket_")
+        )
+    
+    remaining_capacity = config.CAPACITY[tc] - sum(sold_by_quota.values())
+    # Policy minimums count seats already sold towards the quota
+    remaining_minimums = {
+        q_code: min(max(minimum - sold_by_quota.get(q_code, 0), 0),
+                    int(remaining_forecasts[q_code]['total_demand']))
+        for q_code, minimum in POLICY_MINIMUMS.get(tc, {}).items()
+        if q_code in remaining_forecasts
+    }
+    master_alloc = partition_capacity_by_quota(
+        remaining_forecasts, remaining_capacity, tc,
+        quiet_mode=True, policy_minimums=remaining_minimums
+    )
+    
+    new_limits = {}
+    for q_code, q_config in config.QUOTA_CONFIG.items():
+        quota_allocation = master_alloc.get(f"{q_code}_Allocation", 0)
+        if q_config['type'] == 'FLEXI':
+            prices = remaining_forecasts[q_code]['prices']
+            inner_alloc = {}
+            if quota_allocation > 0:
+                inner_alloc = partition_quota_into_buckets(
+                    remaining_forecasts[q_code]['independent_bucket_demands'],
+                    prices, quota_allocation, q_code, quiet_mode=True
+                )
+            for i in range(len(prices)):
+                alloc_key = f"{q_code}_Bucket_{i}_Allocation"
+                new_limits[alloc_key] = class_seats_sold.get(f"{q_code}_Bucket_{i}", 0) + int(inner_alloc.get(alloc_key, 0))
+        elif q_config['type'] == 'FLAT':
+            new_limits[f"{q_code}_Bucket_0_Allocation"] = class_seats_sold.get(f"{q_code}_Bucket_0", 0) + quota_allocation
+    return new_limits
 
-def run_dynamic_simulation(stochastic_mode: bool = False, quiet_mode: bool = False): # <-- (NEW)
+
+@instrumentation.timed('simulation')
+def run_dynamic_simulation(stochastic_mode: bool = False, quiet_mode: bool = False, # <-- (NEW)
+                           rng: np.random.Generator = None,
+                           reoptimize_days: list = None,
+                           reoptimization_report: dict = None,
+                           control_policy: str = 'partitioned',
+                           cache_key: str = None):
     """
     (UPDATED) Simulates the 120-day booking window using
     a 2-step static allocation and quota-specific booking curves.
@@ -22,32 +130,56 @@ def run_dynamic_simulation(stochastic_mode: bool = False, quiet_mode: bool = Fal
     (NEW) Args:
         stochastic_mode: Passed to engine.get_quota_forecasts()
         quiet_mode: Suppresses all print output for fast simulation runs.
+        rng: Random generator for demand sampling and arrivals.
+             Defaults to the global np.random state.
+        reoptimize_days: Days (e.g. reoptimization_checkpoints()) at whose
+                         start the remaining demand is re-forecast and the
+                         allocations of each class that took arrivals since
+                         its last solve are re-solved. None = static plan.
+        reoptimization_report: Optional dict, filled with the checkpoint
+                               counts and the solve time re-optimization added.
+        control_policy: 'partitioned' (static LP plan, first come first
+                        served), 'emsr_b' (nested EMSR-b limits within the
+                        Master quota split), 'bid_price' (dynamic bid
+                        prices over the whole class) or 'dp' (Lee-Hersh
+                        DP thresholds). See booking_controls.
+        cache_key: Precomputed engine.forecast_cache_key(), passed to
+                   get_quota_forecasts() (computed per call if None).
     """
+    if control_policy not in CONTROL_POLICIES:
+        raise ValueError(f"Unknown control policy '{control_policy}'. Options: {CONTROL_POLICIES}")
+    if reoptimize_days and control_policy != 'partitioned':
+        raise ValueError("reoptimize_days is only supported with control_policy='partitioned'")
+    rng = rng if rng is not None else np.random
     
     # --- 1. OFFLINE PHASE: Run Forecasts ---
     # Pass the stochastic_mode flag to the forecasting engine
     # Note: get_quota_forecasts uses stochastic_mode to set its own quiet param
-    all_quota_forecasts = get_quota_forecasts(stochastic_mode=stochastic_mode)
+    all_quota_forecasts = get_quota_forecasts(stochastic_mode=stochastic_mode, rng=rng, cache_key=cache_key)
     
     # --- 2. OFFLINE PHASE: Run Master Allocation (Quota vs Quota) ---
+    # (Bid-price and DP controls need no quota split, so they skip both LP phases)
     master_allocations = {}
-    if not quiet_mode:
-        print("\n--- RUNNING MASTER ALLOCATION ENGINE (Quota vs. Quota) ---")
-    for tc in config.TRAVEL_CLASSES:
+    plan_classes = config.TRAVEL_CLASSES if control_policy in ('partitioned', 'emsr_b') else []
+    if not quiet_mode and plan_classes:
+        event_log.info('allocation', "\n--- RUNNING MASTER ALLOCATION ENGINE (Quota vs. Quota) ---")
+    for tc in plan_classes:
         master_allocations[tc] = partition_capacity_by_quota(
             all_quota_forecasts[tc],
             config.CAPACITY[tc],
             tc, # <-- Pass travel class for policy constraints
             quiet_mode=quiet_mode # <-- Pass quiet_mode
         )
-    if not quiet_mode:
-        print(f"\n--- MASTER ALLOCATIONS COMPLETE: {master_allocations} ---")
+    if not quiet_mode and plan_classes:
+        event_log.info('allocation', "\n--- MASTER ALLOCATIONS COMPLETE: {} ---", master_allocations)
     
     # --- 3. OFFLINE PHASE: Run Inner Allocation (Bucket vs Bucket) ---
+    # (Only the partitioned plan uses per-bucket allocations)
     final_bucket_allocations = {}
-    if not quiet_mode:
-        print("\n--- RUNNING INNER ALLOCATION ENGINE (Bucket vs. Bucket) ---")
-    for tc in config.TRAVEL_CLASSES:
+    plan_classes = config.TRAVEL_CLASSES if control_policy == 'partitioned' else []
+    if not quiet_mode and plan_classes:
+        event_log.info('allocation', "\n--- RUNNING INNER ALLOCATION ENGINE (Bucket vs. Bucket) ---")
+    for tc in plan_classes:
         final_bucket_allocations[tc] = {}
         for q_code, q_config in config.QUOTA_CONFIG.items():
             
@@ -71,132 +203,153 @@ def run_dynamic_simulation(stochastic_mode: bool = False, quiet_mode: bool = Fal
                 final_bucket_allocations[tc][f"{q_code}_Bucket_0_Allocation"] = quota_total_allocation
     
     # --- THIS WAS THE HELL LINE MAN ---
-    if not quiet_mode:
+    if not quiet_mode and plan_classes:
     # --- END OF BUG FIX --- NICE NICE
-        print(f"\n--- FINAL BUCKET ALLOCATIONS COMPLETE: {final_bucket_allocations} ---")
+        event_log.info('allocation', "\n--- FINAL BUCKET ALLOCATIONS COMPLETE: {} ---", final_bucket_allocations)
+    
+    # --- (NEW) Nested / bid-price controls replace the static bucket limits ---
+    control = None
+    if control_policy != 'partitioned':
+        with instrumentation.stage('simulation.control', policy=control_policy):
+            control = build_control(control_policy, all_quota_forecasts, master_allocations)
+        if not quiet_mode:
+            event_log.info('allocation', "\n--- BOOKING CONTROL: {} ---", control_policy)
 
     
     # --- 4. ONLINE PHASE: Initialize Simulation ---
     if not quiet_mode:
-        print(f"\n--- RUNNING *DYNAMIC* ONLINE SIMULATION ({config.BOOKING_WINDOW_DAYS} Days) ---")
+        event_log.info('simulation', "\n--- RUNNING *DYNAMIC* ONLINE SIMULATION ({} Days) ---", config.BOOKING_WINDOW_DAYS)
     
-    total_revenue = 0
-    seats_sold = {}
-    bookings_accepted = {}
-    bookings_rejected = {}
+    # (UPDATED) Compiled plan: integer-indexed limits, sales and rejections
+    # per (class, quota, bucket); the dict outputs are built at the end
+    plan = AllocationPlan()
+    for tc, class_bucket_allocs in final_bucket_allocations.items():
+        plan.set_limits(tc, class_bucket_allocs)
     
-    for tc in config.TRAVEL_CLASSES:
-        bookings_rejected[tc] = {}
-        seats_sold[tc] = {} 
-        bookings_accepted[tc] = {} 
+    # --- (NEW) Re-optimization state ---
+    checkpoints = set(reoptimize_days or [])
+    report = reoptimization_report if reoptimization_report is not None else {}
+    report.update({'checkpoints': 0, 'classes_resolved': 0, 'classes_skipped': 0, 'solve_time': 0.0})
+    arrivals_seen = {tc: {} for tc in config.TRAVEL_CLASSES}
+    class_changed = {tc: False for tc in config.TRAVEL_CLASSES}
+    remaining_share = {}
+    if checkpoints:
+        for tc in config.TRAVEL_CLASSES:
+            # remaining_share[tc][q][d] = share of demand arriving on day d or later
+            remaining_share[tc] = {
+                q_code: np.cumsum(CURVE_REGISTRY.daily_fractions(q_code, tc, q_config))
+                for q_code, q_config in config.QUOTA_CONFIG.items()
+            }
+    
+    # (UPDATED) Expected arrivals per day and quota, from the curve registry:
+    # daily_rates[tc][day][q] = total demand of quota q * its share arriving on day
+    q_codes = list(config.QUOTA_CONFIG)
+    daily_rates = {
+        tc: (CURVE_REGISTRY.class_daily_fractions(tc) * np.asarray(
+            [all_quota_forecasts[tc][q_code]['total_demand'] for q_code in q_codes], dtype=float
+        )).tolist()
+        for tc in config.TRAVEL_CLASSES
+    }
         
     # --- 5. Main Simulation Loop (Day 120 down to Day 1) ---
+    online_span = instrumentation.begin('simulation.arrivals')
+    total_arrivals = 0
     for day in range(config.BOOKING_WINDOW_DAYS, 0, -1):
         if not quiet_mode:
-            print(f"\n================ DAY {day} (Booking Window Open) ================")
+            event_log.info('simulation', "\n================ DAY {} (Booking Window Open) ================", day)
+        
+        # --- (NEW) Re-optimization checkpoint ---
+        if day in checkpoints:
+            report['checkpoints'] += 1
+            start = time.perf_counter()
+            for tc in config.TRAVEL_CLASSES:
+                if not class_changed[tc]:
+                    report['classes_skipped'] += 1
+                    continue
+                final_bucket_allocations[tc] = _reoptimize_class(
+                    tc, all_quota_forecasts[tc],
+                    {q_code: shares[day] for q_code, shares in remaining_share[tc].items()},
+                    plan.class_sold(tc), arrivals_seen[tc]
+                )
+                plan.set_limits(tc, final_bucket_allocations[tc])
+                class_changed[tc] = False
+                report['classes_resolved'] += 1
+            report['solve_time'] += time.perf_counter() - start
+            if not quiet_mode:
+                event_log.info('reoptimization', "  Re-optimized allocations: {}", final_bucket_allocations)
         
         for tc in config.TRAVEL_CLASSES:
-            class_bucket_allocs = final_bucket_allocations[tc]
-            
-            for q_code, q_config in config.QUOTA_CONFIG.items():
+            day_rates = daily_rates[tc][day]
+            for q, q_code in enumerate(q_codes):
                 
-                if day > q_config['booking_window_open']:
-                    continue 
-
-                daily_arrivals = 0
-                total_demand = all_quota_forecasts[tc][q_code]['total_demand']
-                
-                # --- (UPDATED) QUOTA-SPECIFIC BOOKING CURVE LOGIC ---
-                
-                if q_code == 'GN':
-                    # Use the main booking curve
-                    percent_sold_today = GENERAL_PICKUP_CURVE.get(day, 1.0)
-                    percent_sold_tmrw = GENERAL_PICKUP_CURVE.get(day - 1, 1.0)
-                    percent_to_book_this_day = percent_sold_tmrw - percent_sold_today
-                    avg_arrivals = total_demand * percent_to_book_this_day
-                    daily_arrivals = np.random.poisson(avg_arrivals)
-
-                elif q_code == 'LD':
-                    # Use the Ladies quota booking curve
-                    percent_sold_today = LADIES_PICKUP_CURVE.get(day, 1.0)
-                    percent_sold_tmrw = LADIES_PICKUP_CURVE.get(day - 1, 1.0)
-                    percent_to_book_this_day = percent_sold_tmrw - percent_sold_today
-                    avg_arrivals = total_demand * percent_to_book_this_day
-                    daily_arrivals = np.random.poisson(avg_arrivals)
-                
-                elif q_code == 'TK':
-                    # Tatkal demand arrives all at once
-                    if day == q_config['booking_window_open']:
-                        avg_arrivals = total_demand
-                        daily_arrivals = np.random.poisson(avg_arrivals)
-                
-                # --- END OF UPDATED LOGIC ---
+                # --- (UPDATED) QUOTA-SPECIFIC BOOKING CURVE (from the registry) ---
+                # Zero before the quota opens (and on days its curve skips)
+                avg_arrivals = day_rates[q]
+                if avg_arrivals <= 0:
+                    continue
+                daily_arrivals = rng.poisson(avg_arrivals)
                 
                 if daily_arrivals == 0: continue
+                total_arrivals += daily_arrivals
                 
-                if not quiet_mode:
-                    print(f"  Simulating {daily_arrivals} arrivals for Class {tc}, Quota {q_code}...")
-                _get_or_initialize_key(bookings_rejected[tc], q_code, 0)
+                if checkpoints:
+                    arrivals_seen[tc][q_code] = arrivals_seen[tc].get(q_code, 0) + daily_arrivals
+                    class_changed[tc] = True
                 
-                price_config = q_config['price_config'][tc]
+                if not quiet_mode:
+                    event_log.info('simulation', "  Simulating {} arrivals for Class {}, Quota {}...",
+                                   daily_arrivals, tc, q_code, tc=tc, quota=q_code)
+                k = plan.pair(tc, q_code)
                 
                 # --- Handle arrivals for this specific quota ---
+                if control is None:
+                    # Static limits (FLEXI and FLAT alike): each request
+                    # takes the cheapest bucket still under its limit
+                    plan.fill(k, int(daily_arrivals))
+                    continue
+                
                 for _ in range(daily_arrivals):
-                    sold_ticket = False
-                    
-                    if q_config['type'] == 'FLEXI':
-                        for i, bucket_info in enumerate(price_config):
-                            alloc_key = f"{q_code}_Bucket_{i}_Allocation"
-                            bucket_limit = class_bucket_allocs.get(alloc_key, 0)
-                            
-                            sold_key = f"{q_code}_Bucket_{i}"
-                            total_bucket_seats_sold = _get_or_initialize_key(seats_sold[tc], sold_key, 0)
-
-                            if total_bucket_seats_sold < bucket_limit:
-                                seats_sold[tc][sold_key] += 1
-                                total_revenue += bucket_info['price']
-                                _get_or_initialize_key(bookings_accepted[tc], sold_key, 0)
-                                bookings_accepted[tc][sold_key] += 1
-                                sold_ticket = True
-                                break 
-                    
-                    elif q_config['type'] == 'FLAT':
-                        alloc_key = f"{q_code}_Bucket_0_Allocation"
-                        bucket_limit = class_bucket_allocs.get(alloc_key, 0)
-                        
-                        sold_key = f"{q_code}_Bucket_0"
-                        total_bucket_seats_sold = _get_or_initialize_key(seats_sold[tc], sold_key, 0)
+                    bucket = control.select_bucket(tc, q_code, day)
+                    if bucket is None:
+                        plan.record_rejection(k)
+                    else:
+                        plan.record_sale(k, bucket)
+                        control.record_sale(tc, q_code, bucket)
 
-                        if total_bucket_seats_sold < bucket_limit:
-                            seats_sold[tc][sold_key] += 1
-                            total_revenue += price_config
-                            _get_or_initialize_key(bookings_accepted[tc], sold_key, 0)
-                            bookings_accepted[tc][sold_key] += 1
-                            sold_ticket = True
-                    
-                    if not sold_ticket:
-                        bookings_rejected[tc][q_code] += 1
+    instrumentation.end(online_span)
+    total_revenue = plan.revenue()
+    if instrumentation.enabled():
+        instrumentation.count('simulations')
+        instrumentation.count('arrivals', total_arrivals)
+        instrumentation.count('rejections', sum(plan.rejected))
 
     if not quiet_mode:
-        print("\n================ SIMULATION COMPLETE ================")
-        print(f"\nTotal Revenue (All Classes): ₹{total_revenue:,}")
+        seats_sold, bookings_accepted, bookings_rejected = plan.to_dicts()
+        event_log.info('simulation', "\n================ SIMULATION COMPLETE ================")
+        event_log.info('simulation', "\nTotal Revenue (All Classes): ₹{:,}", total_revenue)
+        if checkpoints:
+            event_log.info('reoptimization',
+                           "Re-optimization: {} class re-solves over {} checkpoints ({} skipped), {:.1f} ms added",
+                           report['classes_resolved'], report['checkpoints'], report['classes_skipped'],
+                           report['solve_time'] * 1000)
         
-        print("\n--- FINAL CLASS BREAKDOWN ---")
+        event_log.info('simulation', "\n--- FINAL CLASS BREAKDOWN ---")
         for tc in config.TRAVEL_CLASSES:
             total_sold = sum(seats_sold[tc].values())
-            print(f"\nClass: {tc}")
-            print(f"  Seats Sold: {total_sold} / {config.CAPACITY[tc]}")
-            print(f"  Master Allocation was: {master_allocations[tc]}")
+            event_log.info('simulation', "\nClass: {}", tc, tc=tc)
+            event_log.info('simulation', "  Seats Sold: {} / {}", total_sold, config.CAPACITY[tc], tc=tc)
+            event_log.info('simulation', "  Master Allocation was: {}",
+                           master_allocations.get(tc, 'n/a (bid prices)'), tc=tc)
 
-            print("\n  Customer Segment Analysis (by Quota-Bucket):")
+            event_log.info('simulation', "\n  Customer Segment Analysis (by Quota-Bucket):", tc=tc)
             for sold_key, num_accepted in sorted(bookings_accepted[tc].items()):
                 if num_accepted > 0:
-                    print(f"  {sold_key}: {num_accepted} accepted")
+                    event_log.info('simulation', "  {}: {} accepted", sold_key, num_accepted, tc=tc)
             
-            print("\n  Total Rejected (by Quota):")
+            event_log.info('simulation', "\n  Total Rejected (by Quota):", tc=tc)
             for q_code, num_rejected in sorted(bookings_rejected[tc].items()):
                 if num_rejected > 0:
-                    print(f"  {q_code}: {num_rejected} rejected")
+                    event_log.info('simulation', "  {}: {} rejected", q_code, num_rejected, tc=tc, quota=q_code)
     
     # --- Return the final revenue for Monte Carlo analysis ---
     return total_revenue
\ No newline at end of file
@@ -0,0 +1,171 @@
+# FILE 13: streaming_stats.py (Constant-Memory Monte Carlo Statistics)
+# A mergeable aggregator for simulation revenues. Memory is fixed by the
+# number of bins, not by the number of runs, and partial aggregators from
+# separate batches or worker processes merge exactly.
+
+import numpy as np
+from statistics import NormalDist
+
+
+class RevenueAggregator:
+    """
+    Tracks count, mean and variance (Welford / Chan), min and max, plus a
+    fine fixed-bin histogram over [lo, hi] that serves as the quantile
+    sketch (P5 / P50 / P95 / CVaR) and is re-binned for plotting.
+
+    Values outside [lo, hi] are kept in an underflow / overflow bin, so
+    nothing is lost; only their quantile resolution is coarser.
+    """
+
+    def __init__(self, lo: float, hi: float, n_bins: int = 2048):
+        if hi <= lo:
+            raise ValueError(f"Invalid histogram range [{lo}, {hi}]")
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.n_bins = int(n_bins)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared deviations from the mean
+        self.min = float('inf')
+        self.max = float('-inf')
+        # Index 0 = underflow, 1..n_bins = histogram, n_bins + 1 = overflow
+        self.bin_counts = np.zeros(self.n_bins + 2, dtype=np.int64)
+        self.bin_sums = np.zeros(self.n_bins + 2)
+
+    @property
+    def edges(self) -> np.ndarray:
+        return np.linspace(self.lo, self.hi, self.n_bins + 1)
+
+    # --- Updates ---
+    def update(self, values) -> "RevenueAggregator":
+        """Adds one value or an array of values."""
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if values.size == 0:
+            return self
+
+        batch = RevenueAggregator(self.lo, self.hi, self.n_bins)
+        batch.count = values.size
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+
+        width = (self.hi - self.lo) / self.n_bins
+        idx = np.floor((values - self.lo) / width).astype(np.int64) + 1
+        idx = np.clip(idx, 0, self.n_bins + 1)
+        idx[values == self.hi] = self.n_bins # Right edge belongs to the last bin
+        batch.bin_counts = np.bincount(idx, minlength=self.n_bins + 2)
+        batch.bin_sums = np.bincount(idx, weights=values, minlength=self.n_bins + 2)
+
+        return self.merge(batch)
+
+    def merge(self, other: "RevenueAggregator") -> "RevenueAggregator":
+        """Merges another aggregator (same bins) into this one, in place."""
+        if (other.lo, other.hi, other.n_bins) != (self.lo, self.hi, self.n_bins):
+            raise ValueError("Cannot merge aggregators with different histogram bins")
+        if other.count == 0:
+            return self
+
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.bin_counts = self.bin_counts + other.bin_counts
+        self.bin_sums = self.bin_sums + other.bin_sums
+        return self
+
+    # --- Statistics ---
+    @property
+    def variance(self) -> float:
+        """Population variance (same as np.var / np.std with ddof=0)."""
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return self.variance ** 0.5
+
+    def confidence_interval(self, confidence: float = 0.95) -> tuple:
+        """
+        Normal-approximation CI of the mean.
+
+        Returns:
+            (mean, half_width); half_width is inf until there are 2 values.
+        """
+        if self.count < 2:
+            return (self.mean, float('inf'))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+        sample_std = (self.m2 / (self.count - 1)) ** 0.5
+        return (self.mean, z * sample_std / self.count ** 0.5)
+
+    def _bin_bounds(self, i: int) -> tuple:
+        """(Internal) Value range of bin i, using min/max for under/overflow."""
+        width = (self.hi - self.lo) / self.n_bins
+        lo = self.min if i == 0 else self.lo + (i - 1) * width
+        hi = self.max if i == self.n_bins + 1 else self.lo + i * width
+        return (max(lo, self.min), min(hi, self.max))
+
+    def quantile(self, q: float) -> float:
+        """Estimated q-quantile (0..1), interpolated inside its bin."""
+        if self.count == 0:
+            return float('nan')
+        target = q * self.count
+        cumulative = np.cumsum(self.bin_counts)
+        i = int(np.searchsorted(cumulative, target, side='left'))
+        i = min(i, self.n_bins + 1)
+        before = cumulative[i] - self.bin_counts[i]
+        lo, hi = self._bin_bounds(i)
+        share = (target - before) / self.bin_counts[i] if self.bin_counts[i] else 0.0
+        return float(lo + share * (hi - lo))
+
+    def cvar(self, alpha: float = 0.05) -> float:
+        """Mean of the worst alpha share of outcomes (lower tail)."""
+        if self.count == 0:
+            return float('nan')
+        tail = max(alpha * self.count, 1.0)
+        cumulative = np.cumsum(self.bin_counts)
+        i = int(np.searchsorted(cumulative, tail, side='left'))
+        i = min(i, self.n_bins + 1)
+        full_count = cumulative[i] - self.bin_counts[i]
+        full_sum = self.bin_sums[:i].sum()
+        # Partial bin: assume its values sit at the bin's own mean
+        bin_mean = self.bin_sums[i] / self.bin_counts[i] if self.bin_counts[i] else 0.0
+        return float((full_sum + (tail - full_count) * bin_mean) / tail)
+
+    def histogram(self, n_bins: int = 30) -> dict:
+        """
+        Re-bins the fine histogram over the occupied range for plotting.
+
+        Returns:
+            {'edges': (k + 1,), 'counts': (k,)}
+        """
+        fine = self.bin_counts[1:-1]
+        occupied = np.nonzero(fine)[0]
+        if occupied.size == 0:
+            return {'edges': np.array([self.lo, self.hi]), 'counts': np.array([self.count])}
+
+        first, last = occupied[0], occupied[-1] + 1
+        group = max(1, int(np.ceil((last - first) / n_bins)))
+        last = min(first + group * int(np.ceil((last - first) / group)), self.n_bins)
+        counts = np.add.reduceat(fine[first:last], np.arange(0, last - first, group))
+        counts[0] += self.bin_counts[0]     # Fold under/overflow into the end bins
+        counts[-1] += self.bin_counts[-1]
+        edges = self.edges[first:last + 1:group]
+        if edges[-1] != self.edges[last]:
+            edges = np.append(edges, self.edges[last])
+        return {'edges': edges, 'counts': counts}
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min,
+            'max': self.max,
+            'p5': self.quantile(0.05),
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'cvar_5': self.cvar(0.05)
+        }